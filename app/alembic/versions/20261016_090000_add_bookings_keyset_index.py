@@ -0,0 +1,40 @@
+"""Add composite index for keyset pagination of bookings
+
+Revision ID: 20261016_090000
+Revises: 20251215_100300
+Create Date: 2026-10-16 09:00:00
+
+Notes:
+- Adds ix_bookings_guest_start_id (guest_id, start_date, id) so /bookings/me cursor pages are
+  index range seeks instead of sorted scans.
+- Landlord listings seek through ix_bookings_property_start, which already leads with property_id.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_090000"
+down_revision: Union[str, None] = "20251215_100300"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # Guarded index create
+    existing_indexes = {ix["name"] for ix in inspector.get_indexes("bookings")}
+    if "ix_bookings_guest_start_id" not in existing_indexes:
+        op.create_index("ix_bookings_guest_start_id", "bookings", ["guest_id", "start_date", "id"])
+
+
+def downgrade() -> None:
+    try:
+        op.drop_index("ix_bookings_guest_start_id", table_name="bookings")
+    except Exception:
+        # Index might not exist on some backends; ignore
+        pass
@@ -0,0 +1,76 @@
+"""Add booking_nights reservation table
+
+Revision ID: 20261016_120000
+Revises: 20261016_090000
+Create Date: 2026-10-16 12:00:00
+
+Notes:
+- One row per night of each confirmed booking, keyed by (property_id, night), so the database
+  rejects double confirmation of a night without application locks.
+- Backfills rows for existing confirmed bookings. If legacy data already double-books a night,
+  the earliest booking (by id) keeps it and the conflict is left for manual review.
+"""
+from datetime import date, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_120000"
+down_revision: Union[str, None] = "20261016_090000"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if "booking_nights" not in inspector.get_table_names():
+        op.create_table(
+            "booking_nights",
+            sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id"), nullable=False),
+            sa.Column("night", sa.Date(), nullable=False),
+            sa.Column("booking_id", sa.Integer(), sa.ForeignKey("bookings.id"), nullable=False),
+            sa.PrimaryKeyConstraint("property_id", "night", name="pk_booking_nights"),
+        )
+        op.create_index("ix_booking_nights_booking_id", "booking_nights", ["booking_id"])
+
+    # Backfill from confirmed bookings
+    rows = bind.execute(
+        sa.text(
+            "SELECT id, property_id, start_date, end_date FROM bookings "
+            "WHERE status = 'confirmed' ORDER BY id"
+        )
+    ).fetchall()
+    taken = set()
+    nights = []
+    for booking_id, property_id, start_date, end_date in rows:
+        if isinstance(start_date, str):
+            # SQLite returns dates as ISO strings through text()
+            start_date, end_date = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        night = start_date
+        while night < end_date:
+            if (property_id, night) not in taken:
+                taken.add((property_id, night))
+                nights.append({"property_id": property_id, "night": night, "booking_id": booking_id})
+            night += timedelta(days=1)
+    if nights:
+        table = sa.table(
+            "booking_nights",
+            sa.column("property_id", sa.Integer()),
+            sa.column("night", sa.Date()),
+            sa.column("booking_id", sa.Integer()),
+        )
+        op.bulk_insert(table, nights)
+
+
+def downgrade() -> None:
+    try:
+        op.drop_index("ix_booking_nights_booking_id", table_name="booking_nights")
+    except Exception:
+        # Index might not exist on some backends; ignore
+        pass
+    op.drop_table("booking_nights")
@@ -0,0 +1,52 @@
+"""Add booking_outbox table for transactional booking events
+
+Revision ID: 20261016_150000
+Revises: 20261016_120000
+Create Date: 2026-10-16 15:00:00
+
+Notes:
+- One row per booking status/version change, written in the same transaction as the change.
+- (published_at, id) serves the relay's "unpublished in id order" scan and the retention purge.
+- No backfill: consumers bootstrap from the bookings table and follow the stream from then on.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_150000"
+down_revision: Union[str, None] = "20261016_120000"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if "booking_outbox" not in inspector.get_table_names():
+        op.create_table(
+            "booking_outbox",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("booking_id", sa.Integer(), sa.ForeignKey("bookings.id"), nullable=False),
+            sa.Column("property_id", sa.Integer(), nullable=False),
+            sa.Column("guest_id", sa.Integer(), nullable=False),
+            sa.Column("status", sa.String(length=20), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("start_date", sa.Date(), nullable=False),
+            sa.Column("end_date", sa.Date(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("published_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_booking_outbox_published_id", "booking_outbox", ["published_at", "id"])
+
+
+def downgrade() -> None:
+    try:
+        op.drop_index("ix_booking_outbox_published_id", table_name="booking_outbox")
+    except Exception:
+        # Index might not exist on some backends; ignore
+        pass
+    op.drop_table("booking_outbox")
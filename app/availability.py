@@ -0,0 +1,452 @@
+# Per-property in-memory availability index used for booking overlap checks and calendars.
+# Keeps sorted night intervals of blocking bookings so hot listings avoid repeated SQL range scans,
+# plus a compact bitset of booked nights that serves the public availability calendar.
+# Overlap checks use it when AVAILABILITY_INDEX_ENABLED is set; cold or stale properties are (re)loaded from the DB.
+# The index is per worker and may trail other workers' writes by up to its TTL, so it is advisory: a "free"
+# answer can be stale, and the check that commits a confirmation queries the DB (has_overlap(authoritative=True)).
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Namespaced logger for index warm-ups and consistency reports
+logger = logging.getLogger("staycircle.availability")
+
+# Statuses tracked by the index: confirmed bookings block new requests; pending_payment holds are kept
+# alongside so callers can optionally treat them as blocking too.
+CONFIRMED_STATUS = "confirmed"
+HELD_STATUSES = ("pending_payment",)
+TRACKED_STATUSES = (CONFIRMED_STATUS,) + HELD_STATUSES
+
+
+def _truthy(val: Optional[str]) -> bool:
+    if val is None:
+        return False
+    return val.strip().lower() in {"1", "true", "t", "yes", "y", "on"}
+
+
+def _to_int(val: Optional[str], default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
+
+
+# Feature flag: answer overlap checks from the index by setting AVAILABILITY_INDEX_ENABLED to a truthy value
+def index_enabled() -> bool:
+    return _truthy(os.getenv("AVAILABILITY_INDEX_ENABLED", "false"))
+
+
+class IntervalSet:
+    """
+    Sorted set of half-open night intervals [start, end) keyed by booking id.
+
+    Intervals are stored by (start, booking_id) with a running maximum of end values, so
+    "does anything overlap [start, end)?" is a single bisect plus one comparison (O(log n)),
+    even when intervals overlap each other (e.g., concurrent pending holds).
+    Inserts and removals are O(n), which is fine: they happen once per status transition.
+    """
+    __slots__ = ("_keys", "_ends", "_max_ends", "_by_id")
+
+    def __init__(self) -> None:
+        self._keys: List[Tuple[int, int]] = []  # (start ordinal, booking id), sorted
+        self._ends: List[int] = []  # end ordinal, parallel to _keys
+        self._max_ends: List[int] = []  # prefix maximum of _ends
+        self._by_id: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, booking_id: int) -> bool:
+        return booking_id in self._by_id
+
+    def items(self) -> Dict[int, Tuple[date, date]]:
+        return {bid: (date.fromordinal(s), date.fromordinal(e)) for bid, (s, e) in self._by_id.items()}
+
+    def _rebuild_from(self, pos: int) -> None:
+        running = self._max_ends[pos - 1] if pos > 0 else 0
+        del self._max_ends[pos:]
+        for end in self._ends[pos:]:
+            running = max(running, end)
+            self._max_ends.append(running)
+
+    def add(self, booking_id: int, start_date: date, end_date: date) -> None:
+        self.discard(booking_id)
+        start, end = start_date.toordinal(), end_date.toordinal()
+        pos = bisect.bisect_left(self._keys, (start, booking_id))
+        self._keys.insert(pos, (start, booking_id))
+        self._ends.insert(pos, end)
+        self._by_id[booking_id] = (start, end)
+        self._rebuild_from(pos)
+
+    def discard(self, booking_id: int) -> bool:
+        found = self._by_id.pop(booking_id, None)
+        if found is None:
+            return False
+        pos = bisect.bisect_left(self._keys, (found[0], booking_id))
+        del self._keys[pos]
+        del self._ends[pos]
+        self._rebuild_from(pos)
+        return True
+
+    def spans(self) -> Iterable[Tuple[int, int]]:
+        """Yield (start ordinal, end ordinal) pairs in no particular order."""
+        return self._by_id.values()
+
+    def overlaps(self, start_date: date, end_date: date) -> bool:
+        # Candidates start strictly before end_date; any of them overlapping must end after start_date
+        pos = bisect.bisect_left(self._keys, (end_date.toordinal(), -1))
+        return pos > 0 and self._max_ends[pos - 1] > start_date.toordinal()
+
+
+class _PropertyEntry:
+    """
+    Index state for one property.
+
+    - confirmed / held: interval sets used for overlap checks
+    - nights: bitset of nights covered by any tracked booking; bit i is the night origin + i
+      (ordinal days), so a calendar range is a shift and a mask
+    """
+    __slots__ = ("confirmed", "held", "nights", "origin", "loaded_at")
+
+    def __init__(self) -> None:
+        self.confirmed = IntervalSet()
+        self.held = IntervalSet()
+        self.nights = 0
+        self.origin: Optional[int] = None
+        self.loaded_at = time.monotonic()
+
+    def _mark(self, start: int, end: int) -> None:
+        if self.origin is None:
+            self.origin = start
+        elif start < self.origin:
+            # Re-base so every bit index stays non-negative
+            self.nights <<= self.origin - start
+            self.origin = start
+        self.nights |= ((1 << (end - start)) - 1) << (start - self.origin)
+
+    def _rebuild_nights(self) -> None:
+        # Overlapping holds may share nights, so removals recompute from the remaining intervals
+        self.nights = 0
+        self.origin = None
+        for intervals in (self.confirmed, self.held):
+            for start, end in intervals.spans():
+                self._mark(start, end)
+
+    def apply(self, booking_id: int, start_date: date, end_date: date, status: str) -> None:
+        removed = self.confirmed.discard(booking_id) | self.held.discard(booking_id)
+        tracked = True
+        if status == CONFIRMED_STATUS:
+            self.confirmed.add(booking_id, start_date, end_date)
+        elif status in HELD_STATUSES:
+            self.held.add(booking_id, start_date, end_date)
+        else:
+            tracked = False
+        if removed:
+            self._rebuild_nights()
+        elif tracked:
+            self._mark(start_date.toordinal(), end_date.toordinal())
+
+    def booked_nights(self, start_date: date, end_date: date) -> List[date]:
+        """Return booked nights within [start_date, end_date) in ascending order."""
+        if self.origin is None:
+            return []
+        start, end = start_date.toordinal(), end_date.toordinal()
+        shift = start - self.origin
+        bits = self.nights >> shift if shift >= 0 else self.nights << -shift
+        bits &= (1 << (end - start)) - 1
+        out: List[date] = []
+        while bits:
+            low = bits & -bits
+            out.append(date.fromordinal(start + low.bit_length() - 1))
+            bits ^= low
+        return out
+
+    def snapshot(self) -> Dict[int, Tuple[date, date, str]]:
+        out = {bid: (s, e, CONFIRMED_STATUS) for bid, (s, e) in self.confirmed.items().items()}
+        out.update({bid: (s, e, HELD_STATUSES[0]) for bid, (s, e) in self.held.items().items()})
+        return out
+
+
+class AvailabilityIndex:
+    """
+    Process-local, LRU-bounded map of property_id -> interval sets.
+
+    Freshness:
+    - Entries older than ttl_seconds are treated as cold and reloaded, bounding staleness from
+      writes made by other worker processes.
+    - Writes in this process are applied immediately via apply().
+    - A load racing with a concurrent apply() for the same property is discarded (the caller still
+      gets an answer from the rows it read), so a stale snapshot can never be installed.
+
+    Thread-safety:
+    - Sync route handlers run in a threadpool; a threading.Lock guards all mutations.
+    """
+    def __init__(self, max_properties: int = 10000, ttl_seconds: float = 30.0) -> None:
+        self.max_properties = max_properties
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _PropertyEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Write sequence numbers used to detect loads that raced with a write
+        self._seq = 0
+        self._last_write: "OrderedDict[int, int]" = OrderedDict()
+        self._evicted_floor = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _fresh_entry(self, property_id: int) -> Optional[_PropertyEntry]:
+        entry = self._entries.get(property_id)
+        if entry is None:
+            return None
+        if self.ttl_seconds > 0 and time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            del self._entries[property_id]
+            return None
+        self._entries.move_to_end(property_id)
+        return entry
+
+    def property_ids(self) -> List[int]:
+        """Ids of the properties currently loaded, least recently used first."""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def write_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def has_overlap(self, property_id: int, start_date: date, end_date: date, include_held: bool = False) -> Optional[bool]:
+        """Return True/False from the index, or None when the property is cold."""
+        with self._lock:
+            entry = self._fresh_entry(property_id)
+            if entry is None:
+                return None
+            if entry.confirmed.overlaps(start_date, end_date):
+                return True
+            return include_held and entry.held.overlaps(start_date, end_date)
+
+    def booked_nights(self, property_id: int, start_date: date, end_date: date) -> Optional[List[date]]:
+        """Return booked nights in [start_date, end_date) from the bitset, or None when the property is cold."""
+        with self._lock:
+            entry = self._fresh_entry(property_id)
+            if entry is None:
+                return None
+            return entry.booked_nights(start_date, end_date)
+
+    def snapshot(self, property_id: int) -> Optional[Dict[int, Tuple[date, date, str]]]:
+        with self._lock:
+            entry = self._fresh_entry(property_id)
+            return entry.snapshot() if entry is not None else None
+
+    def load(self, property_id: int, rows: Iterable[Tuple[int, date, date, str]], since_seq: int) -> bool:
+        """
+        Install a snapshot read from the DB.
+
+        since_seq is write_seq() captured before the rows were read; if any write for this property
+        happened after that point the snapshot may be stale, so it is not installed.
+        """
+        entry = _PropertyEntry()
+        for booking_id, start_date, end_date, status in rows:
+            entry.apply(booking_id, start_date, end_date, status)
+        with self._lock:
+            if self._evicted_floor > since_seq or self._last_write.get(property_id, 0) > since_seq:
+                return False
+            self._entries[property_id] = entry
+            self._entries.move_to_end(property_id)
+            while len(self._entries) > self.max_properties:
+                self._entries.popitem(last=False)
+            return True
+
+    def apply(self, booking_id: int, property_id: int, start_date: date, end_date: date, status: str) -> None:
+        """Reflect a committed status transition; cold properties only record the write sequence."""
+        with self._lock:
+            self._seq += 1
+            self._last_write[property_id] = self._seq
+            self._last_write.move_to_end(property_id)
+            while len(self._last_write) > self.max_properties:
+                _, evicted_seq = self._last_write.popitem(last=False)
+                self._evicted_floor = max(self._evicted_floor, evicted_seq)
+            entry = self._entries.get(property_id)
+            if entry is not None:
+                entry.apply(booking_id, start_date, end_date, status)
+
+    def invalidate(self, property_id: Optional[int] = None) -> None:
+        with self._lock:
+            if property_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(property_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._last_write.clear()
+            self._seq = 0
+            self._evicted_floor = 0
+
+
+# Process-wide index; sized and aged via AVAILABILITY_INDEX_MAX_PROPERTIES / AVAILABILITY_INDEX_TTL_SECONDS
+index = AvailabilityIndex(
+    max_properties=_to_int(os.getenv("AVAILABILITY_INDEX_MAX_PROPERTIES"), 10000),
+    ttl_seconds=float(_to_int(os.getenv("AVAILABILITY_INDEX_TTL_SECONDS"), 30)),
+)
+
+
+def _db_has_overlap(db: Session, property_id: int, start_date: date, end_date: date, statuses: Tuple[str, ...]) -> bool:
+    """
+    Return True if any booking in `statuses` overlaps [start_date, end_date).
+
+    Logic:
+    NOT (existing.end_date <= start_date OR existing.start_date >= end_date)
+    """
+    exists = (
+        db.query(models.Booking.id)
+        .filter(
+            models.Booking.property_id == property_id,
+            models.Booking.status.in_(statuses),
+            ~(
+                (models.Booking.end_date <= start_date)
+                | (models.Booking.start_date >= end_date)
+            ),
+        )
+        .first()
+    )
+    return exists is not None
+
+
+def _load_rows(db: Session, property_id: int) -> List[Tuple[int, date, date, str]]:
+    rows = (
+        db.query(models.Booking.id, models.Booking.start_date, models.Booking.end_date, models.Booking.status)
+        .filter(
+            models.Booking.property_id == property_id,
+            models.Booking.status.in_(TRACKED_STATUSES),
+        )
+        .all()
+    )
+    return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+
+def warm(db: Session, property_id: int) -> Optional[_PropertyEntry]:
+    """Load a property's tracked bookings into the index; returns the entry built from the rows read."""
+    since = index.write_seq()
+    rows = _load_rows(db, property_id)
+    if not index.load(property_id, rows, since_seq=since):
+        logger.debug("availability.warm.raced", extra={"property_id": property_id})
+    entry = _PropertyEntry()
+    for row in rows:
+        entry.apply(*row)
+    return entry
+
+
+def has_overlap(
+    db: Session,
+    property_id: int,
+    start_date: date,
+    end_date: date,
+    include_held: bool = False,
+    authoritative: bool = False,
+) -> bool:
+    """
+    Return True if a confirmed (or, with include_held, pending_payment) booking overlaps [start_date, end_date).
+
+    With the index disabled (or authoritative=True) this is a single SQL existence query; with it enabled,
+    warm properties are answered in memory and cold ones are loaded once from the DB.
+
+    Freshness with the index:
+    - A conflict found in memory is re-checked in SQL, so a cancellation made by another worker never
+      causes a false conflict; the stale entry is dropped. Conflicts are the rare path, so this costs little.
+    - "No conflict" is answered from memory and can trail other workers by up to the index TTL. Callers
+      that commit a confirmation must pass authoritative=True.
+    """
+    statuses = TRACKED_STATUSES if include_held else (CONFIRMED_STATUS,)
+    if authoritative or not index_enabled():
+        return _db_has_overlap(db, property_id, start_date, end_date, statuses)
+
+    hit = index.has_overlap(property_id, start_date, end_date, include_held=include_held)
+    if hit is True:
+        if _db_has_overlap(db, property_id, start_date, end_date, statuses):
+            return True
+        index.invalidate(property_id)
+        return False
+    if hit is not None:
+        return hit
+    entry = warm(db, property_id)
+    if entry.confirmed.overlaps(start_date, end_date):
+        return True
+    return include_held and entry.held.overlaps(start_date, end_date)
+
+
+def booked_nights(db: Session, property_id: int, start_date: date, end_date: date) -> List[date]:
+    """
+    Return nights in [start_date, end_date) taken by confirmed or pending_payment bookings.
+
+    Always served from the index (calendars tolerate the index TTL); cold properties are warmed first.
+    """
+    nights = index.booked_nights(property_id, start_date, end_date)
+    if nights is not None:
+        return nights
+    return warm(db, property_id).booked_nights(start_date, end_date)
+
+
+def record_status(booking_id: int, property_id: int, start_date: date, end_date: date, status: str) -> None:
+    """Apply a committed booking status transition to the index (call after commit)."""
+    index.apply(booking_id, property_id, start_date, end_date, status)
+
+
+def record_booking(obj: models.Booking) -> None:
+    """Convenience wrapper around record_status() for an ORM booking object."""
+    record_status(obj.id, obj.property_id, obj.start_date, obj.end_date, obj.status)
+
+
+def check_consistency(db: Session, property_ids: Optional[Iterable[int]] = None, repair: bool = False) -> dict:
+    """
+    Compare warm index entries against the bookings table.
+
+    Parameters:
+    - property_ids: restrict the check; defaults to every property currently warm in the index
+    - repair: drop mismatched entries so the next lookup reloads them from the DB
+
+    Returns a report:
+    {"checked": n, "mismatches": [{"property_id", "missing", "unexpected", "changed"}]}
+    - missing: booking ids in the DB but not in the index
+    - unexpected: booking ids in the index but not in the DB (or no longer in a tracked status)
+    - changed: booking ids whose dates or status differ
+    """
+    if property_ids is None:
+        property_ids = index.property_ids()
+
+    checked = 0
+    mismatches: List[dict] = []
+    for pid in property_ids:
+        indexed = index.snapshot(pid)
+        if indexed is None:
+            continue
+        checked += 1
+        actual = {bid: (s, e, st) for bid, s, e, st in _load_rows(db, pid)}
+        missing = sorted(set(actual) - set(indexed))
+        unexpected = sorted(set(indexed) - set(actual))
+        changed = sorted(bid for bid in set(actual) & set(indexed) if actual[bid] != indexed[bid])
+        if missing or unexpected or changed:
+            mismatches.append(
+                {"property_id": pid, "missing": missing, "unexpected": unexpected, "changed": changed}
+            )
+            if repair:
+                index.invalidate(pid)
+
+    if mismatches:
+        logger.warning("availability.consistency.mismatch", extra={"checked": checked, "mismatches": len(mismatches)})
+    return {"checked": checked, "mismatches": mismatches}
+
+
+def reset() -> None:
+    """Drop all index state (used by tests and after bulk data changes)."""
+    index.clear()
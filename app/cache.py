@@ -0,0 +1,191 @@
+# In-process caching primitives shared by read-heavy endpoints.
+# TTLCache is a thread-safe LRU with per-entry expiry; callers store immutable values (bytes, tuples, records).
+# SharedTier is the optional Redis tier behind a local TTLCache; CommitInvalidator ties invalidation to committed
+# ORM writes. Two-tier caches (user_cache, property_cache) are built from these pieces.
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Any, Awaitable, Callable, Hashable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .redis_client import get_async_redis, get_redis, report_async_redis_error, report_redis_error
+
+# Sentinel for "no cached value" so None can be cached when useful
+MISSING = object()
+
+
+def env_int(name: str, default: int) -> int:
+    """Integer cache setting from the environment; unset or malformed values use `default`."""
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with a per-entry time-to-live.
+
+    Invalidation races:
+    - pop() and clear() bump `generation`. Readers capture it before loading from the source of truth
+      and pass it to set(); a value loaded before an invalidation is then dropped instead of cached.
+
+    Thread-safety:
+    - Sync route handlers run in a threadpool; a threading.Lock guards all operations.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 30.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None, generation: Optional[int] = None) -> bool:
+        """Store a value; returns False (and stores nothing) if `generation` is stale or the TTL is not positive."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "generation": self.generation}
+
+
+class SharedTier:
+    """
+    Optional Redis tier shared by every worker, behind a per-worker TTLCache.
+
+    Clients are handed out only while Redis is enabled and `ttl_seconds` is positive (0 turns the
+    tier off). Command errors go through failed()/async_failed(): they are logged as
+    `<name>.redis_<op>_failed` and reported to the client's circuit breaker, and callers fall back to
+    the database (fail-open).
+    """
+    def __init__(self, name: str, ttl_seconds: int) -> None:
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.logger = logging.getLogger(f"staycircle.{name}")
+
+    def client(self):
+        return get_redis() if self.ttl_seconds > 0 else None
+
+    async def async_client(self):
+        return await get_async_redis() if self.ttl_seconds > 0 else None
+
+    def failed(self, op: str, exc: Exception, **extra: Any) -> None:
+        self.logger.warning(f"{self.name}.redis_{op}_failed", extra={**extra, "error": str(exc)})
+        report_redis_error(exc)
+
+    def async_failed(self, op: str, exc: Exception, **extra: Any) -> None:
+        """failed() for errors from the asyncio client (reported to its own circuit breaker)."""
+        self.logger.warning(f"{self.name}.redis_{op}_failed", extra={**extra, "error": str(exc)})
+        report_async_redis_error(exc)
+
+
+class CommitInvalidator:
+    """
+    Run a cache invalidation for ORM writes once the writing transaction commits.
+
+    Mapper events fire at flush, while other sessions still read the old row; invalidating there
+    would let a concurrent read cache the pre-commit state again. watch() records the changed rows'
+    keys on the flushing Session (session.info[name]); after_commit hands them to `invalidate`, and
+    a rollback discards them. Objects that are not attached to a session are invalidated immediately.
+
+    `invalidate` may block (e.g. a sync Redis call). When a commit runs on the event loop (AsyncSession)
+    and `async_invalidate` is given, `evict_local` runs inline instead and `async_invalidate` in a task,
+    held in `_pending` until it finishes.
+    """
+    def __init__(
+        self,
+        name: str,
+        invalidate: Callable[[Set[Hashable]], None],
+        evict_local: Optional[Callable[[Set[Hashable]], None]] = None,
+        async_invalidate: Optional[Callable[[Set[Hashable]], Awaitable[None]]] = None,
+    ) -> None:
+        self.name = name
+        self.invalidate = invalidate
+        self.evict_local = evict_local
+        self.async_invalidate = async_invalidate
+        self._pending: Set["asyncio.Task[None]"] = set()
+        event.listen(Session, "after_commit", self._on_commit)
+        event.listen(Session, "after_rollback", self._on_rollback)
+
+    def watch(self, model: type, *events: str, key: Callable[[Any], Optional[Hashable]] = attrgetter("id")) -> None:
+        """Collect key(target) whenever one of the mapper `events` fires for `model`."""
+        def _changed(mapper, connection, target) -> None:
+            value = key(target)
+            if value is None:
+                return
+            session = object_session(target)
+            if session is None:
+                self.invalidate({value})
+            else:
+                session.info.setdefault(self.name, set()).add(value)
+
+        for name in events:
+            event.listen(model, name, _changed)
+
+    def _on_commit(self, session: Session) -> None:
+        keys = session.info.pop(self.name, None)
+        if not keys:
+            return
+        loop = None
+        if self.async_invalidate is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        if loop is None:
+            self.invalidate(keys)
+            return
+        if self.evict_local is not None:
+            self.evict_local(keys)
+        task = loop.create_task(self.async_invalidate(keys))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _on_rollback(self, session: Session) -> None:
+        session.info.pop(self.name, None)
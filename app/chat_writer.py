@@ -0,0 +1,193 @@
+# Group-commit writer for chat messages.
+# WebSocket handlers enqueue messages; a single asyncio task persists batches from many rooms in one
+# transaction and hands the committed rows (with their assigned ids) to a fan-out callback.
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+
+from . import models
+from .db import AsyncSessionLocal
+
+# Namespaced logger for batch flush diagnostics
+logger = logging.getLogger("staycircle.chat.writer")
+
+# Callback invoked with the serialized messages of each committed batch, in commit order
+OnCommit = Callable[[List[dict]], Awaitable[None]]
+
+
+def _to_int(val: Optional[str], default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
+
+
+class _Pending:
+    """One queued message plus the future resolved once its batch commits."""
+    __slots__ = ("property_id", "sender_id", "text", "created_at", "future")
+
+    def __init__(self, property_id: int, sender_id: int, text: str, future: "asyncio.Future[dict]") -> None:
+        self.property_id = property_id
+        self.sender_id = sender_id
+        self.text = text
+        # Stamp at receive time so a batch keeps per-message ordering by created_at
+        self.created_at = datetime.now(timezone.utc)
+        self.future = future
+
+
+def _serialize(msg: models.Message) -> dict:
+    return {
+        "id": msg.id,
+        "property_id": msg.property_id,
+        "sender_id": msg.sender_id,
+        "text": msg.text,
+        "created_at": msg.created_at.isoformat() if msg.created_at else None,
+    }
+
+
+class MessageWriter:
+    """
+    Batches chat inserts off the per-connection receive loops.
+
+    Batching:
+    - The writer waits for the first queued message, then keeps collecting until max_batch messages
+      are queued or max_latency_ms has elapsed, and commits them in one transaction.
+    - After commit, on_commit receives the serialized rows (ids assigned) and each submitter's
+      future resolves with its own row.
+
+    Lifecycle:
+    - start()/stop() are called from application startup/shutdown; stop() drains the queue.
+    - When the writer is not running (e.g., scripts without a lifespan), submit() persists inline.
+    """
+    def __init__(
+        self,
+        on_commit: Optional[OnCommit] = None,
+        max_batch: int = 100,
+        max_latency_ms: int = 5,
+        queue_size: int = 10000,
+    ) -> None:
+        self.on_commit = on_commit
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max(0, max_latency_ms) / 1000.0
+        self.queue_size = queue_size
+        self._queue: Optional["asyncio.Queue[Optional[_Pending]]"] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        # Bind the queue to the current loop; TestClient and reloaders may start a fresh loop per lifespan
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run(), name="chat-message-writer")
+
+    async def stop(self) -> None:
+        if not self.running or self._queue is None:
+            return
+        await self._queue.put(None)  # sentinel: flush what is queued, then exit
+        try:
+            await self._task  # type: ignore[misc]
+        finally:
+            self._task = None
+            self._queue = None
+
+    async def submit(self, property_id: int, sender_id: int, text: str) -> dict:
+        """Queue a message and wait until it is committed; returns the serialized row."""
+        future: "asyncio.Future[dict]" = asyncio.get_running_loop().create_future()
+        item = _Pending(property_id, sender_id, text, future)
+        if not self.running or self._queue is None:
+            await self._flush([item])
+        else:
+            await self._queue.put(item)
+        return await future
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch:
+                # Take whatever is already queued without waiting
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # Drain anything queued behind the sentinel
+        leftovers: List[_Pending] = []
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is not None:
+                leftovers.append(item)
+        if leftovers:
+            await self._flush(leftovers)
+
+    async def _flush(self, batch: List[_Pending]) -> None:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = [
+                    models.Message(
+                        property_id=p.property_id,
+                        sender_id=p.sender_id,
+                        text=p.text,
+                        created_at=p.created_at,
+                    )
+                    for p in batch
+                ]
+                db.add_all(rows)
+                await db.commit()
+        except Exception as exc:
+            logger.warning("chat.writer.flush_failed", extra={"size": len(batch), "error": str(exc)})
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(exc)
+            return
+
+        out = [_serialize(m) for m in rows]
+        logger.debug(
+            "chat.writer.flush",
+            extra={"size": len(batch), "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)},
+        )
+        if self.on_commit is not None:
+            try:
+                await self.on_commit(out)
+            except Exception as exc:
+                # Rows are durable; fan-out is best-effort
+                logger.warning("chat.writer.fanout_failed", extra={"size": len(out), "error": str(exc)})
+        for p, payload in zip(batch, out):
+            if not p.future.done():
+                p.future.set_result(payload)
+
+
+def writer_from_env(on_commit: Optional[OnCommit] = None) -> MessageWriter:
+    """Build a writer configured via CHAT_WRITER_MAX_BATCH and CHAT_WRITER_MAX_LATENCY_MS."""
+    return MessageWriter(
+        on_commit=on_commit,
+        max_batch=_to_int(os.getenv("CHAT_WRITER_MAX_BATCH"), 100),
+        max_latency_ms=_to_int(os.getenv("CHAT_WRITER_MAX_LATENCY_MS"), 5),
+    )
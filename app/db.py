@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import Generator
+from sqlalchemy.pool import NullPool
+from typing import AsyncIterator, Generator
 import os
 
 # DATABASE_URL defaults to a local SQLite file at ./data.db (relative to backend/app's working directory).
@@ -28,6 +30,45 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _async_url(url: str) -> str:
+    """
+    Map a sync DATABASE_URL onto its asyncio driver.
+
+    - sqlite://            -> sqlite+aiosqlite://
+    - mysql:// | mysql+pymysql:// -> mysql+aiomysql://
+    - postgresql://        -> postgresql+asyncpg://
+    ASYNC_DATABASE_URL overrides the mapping entirely.
+    """
+    override = os.getenv("ASYNC_DATABASE_URL")
+    if override:
+        return override
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    driver = {"sqlite": "aiosqlite", "mysql": "aiomysql", "postgresql": "asyncpg"}.get(dialect)
+    if driver is None:
+        return url
+    return f"{dialect}+{driver}{sep}{rest}"
+
+
+# Async engine used by request handlers that run on the event loop.
+# - SQLite: no pooling; aiosqlite connections are bound to the loop that opened them.
+# - Server DBs: same pooling policy as the sync engine (one pool per worker process).
+ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+if DATABASE_URL.startswith("sqlite"):
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_recycle=280,
+        pool_size=10,
+        max_overflow=20,
+    )
+
+# Async session factory; expire_on_commit=False so committed objects stay readable without implicit IO
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
 def get_db() -> Generator:
     """
     FastAPI dependency.
@@ -40,3 +81,14 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    FastAPI dependency for async handlers.
+
+    Yields an AsyncSession for the lifetime of the request and closes it afterwards,
+    so DB round trips await on the event loop instead of holding a threadpool worker.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
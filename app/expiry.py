@@ -0,0 +1,181 @@
+# Event-driven hold expiry: a delay queue keyed by expires_at instead of periodic full scans.
+# With Redis, holds live in one sorted set shared by all workers and each due entry is claimed by exactly
+# one worker (atomic ZRANGEBYSCORE + ZREM). Without Redis, each worker keeps an in-process heap of the
+# holds it created. The periodic sweeper remains as a safety net (restarts, crashes between claim and update).
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from .redis_client import get_async_redis, report_async_redis_error
+from .redis_ops import AsyncRedisBatch, register_script
+from .sweepers import expire_bookings, pending_expiries
+
+# Namespaced logger for delay-queue diagnostics
+logger = logging.getLogger("staycircle.expiry")
+
+# Pop up to ARGV[2] members due at or before ARGV[1] (epoch ms) in one atomic step, so concurrent
+# workers never claim the same hold.
+# KEYS[1] = delay queue ZSET
+CLAIM_DUE_LUA = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+  redis.call('zrem', KEYS[1], unpack(due))
+end
+return due
+"""
+register_script("expiry_claim_due", CLAIM_DUE_LUA)
+
+
+def _to_float(val: Optional[str], default: float) -> float:
+    try:
+        return float(val) if val is not None else default
+    except Exception:
+        return default
+
+
+def _epoch_ms(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        # Some backends (e.g., SQLite) return naive datetimes; stored values are UTC
+        dt = dt.replace(tzinfo=timezone.utc)
+    # Round up so a deadline never fires before the stored microsecond timestamp has passed
+    return -(-int(dt.timestamp() * 1_000_000) // 1000)
+
+
+class HoldExpiryScheduler:
+    """
+    Fires hold expiry close to each booking's expires_at.
+
+    Scheduling:
+    - schedule() is called after a hold is committed (create_booking, approve_booking); re-scheduling a
+      booking moves its deadline.
+
+    Firing:
+    - The worker loop sleeps until the earliest known deadline, capped at max_idle seconds so deadlines
+      scheduled by other workers are noticed promptly; local schedule() calls wake it immediately.
+    - Due ids are expired with one set-based UPDATE that re-checks status, so paid or cancelled holds are
+      skipped. Ids that fired early (clock skew between workers) are put back with their real deadline.
+
+    Lifecycle:
+    - start()/stop() are called from application startup/shutdown.
+    """
+    def __init__(self, key: str = "expiry:holds", batch_size: int = 100, max_idle: float = 1.0) -> None:
+        self.key = key
+        self.batch_size = max(1, batch_size)
+        self.max_idle = max(0.05, max_idle)
+        # Local fallback queue of (deadline ms, booking id) when Redis is disabled or unreachable
+        self._heap: List[Tuple[int, int]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def schedule(self, booking_id: int, expires_at: Optional[datetime]) -> None:
+        if expires_at is None:
+            return
+        deadline = _epoch_ms(expires_at)
+        r = await get_async_redis()
+        if r is not None:
+            try:
+                await r.zadd(self.key, {str(booking_id): deadline})
+                self._notify()
+                return
+            except Exception as exc:
+                logger.warning("expiry.schedule.redis_failed", extra={"booking_id": booking_id, "error": str(exc)})
+                report_async_redis_error(exc)
+        heapq.heappush(self._heap, (deadline, booking_id))
+        self._notify()
+
+    def _notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _claim_due(self, now_ms: int) -> Tuple[List[int], Optional[int]]:
+        """Return (due ids claimed by this worker, next known deadline in ms or None)."""
+        due: List[int] = []
+        while self._heap and self._heap[0][0] <= now_ms and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap)[1])
+        next_ms = self._heap[0][0] if self._heap else None
+
+        r = await get_async_redis()
+        if r is not None:
+            try:
+                # Claim and peek at the next deadline in one round trip; the peek sees the queue after the claim
+                batch = AsyncRedisBatch(r)
+                i_claimed = batch.script("expiry_claim_due", [self.key], [now_ms, self.batch_size])
+                i_head = batch.command("zrange", self.key, 0, 0, withscores=True)
+                results = await batch.execute()
+                due.extend(int(m) for m in results[i_claimed])
+                head = results[i_head]
+                if head:
+                    head_ms = int(head[0][1])
+                    next_ms = head_ms if next_ms is None else min(next_ms, head_ms)
+            except Exception as exc:
+                logger.warning("expiry.claim.redis_failed", extra={"error": str(exc)})
+                report_async_redis_error(exc)
+        return due, next_ms
+
+    async def run_once(self) -> Tuple[int, Optional[int]]:
+        """Expire everything due now; returns (holds expired, next known deadline in ms)."""
+        now_ms = int(time.time() * 1000)
+        due, next_ms = await self._claim_due(now_ms)
+        if not due:
+            return 0, next_ms
+        # Sync session work stays off the event loop
+        expired = await asyncio.to_thread(expire_bookings, due)
+        leftover = set(due) - {row[0] for row in expired}
+        if leftover:
+            # Still-pending holds whose deadline is in the future (or was extended): requeue them
+            for booking_id, expires_at in await asyncio.to_thread(pending_expiries, list(leftover)):
+                await self.schedule(booking_id, expires_at)
+        if expired:
+            logger.info("expiry.fired", extra={"expired": len(expired), "claimed": len(due)})
+        # More may already be due when a full batch was claimed
+        return len(expired), (now_ms if len(due) >= self.batch_size else next_ms)
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="hold-expiry")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            # Cleared before the pass so a schedule() during it still cuts the next sleep short
+            self._wake.clear()
+            try:
+                _, next_ms = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Keep the loop alive; the safety-net sweeper covers anything missed
+                logger.warning("expiry.run.error", extra={"error": str(exc)})
+                next_ms = None
+            delay = self.max_idle
+            if next_ms is not None:
+                delay = min(delay, max(0.0, (next_ms - time.time() * 1000) / 1000.0))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def reset(self) -> None:
+        self._heap.clear()
+
+
+# Process-wide scheduler; EXPIRY_MAX_IDLE_SECONDS bounds how late a deadline scheduled by another worker fires
+hold_expiry = HoldExpiryScheduler(max_idle=_to_float(os.getenv("EXPIRY_MAX_IDLE_SECONDS"), 1.0))
+
@@ -0,0 +1,75 @@
+# Pre-serialized fan-out frames shared by the WebSocket broadcaster and the Redis relay.
+# A frame is serialized exactly once; routing uses the channel name, never the JSON body.
+from __future__ import annotations
+
+import json
+from typing import Optional, Union
+
+# Redis channel namespace for per-property chat rooms: chat:property:{property_id}
+CHAT_CHANNEL_PREFIX = "chat:property:"
+# Redis channel namespace for per-user booking status feeds: bookings:user:{user_id}
+BOOKING_CHANNEL_PREFIX = "bookings:user:"
+
+
+def chat_channel(property_id: int) -> str:
+    return f"{CHAT_CHANNEL_PREFIX}{property_id}"
+
+
+def room_from_channel(channel: str) -> Optional[int]:
+    """Return the property id encoded in a chat channel name, or None for foreign channels."""
+    if not channel.startswith(CHAT_CHANNEL_PREFIX):
+        return None
+    try:
+        return int(channel[len(CHAT_CHANNEL_PREFIX):])
+    except ValueError:
+        return None
+
+
+def booking_channel(user_id: int) -> str:
+    return f"{BOOKING_CHANNEL_PREFIX}{user_id}"
+
+
+def user_from_channel(channel: str) -> Optional[int]:
+    """Return the user id encoded in a booking feed channel name, or None for foreign channels."""
+    if not channel.startswith(BOOKING_CHANNEL_PREFIX):
+        return None
+    try:
+        return int(channel[len(BOOKING_CHANNEL_PREFIX):])
+    except ValueError:
+        return None
+
+
+class Frame:
+    """
+    One outbound message, serialized once and shared by every recipient.
+
+    - text: the JSON text sent to each local WebSocket (the same str object for all of them)
+    - data: UTF-8 bytes for Redis publish, encoded lazily and cached
+    - room: property id parsed from the channel name
+    """
+    __slots__ = ("channel", "room", "text", "_data")
+
+    def __init__(self, channel: str, text: str, data: Optional[bytes] = None) -> None:
+        self.channel = channel
+        self.room = room_from_channel(channel)
+        self.text = text
+        self._data = data
+
+    @classmethod
+    def from_message(cls, property_id: int, payload: dict) -> "Frame":
+        return cls(chat_channel(property_id), json.dumps(payload))
+
+    @classmethod
+    def from_wire(cls, channel: Union[bytes, str], data: Union[bytes, str]) -> "Frame":
+        """Build a frame from a Redis Pub/Sub message without parsing its JSON body."""
+        if isinstance(channel, bytes):
+            channel = channel.decode("utf-8")
+        if isinstance(data, bytes):
+            return cls(channel, data.decode("utf-8"), data)
+        return cls(channel, str(data))
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = self.text.encode("utf-8")
+        return self._data
@@ -0,0 +1,283 @@
+# Background job coordination: singleton jobs run on exactly one node via a leader lease.
+# The lease lives in Redis (SET NX PX, renewed by a token-checked script); when Redis is disabled or
+# unreachable, a database advisory lock is used instead (Postgres/MySQL; SQLite is single-host).
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Optional
+from uuid import uuid4
+
+from sqlalchemy import text
+
+from .db import engine
+from .redis_client import get_redis, is_redis_enabled, report_redis_error
+from .redis_ops import evalsha, register_script
+
+# Namespaced logger for leadership changes and job runs
+logger = logging.getLogger("staycircle.jobs")
+
+# Acquire or renew a lease: renew when we hold it, take it when free. Returns 1 when held by us.
+# KEYS[1] = lease key; ARGV[1] = token; ARGV[2] = ttl ms
+LEASE_LUA = """
+local v = redis.call('get', KEYS[1])
+if v == ARGV[1] then
+  redis.call('pexpire', KEYS[1], ARGV[2])
+  return 1
+end
+if not v then
+  redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+register_script("leader_lease", LEASE_LUA)
+
+
+def _to_float(val: Optional[str], default: float) -> float:
+    try:
+        return float(val) if val is not None else default
+    except Exception:
+        return default
+
+
+class _DbAdvisoryLock:
+    """
+    Session-level advisory lock held on a dedicated connection (fallback when Redis is unavailable).
+
+    - Postgres: pg_try_advisory_lock(key); MySQL: GET_LOCK(name, 0); other dialects (SQLite): always held,
+      since a file database implies a single host.
+    - The lock lives as long as the connection; a dead connection means lost leadership.
+    - The connection runs in AUTOCOMMIT, so holding the lock never leaves it idle in a transaction
+      (which would pin a snapshot and trip idle_in_transaction_session_timeout).
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.key = zlib.crc32(name.encode("utf-8"))
+        self._conn = None
+
+    def acquire_or_renew(self) -> bool:
+        dialect = engine.dialect.name
+        if dialect not in ("postgresql", "mysql"):
+            return True
+        try:
+            if self._conn is not None:
+                self._conn.execute(text("SELECT 1"))
+                return True
+            conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+            if dialect == "postgresql":
+                held = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": self.key}).scalar()
+            else:
+                held = conn.execute(text("SELECT GET_LOCK(:n, 0)"), {"n": f"staycircle:{self.name}"}).scalar()
+            if held:
+                self._conn = conn
+                return True
+            conn.close()
+            return False
+        except Exception as exc:
+            logger.warning("jobs.db_lock.error", extra={"job": self.name, "error": str(exc)})
+            self.release()
+            return False
+
+    def release(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            # Closing the session releases the lock; unlock explicitly in case the pool keeps the connection
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": self.key})
+            else:
+                conn.execute(text("SELECT RELEASE_LOCK(:n)"), {"n": f"staycircle:{self.name}"})
+        except Exception:
+            pass
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class LeaderLease:
+    """
+    Leadership for one job name across workers and pods.
+
+    - Redis: key jobs:leader:{name} holds this node's token with a TTL of ttl_seconds; the leader renews it
+      every tick, so a crashed leader is replaced within one TTL.
+    - Fallback: _DbAdvisoryLock when Redis is disabled or unreachable. Singleton jobs must be idempotent,
+      because a Redis outage can briefly yield one Redis leader and one DB leader.
+    """
+    def __init__(self, name: str, ttl_seconds: float = 15.0) -> None:
+        self.name = name
+        self.key = f"jobs:leader:{name}"
+        self.ttl_ms = max(1000, int(ttl_seconds * 1000))
+        self.token = uuid4().hex
+        self.is_leader = False
+        self.changes = 0
+        self._db_lock = _DbAdvisoryLock(name)
+
+    def acquire_or_renew(self) -> bool:
+        held = False
+        r = get_redis() if is_redis_enabled() else None
+        if r is not None:
+            try:
+                held = int(evalsha(r, "leader_lease", [self.key], [self.token, self.ttl_ms])) == 1
+                self._db_lock.release()
+            except Exception as exc:
+                logger.warning("jobs.lease.error", extra={"job": self.name, "error": str(exc)})
+                report_redis_error(exc)
+                held = self._db_lock.acquire_or_renew()
+        else:
+            held = self._db_lock.acquire_or_renew()
+        if held != self.is_leader:
+            self.changes += 1
+            logger.info("jobs.leader.%s", "acquired" if held else "lost", extra={"job": self.name})
+        self.is_leader = held
+        return held
+
+    def release(self) -> None:
+        """Give up leadership (shutdown) so a follower takes over on its next tick instead of after the TTL."""
+        if self.is_leader:
+            r = get_redis() if is_redis_enabled() else None
+            if r is not None:
+                try:
+                    evalsha(r, "release_lock", [self.key], [self.token])
+                except Exception:
+                    pass
+        self._db_lock.release()
+        self.is_leader = False
+
+
+class SingletonJob:
+    """
+    A periodic job that runs only on the current leader.
+
+    Every tick (a third of the lease TTL, at most the interval) the node renews or contends for the lease;
+    the leader runs the job whenever `interval_seconds` have passed since its last run. While the job runs,
+    a side thread keeps renewing on the same tick, so a run longer than the TTL does not hand the lease over.
+    Metrics: runs, failures, last run time/duration/result, leadership state and changes.
+    """
+    def __init__(self, name: str, func: Callable[[], object], interval_seconds: float, lease_ttl_seconds: float = 15.0) -> None:
+        self.name = name
+        self.func = func
+        self.interval = max(0.1, interval_seconds)
+        self.lease = LeaderLease(name, ttl_seconds=lease_ttl_seconds)
+        self.tick = min(self.interval, self.lease.ttl_ms / 3000.0)
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_result: object = None
+        self.last_error: Optional[str] = None
+        self._next_run = 0.0
+        self._lock = threading.Lock()
+
+    def step(self) -> bool:
+        """One tick: contend/renew, then run if leader and due. Returns True if the job ran."""
+        if not self.lease.acquire_or_renew():
+            # A follower that becomes leader runs promptly; the previous leader may have died mid-interval
+            self._next_run = 0.0
+            return False
+        now = time.monotonic()
+        if now < self._next_run:
+            return False
+        self._next_run = now + self.interval
+        started = time.monotonic()
+        try:
+            result = self._run_with_renewal()
+            with self._lock:
+                self.last_result = result
+                self.last_error = None
+        except Exception as exc:
+            # Keep the job alive; it will try again on the next interval
+            logger.warning("jobs.run.failed", extra={"job": self.name, "error": str(exc)})
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(exc)
+        finally:
+            with self._lock:
+                self.runs += 1
+                self.last_run_at = time.time()
+                self.last_duration = time.monotonic() - started
+        return True
+
+    def _run_with_renewal(self) -> object:
+        """Run the job while a side thread renews the lease every tick; stops renewing once the lease is lost."""
+        done = threading.Event()
+
+        def renew() -> None:
+            while not done.wait(self.tick):
+                if not self.lease.acquire_or_renew():
+                    # The run cannot be aborted safely; singleton jobs are idempotent, so an overlap is tolerated
+                    logger.warning("jobs.lease.lost_mid_run", extra={"job": self.name})
+                    return
+
+        renewer = threading.Thread(target=renew, name=f"job-{self.name}-lease", daemon=True)
+        renewer.start()
+        try:
+            return self.func()
+        finally:
+            done.set()
+            renewer.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "is_leader": self.lease.is_leader,
+                "leader_changes": self.lease.changes,
+                "interval_seconds": self.interval,
+                "runs": self.runs,
+                "failures": self.failures,
+                "last_run_at": self.last_run_at,
+                "last_duration_seconds": self.last_duration,
+                "last_result": self.last_result if isinstance(self.last_result, (int, float, str, type(None))) else None,
+                "last_error": self.last_error,
+            }
+
+
+class JobCoordinator:
+    """Owns the singleton jobs of this process; each job ticks on its own daemon thread."""
+
+    def __init__(self) -> None:
+        self.jobs: Dict[str, SingletonJob] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._stop = threading.Event()
+
+    def register(self, name: str, func: Callable[[], object], interval_seconds: float) -> SingletonJob:
+        job = SingletonJob(name, func, interval_seconds, _to_float(os.getenv("JOBS_LEASE_TTL_SECONDS"), 15.0))
+        self.jobs[name] = job
+        return job
+
+    def start(self) -> None:
+        self._stop.clear()
+        for name, job in self.jobs.items():
+            if name in self._threads and self._threads[name].is_alive():
+                continue
+            t = threading.Thread(target=self._loop, args=(job,), name=f"job-{name}", daemon=True)
+            self._threads[name] = t
+            t.start()
+
+    def _loop(self, job: SingletonJob) -> None:
+        while not self._stop.is_set():
+            try:
+                job.step()
+            except Exception as exc:
+                logger.warning("jobs.tick.error", extra={"job": job.name, "error": str(exc)})
+            self._stop.wait(job.tick)
+        job.lease.release()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for t in self._threads.values():
+            t.join(timeout)
+        self._threads.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+
+# Process-wide coordinator; jobs are registered at startup (see app.main)
+coordinator = JobCoordinator()
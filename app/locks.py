@@ -3,15 +3,163 @@
 from __future__ import annotations
 
 import logging
-from contextlib import contextmanager
-from typing import Iterator
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date
+from typing import AsyncContextManager, AsyncIterator, ContextManager, Dict, Iterator, List
 from uuid import uuid4
 
-from .redis_client import get_redis
+from starlette.concurrency import run_in_threadpool
+
+from .redis_client import get_async_redis, get_redis, report_async_redis_error, report_redis_error
+from .redis_ops import async_evalsha, evalsha, register_script
 
 # Namespaced logger for lock acquisition/release diagnostics
 logger = logging.getLogger("staycircle.locks")
 
+# Range locks with a fair wait queue per property.
+# Keys share the property's hash tag, so the queue, waiter records and buckets live in one cluster slot
+# (waiter keys are derived inside the scripts from ARGV[prefix]).
+# - {prefix}q: ZSET of waiter ids ordered by arrival ({prefix}q:seq hands out the scores)
+# - {prefix}w:{id}: the waiter's bucket keys (space separated); expires when the waiter gives up or dies
+# - {prefix}n:{id}: wake-up list the waiter BLPOPs; releases push to every queued waiter
+#
+# Acquire: all bucket keys are taken or none. A caller may not take buckets that an earlier live waiter
+# also wants, so newcomers cannot barge past the queue. Returns 0 on success, 1 when blocked (and, if
+# ARGV[6] == '1', queues the caller under ARGV[3] keeping its original position).
+# KEYS[1] = queue; KEYS[2..] = bucket keys
+# ARGV = token, ttl ms, waiter id ('' when not waiting), key prefix, waiter record ttl ms, enqueue flag
+RANGE_LOCK_ACQUIRE_LUA = """
+local q = KEYS[1]
+local me = ARGV[3]
+local prefix = ARGV[4]
+local mine = {}
+for i = 2, #KEYS do mine[KEYS[i]] = true end
+local blocked = false
+for _, w in ipairs(redis.call('zrange', q, 0, -1)) do
+  if w == me then break end
+  local want = redis.call('get', prefix .. 'w:' .. w)
+  if not want then
+    redis.call('zrem', q, w)
+  else
+    for b in string.gmatch(want, '%S+') do
+      if mine[b] then blocked = true break end
+    end
+    if blocked then break end
+  end
+end
+if not blocked then
+  for i = 2, #KEYS do
+    if redis.call('exists', KEYS[i]) == 1 then blocked = true break end
+  end
+end
+if blocked then
+  if ARGV[6] == '1' and me ~= '' then
+    if not redis.call('zscore', q, me) then
+      redis.call('zadd', q, redis.call('incr', q .. ':seq'), me)
+    end
+    redis.call('set', prefix .. 'w:' .. me, table.concat(KEYS, ' ', 2), 'PX', ARGV[5])
+    redis.call('pexpire', q, ARGV[5])
+    redis.call('pexpire', q .. ':seq', ARGV[5])
+  end
+  return 1
+end
+for i = 2, #KEYS do
+  redis.call('set', KEYS[i], ARGV[1], 'PX', ARGV[2])
+end
+if me ~= '' then
+  redis.call('zrem', q, me)
+  redis.call('del', prefix .. 'w:' .. me, prefix .. 'n:' .. me)
+end
+return 0
+"""
+
+# Release the buckets we still own and wake every queued waiter to re-check; returns buckets deleted.
+# KEYS[1] = queue; KEYS[2..] = bucket keys; ARGV = token, key prefix
+RANGE_LOCK_RELEASE_LUA = """
+local n = 0
+for i = 2, #KEYS do
+  if redis.call('get', KEYS[i]) == ARGV[1] then
+    n = n + redis.call('del', KEYS[i])
+  end
+end
+for _, w in ipairs(redis.call('zrange', KEYS[1], 0, -1)) do
+  local nk = ARGV[2] .. 'n:' .. w
+  redis.call('rpush', nk, 1)
+  redis.call('pexpire', nk, 5000)
+end
+return n
+"""
+
+# A waiter that timed out leaves the queue and wakes the rest (it may have been their only blocker).
+# KEYS[1] = queue; ARGV = waiter id, key prefix
+RANGE_LOCK_LEAVE_LUA = """
+redis.call('zrem', KEYS[1], ARGV[1])
+redis.call('del', ARGV[2] .. 'w:' .. ARGV[1], ARGV[2] .. 'n:' .. ARGV[1])
+for _, w in ipairs(redis.call('zrange', KEYS[1], 0, -1)) do
+  local nk = ARGV[2] .. 'n:' .. w
+  redis.call('rpush', nk, 1)
+  redis.call('pexpire', nk, 5000)
+end
+return 0
+"""
+register_script("range_lock_acquire", RANGE_LOCK_ACQUIRE_LUA)
+register_script("range_lock_release", RANGE_LOCK_RELEASE_LUA)
+register_script("range_lock_leave", RANGE_LOCK_LEAVE_LUA)
+
+# Longest single BLPOP while waiting; must stay below the client socket timeout (REDIS_SOCKET_TIMEOUT).
+# Waiters also re-check after each slice, which covers holders whose lock expired by TTL.
+WAKE_SLICE_SECONDS = 0.1
+# Shortest BLPOP worth sending: Redis reads timeout 0 as "block forever", and clients round
+# sub-millisecond floats down to it, so a waiter this close to its deadline stops instead.
+MIN_WAKE_SECONDS = 0.01
+
+
+def _to_int(val, default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
+
+
+# Nights per range-lock bucket; 1 locks individual nights, 7 locks week-sized blocks (fewer keys, more contention)
+BOOKING_LOCK_BUCKET_DAYS = max(1, _to_int(os.getenv("BOOKING_LOCK_BUCKET_DAYS"), 1))
+# How long booking writes queue for a contended range before answering 429 (0 = fail fast)
+BOOKING_LOCK_WAIT_MS = max(0, _to_int(os.getenv("BOOKING_LOCK_WAIT_MS"), 2000))
+
+
+class LockStats:
+    """
+    Process-wide lock counters per lock kind.
+
+    - acquired / contended / fail_open: outcomes of acquisition attempts (contended = gave up)
+    - waited / wait_ms: acquisitions that queued, and their total time spent waiting
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def incr(self, kind: str, outcome: str, amount: int = 1) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(
+                kind, {"acquired": 0, "contended": 0, "fail_open": 0, "waited": 0, "wait_ms": 0}
+            )
+            counts[outcome] = counts.get(outcome, 0) + amount
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {kind: dict(counts) for kind, counts in self._counts.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+lock_stats = LockStats()
+
 
 @contextmanager
 def redis_try_lock(key: str, ttl_ms: int = 5000) -> Iterator[bool]:
@@ -21,7 +169,7 @@ def redis_try_lock(key: str, ttl_ms: int = 5000) -> Iterator[bool]:
     Behavior:
     - True when the lock is acquired, or when Redis is unavailable (fail-open).
     - False when another process holds the lock.
-    - Unlock uses a token-checked Lua script to avoid releasing a lock we don't own.
+    - Unlock uses a token-checked Lua script (EVALSHA) to avoid releasing a lock we don't own.
 
     Notes:
     - Keep TTLs small; this is a coarse per-resource guard (e.g., per property).
@@ -35,6 +183,7 @@ def redis_try_lock(key: str, ttl_ms: int = 5000) -> Iterator[bool]:
     r = get_redis()
     if r is None:
         # Fail-open if Redis is disabled/unavailable
+        lock_stats.incr("key", "fail_open")
         yield True
         return
 
@@ -43,27 +192,243 @@ def redis_try_lock(key: str, ttl_ms: int = 5000) -> Iterator[bool]:
     try:
         # SET key token NX PX ttl_ms returns True on success, falsy/None otherwise
         acquired = bool(r.set(key, token, nx=True, px=ttl_ms))
-        yield acquired
+        lock_stats.incr("key", "acquired" if acquired else "contended")
     except Exception as exc:
         # Fail open on unexpected Redis errors; proceed without the lock
         logger.warning("redis_try_lock error (key=%s): %s", key, exc)
+        report_redis_error(exc)
+        lock_stats.incr("key", "fail_open")
         yield True
+        return
+    # Errors raised by the critical section propagate to the caller; only the release is guarded
+    try:
+        yield acquired
     finally:
         if acquired:
             # Release only if we still own the lock (token matches current value)
             try:
-                r.eval(
-                    """
-                    if redis.call('get', KEYS[1]) == ARGV[1] then
-                        return redis.call('del', KEYS[1])
-                    else
-                        return 0
-                    end
-                    """,
-                    1,
-                    key,
-                    token,
-                )
+                evalsha(r, "release_lock", [key], [token])
             except Exception as exc:
                 # Do not raise; the lock will expire by TTL
                 logger.debug("redis_try_lock release error (key=%s): %s", key, exc)
+
+
+@asynccontextmanager
+async def _off_loop(cm: ContextManager[bool]) -> AsyncIterator[bool]:
+    """
+    Drive a sync lock context manager from the event loop.
+
+    The sync client's connect, acquire and release calls run in the threadpool, so a slow or
+    unreachable Redis never stalls the loop; the lock's semantics (fail-open, token-checked
+    release) are unchanged.
+    """
+    locked = await run_in_threadpool(cm.__enter__)
+    try:
+        yield locked
+    finally:
+        # Always exit cleanly so the release runs; an error raised by the block propagates from here
+        await run_in_threadpool(cm.__exit__, None, None, None)
+
+
+def async_redis_try_lock(key: str, ttl_ms: int = 5000) -> AsyncContextManager[bool]:
+    """
+    Event-loop variant of redis_try_lock() for async handlers.
+
+        async with async_redis_try_lock(f"lock:booking:property:{pid}") as locked:
+            ...
+    """
+    return _off_loop(redis_try_lock(key, ttl_ms=ttl_ms))
+
+
+def booking_range_keys(property_id: int, start_date: date, end_date: date) -> List[str]:
+    """
+    Bucket keys covering the nights [start_date, end_date) of one property.
+
+    The property id is a hash tag ({id}) so every bucket of a property maps to the same Redis Cluster slot,
+    which multi-key scripts require.
+    """
+    size = BOOKING_LOCK_BUCKET_DAYS
+    first = start_date.toordinal() // size
+    last = (end_date.toordinal() - 1) // size
+    return [f"{_range_prefix(property_id)}b{size}:{bucket}" for bucket in range(first, last + 1)]
+
+
+def _range_prefix(property_id: int) -> str:
+    return f"lock:booking:{{{property_id}}}:"
+
+
+class _RangeAttempt:
+    """Keys and arguments for one range-lock acquisition, shared by the sync and asyncio paths."""
+
+    def __init__(self, property_id: int, start_date: date, end_date: date, ttl_ms: int, wait_ms: int) -> None:
+        self.property_id = property_id
+        self.prefix = _range_prefix(property_id)
+        self.keys = [f"{self.prefix}q"] + booking_range_keys(property_id, start_date, end_date)
+        self.token = uuid4().hex
+        self.ttl_ms = ttl_ms
+        self.wait_ms = max(0, wait_ms)
+        self.waiter = uuid4().hex if self.wait_ms else ""
+        self.started = time.monotonic()
+        self.deadline = self.started + self.wait_ms / 1000.0
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def acquire_args(self) -> list:
+        # The waiter record outlives the wait by one lock TTL so a slow final attempt keeps its place
+        record_ttl = int(max(0.0, self.remaining()) * 1000) + self.ttl_ms
+        return [self.token, self.ttl_ms, self.waiter, self.prefix, record_ttl, "1" if self.waiter else "0"]
+
+    def wake_timeout(self) -> float:
+        """BLPOP timeout for the next wait slice; 0 when the deadline is too close to wait again."""
+        remaining = self.remaining()
+        if not self.waiter or remaining < MIN_WAKE_SECONDS:
+            return 0.0
+        return min(WAKE_SLICE_SECONDS, remaining)
+
+    @property
+    def wake_key(self) -> str:
+        return f"{self.prefix}n:{self.waiter}"
+
+    def abandon_calls(self) -> tuple:
+        """(script, keys, args) calls that drop this attempt's queue entry and any buckets it took."""
+        return (
+            ("range_lock_leave", self.keys[:1], [self.waiter, self.prefix]),
+            ("range_lock_release", self.keys, [self.token, self.prefix]),
+        )
+
+    def record(self, acquired: bool, queued: bool) -> None:
+        if queued:
+            lock_stats.incr("booking_range", "waited")
+            lock_stats.incr("booking_range", "wait_ms", int((time.monotonic() - self.started) * 1000))
+        lock_stats.incr("booking_range", "acquired" if acquired else "contended")
+        if not acquired:
+            logger.debug("range lock contended (property=%s)", self.property_id)
+
+
+@contextmanager
+def redis_range_lock(
+    property_id: int, start_date: date, end_date: date, ttl_ms: int = 5000, wait_ms: int = 0
+) -> Iterator[bool]:
+    """
+    Best-effort lock on a property's date range, so non-overlapping bookings proceed in parallel.
+
+    Behavior:
+    - Nights are grouped into BOOKING_LOCK_BUCKET_DAYS-sized buckets, one key each; a Lua script takes
+      every bucket atomically or none.
+    - wait_ms=0: try once. wait_ms>0: queue behind earlier waiters for overlapping buckets (FIFO) and
+      block on a wake-up list until a release or the deadline.
+    - True when acquired or when Redis is unavailable (fail-open); False when still held at the deadline,
+      or when Redis fails after the caller already queued behind a holder.
+    - Outcomes and wait times are counted in lock_stats under "booking_range".
+
+    Blocks the calling thread while waiting; use async_redis_range_lock() on the event loop.
+    """
+    if start_date >= end_date:
+        # Nothing to lock (callers validate ranges first)
+        yield True
+        return
+
+    r = get_redis()
+    if r is None:
+        lock_stats.incr("booking_range", "fail_open")
+        yield True
+        return
+
+    attempt = _RangeAttempt(property_id, start_date, end_date, ttl_ms, wait_ms)
+    acquired = False
+    queued = False
+    try:
+        while True:
+            acquired = int(evalsha(r, "range_lock_acquire", attempt.keys, attempt.acquire_args())) == 0
+            timeout = attempt.wake_timeout()
+            if acquired or not timeout:
+                break
+            queued = True
+            r.blpop([attempt.wake_key], timeout=timeout)
+        if queued and not acquired:
+            evalsha(r, "range_lock_leave", attempt.keys[:1], [attempt.waiter, attempt.prefix])
+        attempt.record(acquired, queued)
+    except Exception as exc:
+        logger.warning("redis_range_lock error (property=%s): %s", property_id, exc)
+        report_redis_error(exc)
+        if queued:
+            # We saw the range held by someone else; failing open now would run two critical sections
+            for script, keys, args in attempt.abandon_calls():
+                try:
+                    evalsha(r, script, keys, args)
+                except Exception:
+                    pass  # the waiter record and any buckets expire by TTL
+            attempt.record(False, queued)
+            yield False
+            return
+        lock_stats.incr("booking_range", "fail_open")
+        yield True
+        return
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                evalsha(r, "range_lock_release", attempt.keys, [attempt.token, attempt.prefix])
+            except Exception as exc:
+                # Do not raise; the buckets will expire by TTL
+                logger.debug("redis_range_lock release error (property=%s): %s", property_id, exc)
+
+
+@asynccontextmanager
+async def async_redis_range_lock(
+    property_id: int, start_date: date, end_date: date, ttl_ms: int = 5000, wait_ms: int = 0
+) -> AsyncIterator[bool]:
+    """
+    asyncio variant of redis_range_lock(): same keys, queue and fail-open contract, but waits with
+    BLPOP on the redis.asyncio client so the event loop keeps serving other requests.
+    """
+    if start_date >= end_date:
+        yield True
+        return
+
+    r = await get_async_redis()
+    if r is None:
+        lock_stats.incr("booking_range", "fail_open")
+        yield True
+        return
+
+    attempt = _RangeAttempt(property_id, start_date, end_date, ttl_ms, wait_ms)
+    acquired = False
+    queued = False
+    try:
+        while True:
+            acquired = int(await async_evalsha(r, "range_lock_acquire", attempt.keys, attempt.acquire_args())) == 0
+            timeout = attempt.wake_timeout()
+            if acquired or not timeout:
+                break
+            queued = True
+            await r.blpop([attempt.wake_key], timeout=timeout)
+        if queued and not acquired:
+            await async_evalsha(r, "range_lock_leave", attempt.keys[:1], [attempt.waiter, attempt.prefix])
+        attempt.record(acquired, queued)
+    except Exception as exc:
+        logger.warning("async_redis_range_lock error (property=%s): %s", property_id, exc)
+        report_async_redis_error(exc)
+        if queued:
+            # We saw the range held by someone else; failing open now would run two critical sections
+            for script, keys, args in attempt.abandon_calls():
+                try:
+                    await async_evalsha(r, script, keys, args)
+                except Exception:
+                    pass  # the waiter record and any buckets expire by TTL
+            attempt.record(False, queued)
+            yield False
+            return
+        lock_stats.incr("booking_range", "fail_open")
+        yield True
+        return
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                await async_evalsha(r, "range_lock_release", attempt.keys, [attempt.token, attempt.prefix])
+            except Exception as exc:
+                logger.debug("async_redis_range_lock release error (property=%s): %s", property_id, exc)
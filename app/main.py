@@ -1,40 +1,28 @@
 # Application entrypoint: configures middleware, startup routines, and API routers.
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import threading
-import time
 
 from .db import Base, engine
 from .routes.properties import router as properties_router
 from .routes.auth import router as auth_router
 from .routes.bookings import router as bookings_router
 from .routes.messages import router as messages_router
-from .routes.chat_ws import router as chat_ws_router, start_redis_subscriber
+from .routes.chat_ws import router as chat_ws_router, message_writer, subscriber as chat_subscriber
+from .routes.bookings_ws import router as bookings_ws_router
 from .payments import router as payments_router
+from .payment_gateway import close_gateway
+from .locks import lock_stats
+from .rate_limit import hybrid_limiter
+from .redis_client import redis_stats
 from .sweepers import sweep_expired_bookings
-
-
-def _start_expiry_sweeper(interval_seconds: int = 60) -> None:
-    """
-    Launch a daemon thread that periodically releases bookings stuck in 'pending_payment'.
-
-    Behavior:
-    - Call sweep_expired_bookings()
-    - Sleep for `interval_seconds`
-    Any exception is swallowed to keep the worker alive; it will try again on the next interval.
-    """
-    def _loop() -> None:
-        while True:
-            try:
-                sweep_expired_bookings()
-            except Exception:
-                # Keep the worker alive on transient errors; retry on the next interval.
-                pass
-            time.sleep(interval_seconds)
-
-    t = threading.Thread(target=_loop, name="booking-expiry-sweeper", daemon=True)
-    t.start()
+from .expiry import hold_expiry
+from .jobs import coordinator as job_coordinator
+from .outbox import purge_published, relay_once
 
 
 # Parse CORS origins from a comma-separated env var.
@@ -56,7 +44,56 @@ def _parse_cors_origins(env_value: str | None) -> list[str]:
     return origins
 
 
-app = FastAPI(title="StayCircle API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Application lifespan: startup routines before `yield`, graceful shutdown after.
+
+    Async background work (chat writer, Redis subscriber, hold expiry) runs as tasks on the server's own
+    event loop, so there are no thread hops or loop lookups from sync hooks.
+    """
+    # For local SQLite, auto-create tables; production DBs rely on Alembic migrations.
+    if os.getenv("DATABASE_URL", "sqlite:///./data.db").startswith("sqlite"):
+        Base.metadata.create_all(bind=engine)
+    # Holds expire near their deadline through the delay queue; the periodic sweep is a safety net for
+    # holds it missed (created before startup, or claimed by a worker that crashed)
+    await hold_expiry.start()
+    # Singleton jobs run only on the node holding the job's leader lease, not once per worker
+    job_coordinator.register(
+        "expiry-sweeper",
+        sweep_expired_bookings,
+        interval_seconds=int(os.getenv("EXPIRY_SWEEP_INTERVAL_SECONDS", "300")),
+    )
+    # Booking events leave the outbox in order through a single relay; published rows are purged hourly
+    job_coordinator.register(
+        "outbox-relay",
+        relay_once,
+        interval_seconds=int(os.getenv("OUTBOX_RELAY_INTERVAL_MS", "500")) / 1000.0,
+    )
+    job_coordinator.register("outbox-purge", purge_published, interval_seconds=3600)
+    job_coordinator.start()
+    # Group-commit writer for chat messages
+    await message_writer.start()
+    # Redis Pub/Sub subscriber for cross-process chat and booking feed fan-out (no-op when Redis is disabled).
+    # Runs on every worker: each one delivers to the sockets it holds, so it is not a singleton job.
+    await chat_subscriber.start()
+    # Background reconciliation for the hybrid rate-limit engine (only prunes idle keys when Redis is disabled)
+    await hybrid_limiter.start()
+    try:
+        yield
+    finally:
+        await hybrid_limiter.stop()
+        # Joins job threads and releases their leases so a follower takes over without waiting for the TTL
+        await asyncio.to_thread(job_coordinator.stop)
+        await hold_expiry.stop()
+        await chat_subscriber.stop()
+        # Flush queued chat messages before the process exits
+        await message_writer.stop()
+        # Close pooled payment gateway connections
+        await close_gateway()
+
+
+app = FastAPI(title="StayCircle API", version="0.1.0", lifespan=lifespan)
 allow_list = _parse_cors_origins(os.getenv("CORS_ORIGINS"))
 
 app.add_middleware(
@@ -68,33 +105,35 @@ app.add_middleware(
 )
 
 
-@app.on_event("startup")
-def on_startup() -> None:
-    # For local SQLite, auto-create tables; production DBs rely on Alembic migrations.
-    if os.getenv("DATABASE_URL", "sqlite:///./data.db").startswith("sqlite"):
-        Base.metadata.create_all(bind=engine)
-    # Kick off the background sweeper that releases expired holds (every 60s)
-    _start_expiry_sweeper(interval_seconds=60)
-    # Start the Redis Pub/Sub subscriber used to fan out chat messages across processes
-    try:
-        import asyncio
-        loop = asyncio.get_event_loop()
-        start_redis_subscriber(loop)
-    except Exception:
-        # Fail open: if Redis is absent, the API still starts; chat fan-out simply won't run
-        pass
-
-
 # Simple liveness endpoint for container orchestrators and uptime checks
 @app.get("/healthz")
 def healthz() -> dict:
     return {"status": "ok"}
 
 
-# Mount application routers (authentication, payments, domain APIs, and WebSocket chat)
+# Redis pool usage and circuit-breaker state for this worker
+@app.get("/healthz/redis")
+def healthz_redis() -> dict:
+    return redis_stats()
+
+
+# Distributed lock outcomes (acquired / contended / fail-open) per lock kind for this worker
+@app.get("/healthz/locks")
+def healthz_locks() -> dict:
+    return lock_stats.snapshot()
+
+
+# Singleton job leadership and per-run metrics (runs, failures, last duration/result) for this worker
+@app.get("/healthz/jobs")
+def healthz_jobs() -> dict:
+    return job_coordinator.stats()
+
+
+# Mount application routers (authentication, payments, domain APIs, WebSocket chat and booking feed)
 app.include_router(auth_router, prefix="", tags=["auth"])
 app.include_router(payments_router, prefix="", tags=["payments"])
 app.include_router(properties_router, prefix="/api/v1", tags=["properties"])
 app.include_router(bookings_router, prefix="/api/v1", tags=["bookings"])
 app.include_router(messages_router, prefix="/api/v1", tags=["messages"])
 app.include_router(chat_ws_router, prefix="/ws", tags=["chat"])
+app.include_router(bookings_ws_router, prefix="/ws", tags=["bookings"])
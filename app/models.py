@@ -1,6 +1,6 @@
-# SQLAlchemy ORM models for core domain tables (users, properties, bookings, messages).
+# SQLAlchemy ORM models for core domain tables (users, properties, bookings, booking nights, booking outbox, messages).
 # Keep business logic out of models; favor services and transactional logic in route handlers/services.
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Index, func, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Index, PrimaryKeyConstraint, func, Boolean
 from sqlalchemy.orm import declarative_mixin
 
 from .db import Base
@@ -68,12 +68,56 @@ class Booking(Base, TimestampMixin):
     # incremented on each update to support optimistic concurrency if/when used
     version = Column(Integer, nullable=False, default=1)
 
-    # Indexed access patterns: by property/date ranges, status, and expiry for background sweeps
+    # Indexed access patterns: by property/date ranges, status, expiry for background sweeps, and guest timelines
     __table_args__ = (
         Index("ix_bookings_property_start", "property_id", "start_date"),
         Index("ix_bookings_property_end", "property_id", "end_date"),
         Index("ix_bookings_status", "status"),
         Index("ix_bookings_expires_at", "expires_at"),
+        # Keyset pagination of a guest's bookings by (start_date desc, id desc)
+        Index("ix_bookings_guest_start_id", "guest_id", "start_date", "id"),
+    )
+
+
+class BookingNight(Base):
+    """One night held by a confirmed booking.
+
+    The (property_id, night) primary key makes the database reject a second confirmed booking for the
+    same night, so confirmation settles conflicts with one INSERT (see app/reservations.py).
+    """
+    __tablename__ = "booking_nights"
+
+    property_id = Column(Integer, ForeignKey("properties.id"), nullable=False)
+    night = Column(Date, nullable=False)
+    booking_id = Column(Integer, ForeignKey("bookings.id"), nullable=False, index=True)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("property_id", "night", name="pk_booking_nights"),
+    )
+
+
+class BookingEvent(Base):
+    """Outbox row for one booking status/version change.
+
+    Written in the same transaction as the change itself and relayed in id order to a Redis Stream
+    (see app/outbox.py); published_at is set once the relay has handed the event off.
+    """
+    __tablename__ = "booking_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    booking_id = Column(Integer, ForeignKey("bookings.id"), nullable=False)
+    property_id = Column(Integer, nullable=False)
+    guest_id = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False)
+    version = Column(Integer, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    published_at = Column(DateTime(timezone=True), nullable=True)
+
+    # The relay scans unpublished rows in id order
+    __table_args__ = (
+        Index("ix_booking_outbox_published_id", "published_at", "id"),
     )
 
 
@@ -0,0 +1,223 @@
+# Transactional outbox for booking state changes.
+# Every status/version change inserts a booking_outbox row in the same transaction as the change, so an
+# event exists if and only if the change committed. A relay (singleton job, see app.main) drains the
+# outbox in id order and appends each event to a Redis Stream, giving consumers ordered, at-least-once
+# delivery without polling the bookings table. The same pass pushes each event to the guest's and the
+# property owner's booking feed channels (see app/routes/bookings_ws.py).
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Insert
+
+from .db import SessionLocal
+from . import models
+from .frames import Frame, booking_channel
+from .redis_client import get_redis, is_redis_enabled, report_redis_error
+from .redis_ops import RedisBatch
+
+# Namespaced logger for relay throughput and failures
+logger = logging.getLogger("staycircle.outbox")
+
+
+def _to_int(val: Optional[str], default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
+
+
+# Configuration:
+# - OUTBOX_STREAM: Redis Stream receiving booking events
+# - OUTBOX_STREAM_MAXLEN: approximate stream length cap (consumers must keep up within it)
+# - OUTBOX_BATCH_SIZE: events per relay round trip (one SELECT, one pipelined XADD batch, one UPDATE)
+# - OUTBOX_RETENTION_SECONDS: published rows older than this are purged
+OUTBOX_STREAM = os.getenv("OUTBOX_STREAM", "events:bookings")
+OUTBOX_STREAM_MAXLEN = max(1000, _to_int(os.getenv("OUTBOX_STREAM_MAXLEN"), 100_000))
+OUTBOX_BATCH_SIZE = max(1, _to_int(os.getenv("OUTBOX_BATCH_SIZE"), 200))
+OUTBOX_RETENTION_SECONDS = max(0, _to_int(os.getenv("OUTBOX_RETENTION_SECONDS"), 86_400))
+
+# Receives feed frames when Redis is disabled (called from the relay thread; must be thread-safe)
+LocalSink = Callable[[List[Frame]], object]
+_local_sink: Optional[LocalSink] = None
+
+
+def set_local_sink(sink: Optional[LocalSink]) -> None:
+    """Deliver feed frames in-process when there is no Redis Pub/Sub (single-worker deployments)."""
+    global _local_sink
+    _local_sink = sink
+
+
+# Booking columns copied into each event (order matches the INSERT ... SELECT below)
+_EVENT_COLUMNS = ("booking_id", "property_id", "guest_id", "status", "version", "start_date", "end_date")
+
+
+def enqueue_stmt(booking_ids: Iterable[int]) -> Insert:
+    """
+    INSERT ... SELECT one outbox event per booking from its current (flushed) row.
+
+    Executed inside the transaction that changed the bookings, so the event carries exactly the
+    committed status/version, including for set-based UPDATEs that never load ORM objects.
+    """
+    b = models.Booking
+    source = select(b.id, b.property_id, b.guest_id, b.status, b.version, b.start_date, b.end_date).where(
+        b.id.in_(list(booking_ids))
+    ).order_by(b.id)
+    return insert(models.BookingEvent).from_select(list(_EVENT_COLUMNS), source)
+
+
+def enqueue(db: Session, bookings: Iterable[models.Booking]) -> None:
+    """
+    Record events for the given bookings in the caller's transaction.
+
+    Takes ORM objects rather than ids: pending ORM changes are flushed first, so newly added
+    bookings have their ids assigned before the INSERT ... SELECT reads them.
+    """
+    objs = list(bookings)
+    if not objs:
+        return
+    db.flush()
+    db.execute(enqueue_stmt([obj.id for obj in objs]))
+
+
+async def async_enqueue(db: AsyncSession, bookings: Iterable[models.Booking]) -> None:
+    """Async counterpart of enqueue() for the AsyncSession booking routes."""
+    objs = list(bookings)
+    if not objs:
+        return
+    await db.flush()
+    await db.execute(enqueue_stmt([obj.id for obj in objs]))
+
+
+def to_fields(event: models.BookingEvent) -> dict:
+    """Stream entry for an outbox row; `event_id` lets consumers drop redeliveries."""
+    return {
+        "event_id": event.id,
+        "booking_id": event.booking_id,
+        "property_id": event.property_id,
+        "guest_id": event.guest_id,
+        "status": event.status,
+        "version": event.version,
+        "start_date": event.start_date.isoformat(),
+        "end_date": event.end_date.isoformat(),
+    }
+
+
+def feed_frames(event: models.BookingEvent, owner_id: Optional[int]) -> List[Frame]:
+    """One pre-serialized frame per recipient: the guest and, if different, the property owner."""
+    text = json.dumps({"type": "booking", **to_fields(event)})
+    recipients = [event.guest_id] + ([owner_id] if owner_id is not None and owner_id != event.guest_id else [])
+    return [Frame(booking_channel(user_id), text) for user_id in recipients]
+
+
+def relay_once(db: Optional[Session] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Publish unpublished outbox rows in id order; returns the number of events relayed.
+
+    Delivery:
+    - Each batch is appended with one pipelined XADD round trip, then marked published in one UPDATE.
+      A crash between the two republishes the batch, so delivery is at-least-once; consumers dedupe
+      by event_id (or by booking version).
+    - Ordering holds because only the relay leader publishes and always takes the lowest ids first.
+    - When Redis is enabled but unreachable, rows stay pending and are published once it recovers.
+      When Redis is disabled there is no stream to feed: feed frames go to the local sink (if set) and
+      rows are marked published.
+    - Booking feed frames for the guest and owner are published alongside, so pushes follow commit order.
+    """
+    size = max(1, batch_size or OUTBOX_BATCH_SIZE)
+    created_session = False
+    if db is None:
+        db = SessionLocal()
+        created_session = True
+    started = time.monotonic()
+    total = 0
+    try:
+        while True:
+            rows: List[Tuple[models.BookingEvent, Optional[int]]] = [
+                (row[0], row[1])
+                for row in db.execute(
+                    select(models.BookingEvent, models.Property.owner_id)
+                    .outerjoin(models.Property, models.Property.id == models.BookingEvent.property_id)
+                    .where(models.BookingEvent.published_at == None)  # noqa: E711
+                    .order_by(models.BookingEvent.id)
+                    .limit(size)
+                ).all()
+            ]
+            if not rows:
+                break
+            events = [event for event, _ in rows]
+            frames = [frame for event, owner_id in rows for frame in feed_frames(event, owner_id)]
+            if is_redis_enabled():
+                r = get_redis()
+                if r is None:
+                    break
+                # Stream appends and feed publishes share one round trip
+                batch = RedisBatch(r)
+                for event in events:
+                    batch.command("xadd", OUTBOX_STREAM, to_fields(event), maxlen=OUTBOX_STREAM_MAXLEN, approximate=True)
+                for frame in frames:
+                    batch.publish(frame.channel, frame.data)
+                try:
+                    batch.execute()
+                except Exception as exc:
+                    logger.warning("outbox.publish.failed", extra={"error": str(exc), "pending": len(events)})
+                    report_redis_error(exc)
+                    break
+            elif _local_sink is not None:
+                try:
+                    _local_sink(frames)
+                except Exception as exc:
+                    # Feed pushes are best-effort; clients resync from GET /bookings/me on reconnect
+                    logger.warning("outbox.local_sink.failed", extra={"error": str(exc)})
+            db.execute(
+                update(models.BookingEvent)
+                .where(models.BookingEvent.id.in_([e.id for e in events]))
+                .values(published_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            total += len(events)
+            if len(events) < size:
+                break
+        if total:
+            elapsed = time.monotonic() - started
+            logger.info("relayed %d booking events (%.3fs)", total, elapsed)
+        return total
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if created_session:
+            db.close()
+
+
+def purge_published(db: Optional[Session] = None, retention_seconds: Optional[int] = None) -> int:
+    """Delete published rows older than the retention window; returns rows deleted."""
+    keep = OUTBOX_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=keep)
+    created_session = False
+    if db is None:
+        db = SessionLocal()
+        created_session = True
+    try:
+        res = db.execute(
+            delete(models.BookingEvent)
+            .where(models.BookingEvent.published_at != None, models.BookingEvent.published_at < cutoff)  # noqa: E711
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return int(res.rowcount or 0)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if created_session:
+            db.close()
@@ -0,0 +1,30 @@
+# Opaque cursor helpers for keyset (seek) pagination.
+# Cursors are URL-safe base64 of a small JSON object; clients must treat them as opaque tokens.
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Dict
+
+from fastapi import HTTPException, status
+
+# Response header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Encode keyset values (JSON-serializable) into an opaque cursor string."""
+    raw = json.dumps(values, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_cursor(), raising a 400 for malformed input."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict):
+            raise ValueError("cursor payload must be an object")
+        return values
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
@@ -0,0 +1,227 @@
+# Payment gateway: async PaymentIntent calls behind one small interface.
+# The Stripe implementation talks to the REST API over a pooled httpx.AsyncClient with per-call timeouts
+# and retries that reuse the caller's idempotency key; the fake implementation keeps dev/CI offline.
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import os
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# Namespaced logger for gateway retries and failures
+logger = logging.getLogger("staycircle.payments.gateway")
+
+
+def _to_int(val: Optional[str], default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
+
+
+def _to_float(val: Optional[str], default: float) -> float:
+    try:
+        return float(val) if val is not None else default
+    except Exception:
+        return default
+
+
+# Configuration:
+# - STRIPE_API_BASE: REST endpoint (override for stripe-mock in integration environments)
+# - STRIPE_TIMEOUT_SECONDS / STRIPE_CONNECT_TIMEOUT_SECONDS: per attempt
+# - STRIPE_MAX_RETRIES: extra attempts for network errors, 409 idempotency conflicts, 429 and 5xx
+# - STRIPE_MAX_CONNECTIONS: pooled connections per process (keep-alive reuse across requests)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com").rstrip("/")
+STRIPE_TIMEOUT_SECONDS = max(0.1, _to_float(os.getenv("STRIPE_TIMEOUT_SECONDS"), 10.0))
+STRIPE_CONNECT_TIMEOUT_SECONDS = max(0.1, _to_float(os.getenv("STRIPE_CONNECT_TIMEOUT_SECONDS"), 3.0))
+STRIPE_MAX_RETRIES = max(0, _to_int(os.getenv("STRIPE_MAX_RETRIES"), 2))
+STRIPE_MAX_CONNECTIONS = max(1, _to_int(os.getenv("STRIPE_MAX_CONNECTIONS"), 20))
+
+
+class PaymentGatewayError(RuntimeError):
+    """A gateway call failed for good (non-retryable response, or retries exhausted)."""
+
+
+class PaymentIntent:
+    """Fields the booking flows read from a PaymentIntent; detached from any SDK object."""
+
+    __slots__ = ("id", "status", "client_secret")
+
+    def __init__(self, id: str, status: Optional[str], client_secret: Optional[str]) -> None:
+        self.id = id
+        self.status = status
+        self.client_secret = client_secret
+
+
+class PaymentGateway(abc.ABC):
+    """Async PaymentIntent operations used by booking and payment routes."""
+
+    @abc.abstractmethod
+    async def create_intent(
+        self,
+        amount_cents: int,
+        currency: str,
+        booking_id: int,
+        property_id: int,
+        idempotency_key: str,
+    ) -> PaymentIntent:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def retrieve_intent(self, payment_intent_id: str) -> PaymentIntent:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        return None
+
+
+class FakePaymentGateway(PaymentGateway):
+    """
+    Deterministic, network-free gateway for local/dev and tests.
+
+    - Intent ids and secrets derive from the booking id; repeating an idempotency key returns the
+      original intent, like Stripe.
+    - `statuses` lets tests move an intent to e.g. "succeeded" or "canceled".
+    """
+    def __init__(self) -> None:
+        self.intents: Dict[str, PaymentIntent] = {}
+        self.statuses: Dict[str, str] = {}
+        self.calls: List[Tuple[str, str]] = []
+
+    async def create_intent(
+        self,
+        amount_cents: int,
+        currency: str,
+        booking_id: int,
+        property_id: int,
+        idempotency_key: str,
+    ) -> PaymentIntent:
+        self.calls.append(("create", idempotency_key))
+        intent = self.intents.get(idempotency_key)
+        if intent is None:
+            intent = PaymentIntent(f"pi_test_{booking_id}", "requires_payment_method", f"test_client_secret_{booking_id}")
+            self.intents[idempotency_key] = intent
+        return PaymentIntent(intent.id, self.statuses.get(intent.id, intent.status), intent.client_secret)
+
+    async def retrieve_intent(self, payment_intent_id: str) -> PaymentIntent:
+        self.calls.append(("retrieve", payment_intent_id))
+        return PaymentIntent(
+            payment_intent_id,
+            self.statuses.get(payment_intent_id, "requires_payment_method"),
+            f"test_client_secret_{payment_intent_id}",
+        )
+
+    def reset(self) -> None:
+        self.intents.clear()
+        self.statuses.clear()
+        self.calls.clear()
+
+
+class StripeGateway(PaymentGateway):
+    """
+    Stripe REST client on a shared httpx.AsyncClient.
+
+    - Connection reuse: one pool per process (created lazily, closed from the application lifespan).
+    - Timeouts: every attempt is bounded by STRIPE_TIMEOUT_SECONDS, so a slow Stripe never pins a worker.
+    - Retries: network errors, 409 (concurrent idempotent request), 429 and 5xx are retried with jittered
+      exponential backoff, honoring Stripe-Should-Retry. POSTs resend the same Idempotency-Key, so a retry
+      after a lost response returns the original intent instead of creating a second one.
+    """
+    def __init__(self, secret_key: str, base_url: str = STRIPE_API_BASE, max_retries: int = STRIPE_MAX_RETRIES) -> None:
+        self.secret_key = secret_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.secret_key}"},
+                timeout=httpx.Timeout(STRIPE_TIMEOUT_SECONDS, connect=STRIPE_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=STRIPE_MAX_CONNECTIONS, max_keepalive_connections=STRIPE_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    @staticmethod
+    def _should_retry(response: httpx.Response) -> bool:
+        hint = response.headers.get("stripe-should-retry")
+        if hint is not None:
+            return hint == "true"
+        return response.status_code in (409, 429) or response.status_code >= 500
+
+    async def _request(self, method: str, path: str, data: Optional[dict] = None, idempotency_key: Optional[str] = None) -> dict:
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        attempt = 0
+        while True:
+            try:
+                response = await self._http().request(method, path, data=data, headers=headers)
+            except httpx.TransportError as exc:
+                if attempt >= self.max_retries:
+                    raise PaymentGatewayError(f"Stripe unreachable: {exc}") from exc
+                logger.warning("stripe.retry", extra={"path": path, "attempt": attempt + 1, "error": str(exc)})
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                if attempt >= self.max_retries or not self._should_retry(response):
+                    try:
+                        message = response.json().get("error", {}).get("message")
+                    except Exception:
+                        message = None
+                    raise PaymentGatewayError(message or f"Stripe error {response.status_code}")
+                logger.warning("stripe.retry", extra={"path": path, "attempt": attempt + 1, "status": response.status_code})
+            attempt += 1
+            await asyncio.sleep(min(2.0, 0.25 * 2 ** (attempt - 1)) * (0.5 + random.random() / 2))
+
+    @staticmethod
+    def _intent(data: Dict[str, Any]) -> PaymentIntent:
+        return PaymentIntent(data["id"], data.get("status"), data.get("client_secret"))
+
+    async def create_intent(
+        self,
+        amount_cents: int,
+        currency: str,
+        booking_id: int,
+        property_id: int,
+        idempotency_key: str,
+    ) -> PaymentIntent:
+        # automatic_payment_methods keeps the UI simple with PaymentElement
+        data = {
+            "amount": str(int(amount_cents)),
+            "currency": currency.lower(),
+            "metadata[booking_id]": str(booking_id),
+            "metadata[property_id]": str(property_id),
+            "automatic_payment_methods[enabled]": "true",
+        }
+        return self._intent(await self._request("POST", "/v1/payment_intents", data=data, idempotency_key=idempotency_key))
+
+    async def retrieve_intent(self, payment_intent_id: str) -> PaymentIntent:
+        return self._intent(await self._request("GET", f"/v1/payment_intents/{payment_intent_id}"))
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+
+# Process-wide gateway; chosen on first use (see app.payments.gateway) and replaceable in tests
+_gateway: Optional[PaymentGateway] = None
+
+
+def set_gateway(gateway: Optional[PaymentGateway]) -> None:
+    global _gateway
+    _gateway = gateway
+
+
+def current_gateway() -> Optional[PaymentGateway]:
+    return _gateway
+
+
+async def close_gateway() -> None:
+    gateway = _gateway
+    if gateway is not None:
+        await gateway.aclose()
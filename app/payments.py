@@ -1,5 +1,6 @@
 # Payments module: Stripe integration with test-friendly fallbacks.
 # Exposes endpoints to create PaymentIntents, fetch client secrets, finalize bookings, and handle webhooks.
+# Stripe API calls are async (see app/payment_gateway.py), so slow responses hold neither threads nor locks.
 # When Stripe keys are absent, operates in deterministic offline mode for local/dev and CI.
 from __future__ import annotations
 
@@ -7,13 +8,18 @@ import os
 from typing import Tuple, Any, Optional
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .db import get_db
-from . import models, schemas
+from .db import get_async_db
+from . import availability, models, outbox, reservations, schemas
+from .payment_gateway import FakePaymentGateway, PaymentGateway, StripeGateway, current_gateway, set_gateway
 from .routes.auth import require_tenant
+from .user_cache import AuthenticatedUser
 
-# Stripe SDK is optional; tests/CI may omit keys to stay fully offline.
+# Stripe SDK is optional (used for webhook signature checks; API calls go through app.payment_gateway);
+# tests/CI may omit keys to stay fully offline.
 try:
     import stripe  # type: ignore
 except Exception:  # pragma: no cover
@@ -36,13 +42,18 @@ def stripe_enabled() -> bool:
     return bool(stripe and STRIPE_SECRET_KEY)
 
 
-def _init_stripe() -> None:
-    if not stripe_enabled():
-        raise RuntimeError("Stripe not enabled (SDK missing or STRIPE_SECRET_KEY not set)")
-    stripe.api_key = STRIPE_SECRET_KEY
+def gateway() -> PaymentGateway:
+    """
+    Process-wide payment gateway: Stripe over a pooled async HTTP client when enabled, else the offline fake.
+    """
+    current = current_gateway()
+    if current is None:
+        current = StripeGateway(STRIPE_SECRET_KEY) if stripe_enabled() else FakePaymentGateway()
+        set_gateway(current)
+    return current
 
 
-def create_payment_intent(
+async def create_payment_intent(
     amount_cents: int,
     currency: str,
     booking_id: int,
@@ -53,60 +64,42 @@ def create_payment_intent(
     Create a PaymentIntent and return (payment_intent_id, client_secret).
 
     - Production: goes through Stripe (test keys) with automatic_payment_methods for PaymentElement.
-    - Dev/CI without Stripe: returns deterministic fake values to keep flows testable/offline.
+    - Dev/CI without Stripe: the fake gateway returns deterministic values to keep flows testable/offline.
+    - Clients must reuse the same idempotency key when retrying the same logical request; we derive a
+      stable key from booking/version, and the gateway resends it on its own retries.
     """
-    if not stripe_enabled():
-        # Local/test fallback: generate synthetic IDs and secrets (no network calls)
-        fake_pi_id = f"pi_test_{booking_id}"
-        fake_cs = f"test_client_secret_{booking_id}"
-        return fake_pi_id, fake_cs
-
-    _init_stripe()
-    # Use automatic_payment_methods to keep UI simple with PaymentElement
-    pi = stripe.PaymentIntent.create(
-        amount=int(amount_cents),
-        currency=currency.lower(),
-        metadata={"booking_id": str(booking_id), "property_id": str(property_id)},
-        automatic_payment_methods={"enabled": True},
+    intent = await gateway().create_intent(
+        amount_cents=amount_cents,
+        currency=currency,
+        booking_id=booking_id,
+        property_id=property_id,
         idempotency_key=idempotency_key,
     )
-    # Idempotency: the Python SDK accepts idempotency_key via request options.
-    # Clients must reuse the same key when retrying the same logical request.
-    # Here we derive a stable key from booking/version to make retries safe.
-
-    # Retrieve client secret
-    client_secret: Optional[str] = getattr(pi, "client_secret", None)
+    client_secret = intent.client_secret
     if not client_secret:
         # Retrieve to ensure we have it (some Stripe flows do not return it on all calls)
-        pi = stripe.PaymentIntent.retrieve(pi.id)
-        client_secret = getattr(pi, "client_secret", None)
+        client_secret = (await gateway().retrieve_intent(intent.id)).client_secret
     if not client_secret:
         raise RuntimeError("Stripe PaymentIntent missing client_secret")
-    return pi.id, client_secret
+    return intent.id, client_secret
 
 
-def retrieve_client_secret(payment_intent_id: str) -> str:
+async def retrieve_client_secret(payment_intent_id: str) -> str:
     """
     Return the client_secret for an existing PaymentIntent.
 
-    Offline mode: when Stripe is disabled, synthesize a deterministic secret so the UI can render.
+    Offline mode: the fake gateway synthesizes a deterministic secret so the UI can render.
     """
-    if not stripe_enabled():
-        # Synthesize a deterministic secret for UI rendering in tests
-        return f"test_client_secret_{payment_intent_id}"
-
-    _init_stripe()
-    pi = stripe.PaymentIntent.retrieve(payment_intent_id)
-    client_secret: Optional[str] = getattr(pi, "client_secret", None)
-    if not client_secret:
+    intent = await gateway().retrieve_intent(payment_intent_id)
+    if not intent.client_secret:
         raise RuntimeError("Stripe PaymentIntent missing client_secret")
-    return client_secret
+    return intent.client_secret
 
 @router.get("/api/v1/bookings/{booking_id}/payment_info", response_model=schemas.PaymentInfoResponse)
-def get_payment_info(
+async def get_payment_info(
     booking_id: int,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(require_tenant),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(require_tenant),
 ) -> schemas.PaymentInfoResponse:
     """
     Ensure a PaymentIntent exists for a 'pending_payment' booking and return:
@@ -115,7 +108,7 @@ def get_payment_info(
 
     Authorization: only the booking's tenant may access.
     """
-    booking = db.get(models.Booking, booking_id)
+    booking = await db.get(models.Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
     if booking.guest_id != user.id:
@@ -137,7 +130,7 @@ def get_payment_info(
     client_secret: Optional[str] = None
     if not booking.payment_intent_id:
         idem_key = f"booking:{booking.id}:v{booking.version or 1}"
-        pi_id, client_secret = create_payment_intent(
+        pi_id, client_secret = await create_payment_intent(
             amount_cents=booking.total_cents,
             currency=booking.currency,
             booking_id=booking.id,
@@ -146,23 +139,21 @@ def get_payment_info(
         )
         booking.payment_intent_id = pi_id
         db.add(booking)
-        db.commit()
+        await db.commit()
     else:
         # If Stripe is enabled, inspect the existing PaymentIntent status:
         # - canceled: create a fresh intent and update the booking/version
         # - succeeded: finalize booking (webhook mirror) and short-circuit the pay flow
         if stripe_enabled():
             try:
-                pi = stripe.PaymentIntent.retrieve(booking.payment_intent_id)
-                pi_status = getattr(pi, "status", None)
+                pi_status = (await gateway().retrieve_intent(booking.payment_intent_id)).status
             except Exception:
-                pi = None
                 pi_status = None
 
             if pi_status == "canceled":
                 # Create a new intent for a canceled/invalidated PI
                 idem_key = f"booking:{booking.id}:v{(booking.version or 1) + 1}"
-                new_pi_id, client_secret = create_payment_intent(
+                new_pi_id, client_secret = await create_payment_intent(
                     amount_cents=booking.total_cents,
                     currency=booking.currency,
                     booking_id=booking.id,
@@ -172,40 +163,23 @@ def get_payment_info(
                 booking.payment_intent_id = new_pi_id
                 booking.version = (booking.version or 1) + 1
                 db.add(booking)
-                db.commit()
+                await outbox.async_enqueue(db, [booking])
+                await db.commit()
             elif pi_status == "succeeded":
                 # Treat as paid: finalize booking just like webhook would (idempotent)
                 # Expiry guard
                 if expires_at <= now:
                     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Payment hold expired")
                 # Defensive overlap vs confirmed
-                if _has_confirmed_overlap(db, booking.property_id, booking.start_date, booking.end_date):
+                if await db.run_sync(_has_confirmed_overlap, booking.property_id, booking.start_date, booking.end_date):
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Overlap conflict")
+                if await db.run_sync(_confirm_pending, booking) == "overlap":
                     raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Overlap conflict")
-                current_version = booking.version or 1
-                rows = (
-                    db.query(models.Booking)
-                    .filter(
-                        models.Booking.id == booking.id,
-                        models.Booking.version == current_version,
-                        models.Booking.status == "pending_payment",
-                    )
-                    .update(
-                        {
-                            models.Booking.status: "confirmed",
-                            models.Booking.version: current_version + 1,
-                        },
-                        synchronize_session=False,
-                    )
-                )
-                if rows:
-                    db.commit()
-                else:
-                    db.rollback()
                 # Return a user-friendly error; the UI should refresh to reflect 'confirmed'
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Booking already paid")
 
     if client_secret is None:
-        client_secret = retrieve_client_secret(booking.payment_intent_id)  # type: ignore[arg-type]
+        client_secret = await retrieve_client_secret(booking.payment_intent_id)  # type: ignore[arg-type]
     return schemas.PaymentInfoResponse(
         booking_id=booking.id,
         client_secret=client_secret,
@@ -214,20 +188,21 @@ def get_payment_info(
 
 
 @router.post("/api/v1/bookings/{booking_id}/finalize_payment")
-def finalize_payment(
+async def finalize_payment(
     booking_id: int,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(require_tenant),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(require_tenant),
 ):
     """
     Finalize a booking after client-side confirmation when webhooks are unavailable.
 
     Idempotency:
     - Already confirmed: return the confirmed booking
-    - Still processing: return a 'processing' status so the client can poll
+    - Still processing: return a 'processing' status; the confirmation is pushed on /ws/bookings
+      once the webhook (or a later finalize call) commits it
     """
     # Lookup and basic auth
-    booking: Optional[models.Booking] = db.get(models.Booking, booking_id)
+    booking: Optional[models.Booking] = await db.get(models.Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
     if booking.guest_id != user.id:
@@ -256,50 +231,33 @@ def finalize_payment(
     if not stripe_enabled():
         return {"status": "stripe_disabled"}
 
-    _init_stripe()
     if not booking.payment_intent_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing payment_intent")
 
     try:
-        pi = stripe.PaymentIntent.retrieve(booking.payment_intent_id)
-        pi_status: Optional[str] = getattr(pi, "status", None)
+        pi_status: Optional[str] = (await gateway().retrieve_intent(booking.payment_intent_id)).status
     except Exception as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unable to retrieve PaymentIntent: {exc}")
 
     if pi_status == "succeeded":
         # Defensive overlap vs confirmed (should not happen, but guard)
-        if _has_confirmed_overlap(db, booking.property_id, booking.start_date, booking.end_date):
+        if await db.run_sync(_has_confirmed_overlap, booking.property_id, booking.start_date, booking.end_date):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Overlap conflict")
 
         # Idempotent finalize (mirror webhook)
-        current_version = booking.version or 1
-        rows = (
-            db.query(models.Booking)
-            .filter(
-                models.Booking.id == booking.id,
-                models.Booking.version == current_version,
-                models.Booking.status == "pending_payment",
-            )
-            .update(
-                {
-                    models.Booking.status: "confirmed",
-                    models.Booking.version: current_version + 1,
-                },
-                synchronize_session=False,
-            )
-        )
-        if rows == 0:
-            db.rollback()
-            latest = db.query(models.Booking).get(booking.id)
+        outcome = await db.run_sync(_confirm_pending, booking)
+        if outcome == "overlap":
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Overlap conflict")
+        if outcome == "stale":
+            latest = await db.get(models.Booking, booking.id, populate_existing=True)
             if latest and latest.status == "confirmed":
                 return schemas.BookingRead.model_validate(latest)
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Version conflict")
-        db.commit()
-        db.refresh(booking)
+        await db.refresh(booking)
         return schemas.BookingRead.model_validate(booking)
 
     if pi_status in ("processing", "requires_action", "requires_payment_method", "requires_confirmation"):
-        # Let client retry/poll
+        # Not settled yet; the client waits for the push (or retries)
         return {"status": "processing"}
 
     if pi_status == "canceled":
@@ -309,32 +267,60 @@ def finalize_payment(
     return {"status": pi_status or "unknown"}
 
 
-def _has_confirmed_overlap(db: Session, property_id: int, start_date, end_date) -> bool:
+def _confirm_pending(db: Session, booking: models.Booking) -> str:
     """
-    Return True if any confirmed booking overlaps the given [start_date, end_date).
+    Confirm a 'pending_payment' booking, claim its nights and record its outbox event in one transaction.
 
-    Overlap logic:
-    NOT (existing.end_date <= start_date OR existing.start_date >= end_date)
+    Returns:
+    - "confirmed": committed (and applied to the availability index)
+    - "stale": the version/status changed underneath us (rolled back)
+    - "overlap": another confirmed booking holds one of the nights (rolled back)
     """
-    exists = (
-        db.query(models.Booking.id)
+    current_version = booking.version or 1
+    rows = (
+        db.query(models.Booking)
         .filter(
-            models.Booking.property_id == property_id,
-            models.Booking.status == "confirmed",
-            ~(
-                (models.Booking.end_date <= start_date)
-                | (models.Booking.start_date >= end_date)
-            ),
+            models.Booking.id == booking.id,
+            models.Booking.version == current_version,
+            models.Booking.status == "pending_payment",
+        )
+        .update(
+            {
+                models.Booking.status: "confirmed",
+                models.Booking.version: current_version + 1,
+            },
+            synchronize_session=False,
         )
-        .first()
     )
-    return exists is not None
+    if rows == 0:
+        # Rollback pending transaction to clear write intents
+        db.rollback()
+        return "stale"
+    try:
+        reservations.claim_nights(db, booking)
+    except reservations.NightsTaken:
+        db.rollback()
+        return "overlap"
+    outbox.enqueue(db, [booking])
+    db.commit()
+    availability.record_status(booking.id, booking.property_id, booking.start_date, booking.end_date, "confirmed")
+    return "confirmed"
+
+
+def _has_confirmed_overlap(db: Session, property_id: int, start_date, end_date) -> bool:
+    """
+    Return True if any confirmed booking overlaps the given [start_date, end_date).
+
+    Always asks the DB: this check guards the confirmation itself, so an index answer that trails
+    another worker's write could double-book.
+    """
+    return availability.has_overlap(db, property_id, start_date, end_date, authoritative=True)
 
 
 @router.post("/payments/webhook")
 async def stripe_webhook(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     stripe_signature: str = Header(None, alias="Stripe-Signature"),
 ) -> dict:
     """
@@ -370,8 +356,8 @@ async def stripe_webhook(
 
         # Lookup booking by payment_intent_id
         booking: Optional[models.Booking] = (
-            db.query(models.Booking).filter(models.Booking.payment_intent_id == payment_intent_id).first()
-        )
+            await db.execute(select(models.Booking).where(models.Booking.payment_intent_id == payment_intent_id))
+        ).scalars().first()
         if not booking:
             # Unknown intent; accept to avoid a retry storm (could log for investigation)
             return {"status": "unknown_intent"}
@@ -396,35 +382,20 @@ async def stripe_webhook(
             return {"status": "expired"}  # ignore late
 
         # Defensive overlap check against confirmed bookings
-        if _has_confirmed_overlap(db, booking.property_id, booking.start_date, booking.end_date):
+        if await db.run_sync(_has_confirmed_overlap, booking.property_id, booking.start_date, booking.end_date):
             return {"status": "overlap_conflict"}  # ignore/alert; do not confirm
 
         # Finalize using optimistic concurrency control
-        current_version = booking.version or 1
-        rows = (
-            db.query(models.Booking)
-            .filter(
-                models.Booking.id == booking.id,
-                models.Booking.version == current_version,
-                models.Booking.status == "pending_payment",
-            )
-            .update(
-                {
-                    models.Booking.status: "confirmed",
-                    models.Booking.version: current_version + 1,
-                },
-                synchronize_session=False,
-            )
-        )
-        if rows == 0:
+        outcome = await db.run_sync(_confirm_pending, booking)
+        if outcome == "overlap":
+            return {"status": "overlap_conflict"}  # another booking claimed a night first
+        if outcome == "stale":
             # Re-read to determine the latest state
-            db.rollback()  # rollback pending transaction to clear write intents
-            latest = db.query(models.Booking).get(booking.id)
+            latest = await db.get(models.Booking, booking.id, populate_existing=True)
             if latest and latest.status == "confirmed":
                 return {"status": "already_confirmed"}
             # Could retry limited times in a real system; here just surface a conflict-ish outcome
             return {"status": "version_conflict"}
-        db.commit()
         return {"status": "confirmed"}
 
     # Optionally log failures; do not error
@@ -0,0 +1,184 @@
+# Property metadata cache: owner, price and approval flag for hot listings, without a primary-key lookup per request.
+# Local tier is a bounded TTL/LRU per worker; an optional Redis tier (REDIS_ENABLED) is shared across workers and
+# guarded by per-property version stamps so invalidations win over in-flight refills.
+from __future__ import annotations
+
+import json
+from typing import Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .cache import MISSING, CommitInvalidator, SharedTier, TTLCache, env_int
+
+PROPERTY_CACHE_MAX_ENTRIES = env_int("PROPERTY_CACHE_MAX_ENTRIES", 10000)
+PROPERTY_CACHE_TTL_SECONDS = env_int("PROPERTY_CACHE_TTL_SECONDS", 30)
+# 0 disables the shared tier even when Redis is enabled
+PROPERTY_CACHE_REDIS_TTL_SECONDS = env_int("PROPERTY_CACHE_REDIS_TTL_SECONDS", 300)
+# Version keys outlive entries so a stamp never resets underneath a live entry
+VERSION_TTL_SECONDS = 86400
+ENTRY_KEY_PREFIX = "property:meta:"
+VERSION_KEY_PREFIX = "property:meta:ver:"
+
+
+class PropertyMeta:
+    """Fields handlers read for authorization and pricing; detached from any ORM session."""
+
+    __slots__ = ("id", "owner_id", "price_cents", "requires_approval")
+
+    def __init__(self, id: int, owner_id: Optional[int], price_cents: int, requires_approval: bool) -> None:
+        self.id = id
+        self.owner_id = owner_id
+        self.price_cents = price_cents
+        self.requires_approval = requires_approval
+
+    @classmethod
+    def from_model(cls, prop: models.Property) -> "PropertyMeta":
+        return cls(
+            id=prop.id,
+            owner_id=prop.owner_id,
+            price_cents=prop.price_cents or 0,
+            requires_approval=bool(prop.requires_approval),
+        )
+
+    def to_json(self, version: int) -> str:
+        return json.dumps(
+            {
+                "v": version,
+                "id": self.id,
+                "owner_id": self.owner_id,
+                "price_cents": self.price_cents,
+                "requires_approval": self.requires_approval,
+            }
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PropertyMeta":
+        return cls(
+            id=int(data["id"]),
+            owner_id=data.get("owner_id"),
+            price_cents=int(data.get("price_cents") or 0),
+            requires_approval=bool(data.get("requires_approval")),
+        )
+
+    def __repr__(self) -> str:
+        return f"PropertyMeta(id={self.id!r}, owner_id={self.owner_id!r})"
+
+
+_local = TTLCache(max_entries=PROPERTY_CACHE_MAX_ENTRIES, ttl_seconds=PROPERTY_CACHE_TTL_SECONDS)
+_shared = SharedTier("property_cache", PROPERTY_CACHE_REDIS_TTL_SECONDS)
+
+
+def _entry_key(property_id: int) -> str:
+    return f"{ENTRY_KEY_PREFIX}{property_id}"
+
+
+def _version_key(property_id: int) -> str:
+    return f"{VERSION_KEY_PREFIX}{property_id}"
+
+
+async def get_property_meta(db: AsyncSession, property_id: int) -> Optional[PropertyMeta]:
+    """
+    Resolve property metadata through the local tier, then Redis, then the database.
+
+    Behavior:
+    - Redis is read with one MGET of (version, entry); the entry counts only if its stamp matches
+      the current version.
+    - DB refills are written under the version read beforehand, so an invalidation that lands
+      mid-refill leaves a stale stamp that readers ignore. Invalidations run after commit, so a
+      refill stamped with the bumped version always read the committed row.
+    - Locally, a refill that started before an eviction is dropped (TTLCache.pop bumps the generation).
+    - Missing properties are not cached.
+    """
+    meta = _local.get(property_id)
+    if meta is not MISSING:
+        return meta
+
+    generation = _local.generation
+    version = 0
+    client = await _shared.async_client()
+    if client is not None:
+        try:
+            raw_version, raw_entry = await client.mget(_version_key(property_id), _entry_key(property_id))
+            version = int(raw_version or 0)
+            if raw_entry is not None:
+                data = json.loads(raw_entry)
+                if int(data.get("v", -1)) == version:
+                    meta = PropertyMeta.from_dict(data)
+                    _local.set(property_id, meta, generation=generation)
+                    return meta
+        except Exception as exc:
+            _shared.async_failed("get", exc, property_id=property_id)
+            client = None
+
+    prop = await db.get(models.Property, property_id)
+    if prop is None:
+        return None
+    meta = PropertyMeta.from_model(prop)
+    _local.set(property_id, meta, generation=generation)
+    if client is not None:
+        try:
+            await client.set(_entry_key(property_id), meta.to_json(version), ex=_shared.ttl_seconds)
+        except Exception as exc:
+            _shared.async_failed("set", exc, property_id=property_id)
+    return meta
+
+
+def _evict_local(property_ids: Iterable[int]) -> None:
+    for property_id in property_ids:
+        _local.pop(property_id)
+
+
+def _bump_versions(pipe, property_ids: Iterable[int]) -> None:
+    for property_id in property_ids:
+        pipe.incr(_version_key(property_id))
+        pipe.expire(_version_key(property_id), VERSION_TTL_SECONDS)
+
+
+def invalidate_properties(property_ids: Iterable[int]) -> None:
+    """
+    Evict properties from this worker and bump their shared version stamps (blocking Redis call).
+
+    Other workers' local entries age out within PROPERTY_CACHE_TTL_SECONDS.
+    """
+    ids = list(property_ids)
+    _evict_local(ids)
+    client = _shared.client()
+    if client is None or not ids:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        _bump_versions(pipe, ids)
+        pipe.execute()
+    except Exception as exc:
+        _shared.failed("invalidate", exc, property_ids=ids)
+
+
+async def async_invalidate_properties(property_ids: Iterable[int]) -> None:
+    """Event-loop variant of invalidate_properties(); evicts locally again once stamps are bumped."""
+    ids = list(property_ids)
+    client = await _shared.async_client()
+    if client is not None and ids:
+        try:
+            pipe = client.pipeline(transaction=False)
+            _bump_versions(pipe, ids)
+            await pipe.execute()
+        except Exception as exc:
+            _shared.async_failed("invalidate", exc, property_ids=ids)
+    # A local refill that read the shared tier before the bump landed is dropped here
+    _evict_local(ids)
+
+
+def reset() -> None:
+    """Clear the local tier (tests and admin tooling)."""
+    _local.clear()
+
+
+# Any ORM write to a property (owner transfer, price change, deletion) evicts its cached metadata once committed
+_invalidator = CommitInvalidator(
+    "property_cache.dirty",
+    invalidate_properties,
+    evict_local=_evict_local,
+    async_invalidate=async_invalidate_properties,
+)
+_invalidator.watch(models.Property, "after_update", "after_delete")
@@ -0,0 +1,165 @@
+# asyncio-native Redis Pub/Sub subscriber used for cross-process WebSocket fan-out.
+# Runs as a lifespan task on the server's event loop and subscribes per channel, only while
+# this process has local members for it, so workers stop receiving traffic for rooms they don't host.
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from .frames import Frame
+from .redis_client import get_async_redis, is_redis_enabled, report_async_redis_error
+
+# Namespaced logger for subscriber lifecycle and relay errors
+logger = logging.getLogger("staycircle.pubsub")
+
+# Receives each relayed frame on the event loop; must not block
+OnFrame = Callable[[Frame], object]
+
+
+class ChannelSubscriber:
+    """
+    Reference-counted channel subscriptions over one redis.asyncio PubSub connection.
+
+    Usage:
+    - acquire(channel) when a local member joins; the first reference subscribes.
+    - release(channel) when a member leaves; the last reference unsubscribes.
+    - start()/stop() from the application lifespan.
+    - route(prefix, handler) lets another feed share the connection; its frames bypass on_frame.
+
+    Resilience:
+    - Fail-open: with Redis disabled or unreachable, acquire/release only track references.
+    - On connection errors the listener reconnects with exponential backoff and re-subscribes
+      every channel that still has local members.
+    """
+    def __init__(self, on_frame: OnFrame, poll_timeout: float = 1.0) -> None:
+        self.on_frame = on_frame
+        # Channel prefix -> handler for feeds sharing this connection (chat rooms use on_frame)
+        self._routes: Dict[str, OnFrame] = {}
+        self.poll_timeout = poll_timeout
+        self._refs: Dict[str, int] = {}
+        self._pubsub = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._has_channels: Optional[asyncio.Event] = None
+
+    @property
+    def channels(self) -> list:
+        return list(self._refs)
+
+    def route(self, prefix: str, handler: OnFrame) -> None:
+        self._routes[prefix] = handler
+
+    def dispatch(self, frame: Frame) -> None:
+        for prefix, handler in self._routes.items():
+            if frame.channel.startswith(prefix):
+                handler(frame)
+                return
+        self.on_frame(frame)
+
+    async def start(self) -> None:
+        if not is_redis_enabled():
+            logger.info("redis.subscriber.disabled")
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._has_channels = asyncio.Event()
+        if self._refs:
+            self._has_channels.set()
+        self._task = asyncio.create_task(self._run(), name="redis-subscriber")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self._close_pubsub()
+
+    async def acquire(self, channel: str) -> None:
+        count = self._refs.get(channel, 0) + 1
+        self._refs[channel] = count
+        if count != 1:
+            return
+        if self._has_channels is not None:
+            self._has_channels.set()
+        pubsub = self._pubsub
+        if pubsub is not None:
+            try:
+                await pubsub.subscribe(channel)
+            except Exception as exc:
+                # The listener re-subscribes all live channels after it reconnects
+                logger.warning("redis.subscriber.subscribe_failed", extra={"channel": channel, "error": str(exc)})
+
+    async def release(self, channel: str) -> None:
+        count = self._refs.get(channel, 0) - 1
+        if count > 0:
+            self._refs[channel] = count
+            return
+        self._refs.pop(channel, None)
+        pubsub = self._pubsub
+        if pubsub is not None:
+            try:
+                await pubsub.unsubscribe(channel)
+            except Exception as exc:
+                logger.debug("redis.subscriber.unsubscribe_failed", extra={"channel": channel, "error": str(exc)})
+
+    async def _close_pubsub(self) -> None:
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def _run(self) -> None:
+        assert self._has_channels is not None
+        backoff = 0.5
+        max_backoff = 5.0
+        while True:
+            try:
+                # Idle until some room on this worker has members
+                await self._has_channels.wait()
+                r = await get_async_redis()
+                if r is None:
+                    await asyncio.sleep(min(backoff, max_backoff))
+                    backoff = min(max_backoff, backoff * 2)
+                    continue
+
+                pubsub = r.pubsub(ignore_subscribe_messages=True)
+                channels = list(self._refs)
+                if channels:
+                    await pubsub.subscribe(*channels)
+                self._pubsub = pubsub
+                # Rooms that gained members while the initial SUBSCRIBE was in flight
+                missing = [c for c in self._refs if c not in channels]
+                if missing:
+                    await pubsub.subscribe(*missing)
+                logger.info("redis.subscriber.started", extra={"channels": len(channels)})
+                backoff = 0.5  # reset on success
+
+                while True:
+                    if not self._refs:
+                        # Nothing to listen for; park until a room gains a member
+                        self._has_channels.clear()
+                        await self._close_pubsub()
+                        break
+                    message = await pubsub.get_message(timeout=self.poll_timeout)
+                    if message is None or message.get("type") != "message":
+                        continue
+                    try:
+                        frame = Frame.from_wire(message.get("channel"), message.get("data"))
+                        self.dispatch(frame)
+                    except Exception:
+                        # swallow and continue
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # reconnect with backoff
+                logger.warning("redis.subscriber.error", extra={"error": str(exc)})
+                report_async_redis_error(exc)
+                await self._close_pubsub()
+                await asyncio.sleep(min(backoff, max_backoff))
+                backoff = min(max_backoff, backoff * 2)
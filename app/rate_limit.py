@@ -1,20 +1,51 @@
-# Simple Redis-backed fixed-window rate limiter.
-# - Per-IP counters (no user coupling) to keep the dependency standalone.
-# - Keys: rl:v1:ip:{ip}:{scope} with a TTL-based fixed window.
+# Redis-backed rate limiter with pluggable engines per scope.
+# - gcra (default): generic cell rate algorithm in one EVALSHA round trip; smooth, with a small configurable burst.
+# - fixed: legacy fixed-window counters (SET NX EX/INCR/TTL, pipelined).
+# - hybrid: per-worker token buckets, reconciled with Redis window counters in background batches.
+# - Keys by client IP or, for authenticated callers, by user id (configurable per scope).
 # - Fail-open if Redis is unavailable, so the API remains usable in dev or outages.
+import asyncio
 import os
 import logging
-from typing import Callable, Literal, Optional
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, List, Literal, Optional, Tuple
 
 from fastapi import Request, HTTPException, status
 
-from .redis_client import get_redis, is_redis_enabled
+from .redis_client import get_async_redis, get_redis, is_redis_enabled, report_async_redis_error, report_redis_error
+from .redis_ops import AsyncRedisBatch, RedisBatch, evalsha, register_script
 
 # Namespaced logger for rate limiting diagnostics
 logger = logging.getLogger("staycircle.rate_limit")
 
 # Supported scopes with independent per-window limits (see _limit_for_scope)
 Scope = Literal["login", "signup", "write"]
+ENGINES = ("gcra", "fixed", "hybrid")
+KEY_BY = ("ip", "user")
+
+# GCRA: store each key's theoretical arrival time (TAT, ms). A request is admitted while TAT - burst <= now;
+# the Redis clock is used so all workers agree on "now".
+# KEYS[1] = bucket key; ARGV[1] = emission interval ms (window / limit); ARGV[2] = burst tolerance ms.
+# Returns {allowed (0/1), retry_after_ms}.
+GCRA_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - burst
+if allow_at > now then
+  return {0, allow_at - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, 0}
+"""
+register_script("gcra", GCRA_LUA)
 
 
 def _to_int(val: Optional[str], default: int) -> int:
@@ -24,6 +55,41 @@ def _to_int(val: Optional[str], default: int) -> int:
         return default
 
 
+def _to_float(val: Optional[str], default: float) -> float:
+    try:
+        return float(val) if val is not None else default
+    except Exception:
+        return default
+
+
+class TokenBucket:
+    """
+    Minimal token-bucket rate limiter.
+
+    Parameters:
+    - rate: tokens added per second
+    - capacity: maximum burst size
+
+    Calling consume(1) returns True if allowed; False if throttled.
+    """
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.ts = time.monotonic()
+
+    def consume(self, amount: float = 1.0) -> bool:
+        now = time.monotonic()
+        delta = now - self.ts
+        self.ts = now
+        # Refill tokens
+        self.tokens = min(self.capacity, self.tokens + delta * self.rate)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+
 # Window length in seconds; configured via RATE_LIMIT_WINDOW_SECONDS (default 60)
 def _window_seconds() -> int:
     return _to_int(os.getenv("RATE_LIMIT_WINDOW_SECONDS"), 60)
@@ -42,6 +108,59 @@ def _limit_for_scope(scope: Scope) -> int:
     return _to_int(os.getenv("RATE_LIMIT_WRITE_PER_WINDOW"), 30)
 
 
+# GCRA burst per scope: RATE_LIMIT_{SCOPE}_BURST, else RATE_LIMIT_BURST, else a fifth of the limit (at least 1).
+# Any rolling window admits at most limit + burst - 1 requests, so a large burst trades smoothness for slack.
+def _burst_for_scope(scope: Scope, limit: int) -> int:
+    default = _to_int(os.getenv("RATE_LIMIT_BURST"), max(1, limit // 5))
+    return max(1, _to_int(os.getenv(f"RATE_LIMIT_{scope.upper()}_BURST"), default))
+
+
+# Engine per scope: RATE_LIMIT_{SCOPE}_ENGINE, else RATE_LIMIT_ENGINE (default gcra)
+def _engine_for_scope(scope: Scope) -> str:
+    val = os.getenv(f"RATE_LIMIT_{scope.upper()}_ENGINE") or os.getenv("RATE_LIMIT_ENGINE") or "gcra"
+    val = val.strip().lower()
+    return val if val in ENGINES else "gcra"
+
+
+# Identity per scope: RATE_LIMIT_{SCOPE}_KEY_BY (ip|user). Writes default to user; login/signup are anonymous.
+def _key_by_for_scope(scope: Scope) -> str:
+    default = "user" if scope == "write" else "ip"
+    val = (os.getenv(f"RATE_LIMIT_{scope.upper()}_KEY_BY") or default).strip().lower()
+    return val if val in KEY_BY else default
+
+
+def _user_id_from_request(request: Request) -> Optional[int]:
+    """Best-effort caller id from the Bearer token; None for anonymous or invalid tokens."""
+    auth = request.headers.get("authorization")
+    if not auth:
+        return None
+    parts = auth.split(" ", 1)
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        return None
+    token = parts[1]
+    # Lazy imports: the auth routes depend on this module
+    from .user_cache import cached_token_subject
+    user_id = cached_token_subject(token)
+    if user_id is not None:
+        return user_id
+    from .routes.auth import decode_token
+    try:
+        sub = decode_token(token).get("sub")
+        return int(sub) if sub else None
+    except Exception:
+        # Invalid tokens are rejected by the auth dependency; limit them by IP meanwhile
+        return None
+
+
+def _identity(request: Request, key_by: str) -> Tuple[str, str]:
+    """Return (kind, value) for the limiter key; user-keyed scopes fall back to IP when anonymous."""
+    if key_by == "user":
+        user_id = _user_id_from_request(request)
+        if user_id is not None:
+            return "user", str(user_id)
+    return "ip", _client_ip(request)
+
+
 def _client_ip(request: Request) -> str:
     # Use the connection's remote address.
     # Does not parse X-Forwarded-For; behind a proxy, only trust forwarded headers when properly configured.
@@ -53,15 +172,245 @@ def _client_ip(request: Request) -> str:
     return "unknown"
 
 
+def _fixed_window(r, key: str, limit: int, window: int) -> Optional[int]:
+    """Fixed-window check in one pipelined round trip; returns retry_after seconds when over the limit, else None."""
+    batch = RedisBatch(r)
+    # SET NX starts the window with its TTL; INCR keeps that TTL
+    batch.command("set", key, 0, ex=window, nx=True)
+    i_count = batch.command("incr", key)
+    i_ttl = batch.command("ttl", key)
+    results = batch.execute()
+    if int(results[i_count]) > limit:
+        ttl = results[i_ttl]
+        return ttl if isinstance(ttl, int) and ttl > 0 else window
+    return None
+
+
+def _reject(scope: Scope, limit: int, window: int, retry_after: int, kind: str, ident: str) -> None:
+    detail = {
+        "error": "rate_limited",
+        "scope": scope,
+        "limit": limit,
+        "window_seconds": window,
+        "retry_after": retry_after,
+    }
+    if kind == "ip":
+        detail["ip"] = ident
+    else:
+        detail["user_id"] = int(ident)
+    raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail)
+
+
+def _gcra(r, key: str, limit: int, window: int, burst: int = 1) -> Optional[int]:
+    """
+    GCRA check in a single EVALSHA; returns retry_after seconds when over the limit, else None.
+
+    Requests are spaced one emission interval (window / limit) apart; up to `burst` may arrive back to back.
+    """
+    interval_ms = max(1, (window * 1000) // max(1, limit))
+    burst_ms = interval_ms * max(1, burst)
+    allowed, retry_ms = evalsha(r, "gcra", [key], [interval_ms, burst_ms])
+    if int(allowed):
+        return None
+    return max(1, -(-int(retry_ms) // 1000))
+
+
+class _LocalKey:
+    """Local state for one limiter key: its bucket plus the counts of the current window."""
+    __slots__ = ("bucket", "window_idx", "pending", "global_count", "blocked_until", "last_used")
+
+    def __init__(self, limit: int, window: int, window_idx: int) -> None:
+        self.bucket = TokenBucket(rate=limit / max(1, window), capacity=limit)
+        self.window_idx = window_idx
+        # Admitted here but not yet added to the Redis window counter
+        self.pending = 0
+        # Cluster-wide count for window_idx as of the last sync
+        self.global_count = 0
+        self.blocked_until = 0.0
+        self.last_used = 0.0
+
+
+class HybridLimiter:
+    """
+    In-process rate-limit tier with periodic Redis reconciliation.
+
+    Admission:
+    - Each key has a local TokenBucket (rate = limit / window, capacity = limit), so a request never
+      waits on Redis; the bucket alone keeps one worker within the per-key limit.
+
+    Reconciliation:
+    - Every sync_interval_ms a background task adds each key's admitted-but-unsynced count to a
+      wall-clock window counter in Redis (one pipelined INCRBY/EXPIRE pair per key) and reads back
+      the cluster-wide total.
+    - Once the total reaches limit * (1 + drift), the key is blocked on this worker until the window
+      ends; below that, the local bucket is clamped to the remaining global budget.
+    - Cluster-wide overshoot is therefore bounded by the drift allowance plus whatever other workers
+      admit within one sync interval.
+
+    Lifecycle:
+    - start()/stop() are called from application startup/shutdown; stop() flushes pending counts.
+    - Without Redis the task only prunes idle keys, and local buckets still enforce per-worker limits.
+    """
+    def __init__(self, sync_interval_ms: int = 250, drift: float = 0.1) -> None:
+        self.sync_interval = max(10, sync_interval_ms) / 1000.0
+        self.drift = max(0.0, drift)
+        # check() runs on the threadpool (sync dependency); the sync task runs on the event loop
+        self._lock = threading.Lock()
+        self._keys: Dict[str, _LocalKey] = {}
+        self._windows: Dict[str, int] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def _allowance(self, limit: int) -> int:
+        return limit + int(limit * self.drift)
+
+    def check(self, key: str, limit: int, window: int) -> Optional[int]:
+        """Local admission; returns retry_after seconds when over the limit, else None."""
+        now = time.time()
+        idx = int(now // window)
+        with self._lock:
+            st = self._keys.get(key)
+            if st is None:
+                st = self._keys[key] = _LocalKey(limit, window, idx)
+                self._windows[key] = window
+            elif st.window_idx != idx:
+                # New window: unsynced counts belonged to the previous window's counter
+                st.window_idx = idx
+                st.pending = 0
+                st.global_count = 0
+                st.blocked_until = 0.0
+            st.last_used = now
+            if st.blocked_until > now:
+                return max(1, -(-int((st.blocked_until - now) * 1000) // 1000))
+            if not st.bucket.consume(1.0):
+                wait = (1.0 - st.bucket.tokens) / st.bucket.rate if st.bucket.rate > 0 else window
+                return max(1, -(-int(wait * 1000) // 1000))
+            st.pending += 1
+            return None
+
+    def _drain(self) -> List[Tuple[str, int, int, int]]:
+        """Take (key, window_idx, count, window) for every key with unsynced admissions; drop idle keys."""
+        now = time.time()
+        batch: List[Tuple[str, int, int, int]] = []
+        with self._lock:
+            for key in list(self._keys):
+                st = self._keys[key]
+                window = self._windows[key]
+                if st.pending:
+                    batch.append((key, st.window_idx, st.pending, window))
+                    st.pending = 0
+                elif now - st.last_used > window:
+                    # Idle for a full window: the bucket has refilled, so the state carries no information
+                    del self._keys[key]
+                    del self._windows[key]
+        return batch
+
+    def _restore(self, batch: List[Tuple[str, int, int, int]]) -> None:
+        """Put back counts from a failed sync so they are retried on the next tick."""
+        with self._lock:
+            for key, idx, count, _ in batch:
+                st = self._keys.get(key)
+                if st is not None and st.window_idx == idx:
+                    st.pending += count
+
+    def _apply(self, key: str, window_idx: int, global_count: int) -> None:
+        """Fold the cluster-wide count for one key's window into its local state."""
+        with self._lock:
+            st = self._keys.get(key)
+            if st is None or st.window_idx != window_idx:
+                return
+            st.global_count = global_count
+            remaining = self._allowance(st.bucket.capacity) - global_count - st.pending
+            if remaining <= 0:
+                st.blocked_until = float((window_idx + 1) * self._windows[key])
+            elif st.bucket.tokens > remaining:
+                st.bucket.tokens = float(remaining)
+
+    async def sync_once(self) -> None:
+        batch = self._drain()
+        if not batch:
+            return
+        r = await get_async_redis()
+        if r is None:
+            # Redis disabled or unreachable: local buckets keep enforcing per-worker limits
+            return
+        try:
+            pipe = AsyncRedisBatch(r)
+            for key, idx, count, window in batch:
+                wkey = f"{key}:{idx}"
+                pipe.command("incrby", wkey, count)
+                pipe.command("expire", wkey, window * 2)
+            results = await pipe.execute()
+        except Exception as exc:
+            logger.warning("Rate limit sync failed (%d keys): %s", len(batch), exc)
+            report_async_redis_error(exc)
+            self._restore(batch)
+            return
+        for i, (key, idx, _, _) in enumerate(batch):
+            self._apply(key, idx, int(results[2 * i]))
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run(), name="rate-limit-sync")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            # Hand the last admissions to Redis so other workers see them
+            try:
+                await self.sync_once()
+            except Exception:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync_once()
+            except Exception as exc:
+                # Keep the task alive; counts are retried on the next tick
+                logger.warning("Rate limit sync error: %s", exc)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._windows.clear()
+
+
+# Tuning for the hybrid engine:
+# - RATE_LIMIT_SYNC_MS (default 250): how often local counts are reconciled with Redis
+# - RATE_LIMIT_DRIFT (default 0.1): fraction of the limit the cluster may exceed before keys are blocked
+hybrid_limiter = HybridLimiter(
+    sync_interval_ms=_to_int(os.getenv("RATE_LIMIT_SYNC_MS"), 250),
+    drift=_to_float(os.getenv("RATE_LIMIT_DRIFT"), 0.1),
+)
+
+
 def rate_limit(scope: Scope) -> Callable[[Request], None]:
     """
-    Fixed-window rate limiting using Redis counters.
+    Per-scope rate limiting using Redis.
+
+    Engines (RATE_LIMIT_{SCOPE}_ENGINE, else RATE_LIMIT_ENGINE; default gcra):
+    - gcra: admits `limit` requests per window as a smooth rate, plus up to `burst` back to back
+      (RATE_LIMIT_{SCOPE}_BURST, else RATE_LIMIT_BURST; default limit // 5, at least 1). Any rolling
+      window admits at most limit + burst - 1; one atomic script call per request.
+    - fixed: legacy fixed-window counter (one pipelined round trip; allows 2x bursts at window edges).
+    - hybrid: local token buckets with no Redis call per request; counts are reconciled with Redis in
+      background batches, so global enforcement is approximate (see HybridLimiter, RATE_LIMIT_DRIFT).
 
-    Scope:
-    - Per-IP only (no user coupling) to avoid auth dependencies.
+    Identity (RATE_LIMIT_{SCOPE}_KEY_BY = ip|user):
+    - write defaults to user (authenticated callers share a budget across IPs; anonymous falls back to IP).
+    - login/signup default to ip.
 
     Keys:
-    - rl:v1:ip:{ip}:{scope}
+    - gcra:  rl:v2:{ip|user}:{id}:{scope}
+    - fixed: rl:v1:{ip|user}:{id}:{scope}
+    - hybrid: rl:v3:{ip|user}:{id}:{scope}:{window index}
 
     Window and limits:
     - Window length: RATE_LIMIT_WINDOW_SECONDS (default 60s)
@@ -71,13 +420,26 @@ def rate_limit(scope: Scope) -> Callable[[Request], None]:
         * write:  RATE_LIMIT_WRITE_PER_WINDOW  (default 30)
 
     Behavior:
-    - On first hit in a window, the TTL is initialized; subsequent hits share the same expiry.
-    - If Redis is disabled or unavailable, the limiter fails open to preserve availability.
+    - If Redis is disabled or unavailable, the gcra and fixed engines fail open to preserve availability;
+      hybrid keeps enforcing per-worker limits from its local buckets.
     """
     window = _window_seconds()
     limit = _limit_for_scope(scope)
+    engine = _engine_for_scope(scope)
+    key_by = _key_by_for_scope(scope)
+    burst = _burst_for_scope(scope, limit)
+    check = partial(_gcra, burst=burst) if engine == "gcra" else _fixed_window
+    version = {"gcra": "v2", "fixed": "v1", "hybrid": "v3"}[engine]
 
     def _dependency(request: Request) -> None:
+        if engine == "hybrid":
+            # Local decision only, so it applies with or without Redis; the sync task reconciles with Redis
+            kind, ident = _identity(request, key_by)
+            retry_after = hybrid_limiter.check(f"rl:{version}:{kind}:{ident}:{scope}", limit, window)
+            if retry_after is not None:
+                _reject(scope, limit, window, retry_after, kind, ident)
+            return
+
         if not is_redis_enabled():
             return
 
@@ -86,30 +448,16 @@ def rate_limit(scope: Scope) -> Callable[[Request], None]:
             # Fail-open: Redis disabled or unreachable
             return
 
-        ip = _client_ip(request)
-        key = f"rl:v1:ip:{ip}:{scope}"
+        kind, ident = _identity(request, key_by)
+        key = f"rl:{version}:{kind}:{ident}:{scope}"
         try:
-            current = r.incr(key, amount=1)
-            if current == 1:
-                # Initialize TTL on first increment in this window
-                r.expire(key, window)
-            if current > limit:
-                ttl = r.ttl(key)
-                retry_after = ttl if isinstance(ttl, int) and ttl > 0 else window
-                detail = {
-                    "error": "rate_limited",
-                    "scope": scope,
-                    "ip": ip,
-                    "limit": limit,
-                    "window_seconds": window,
-                    "retry_after": retry_after,
-                }
-                raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail)
-        except HTTPException:
-            raise
+            retry_after = check(r, key, limit, window)
         except Exception as exc:
             # Fail open on Redis errors to avoid blocking requests
-            logger.warning("Rate limit fail-open (scope=%s, ip=%s): %s", scope, ip, exc)
+            logger.warning("Rate limit fail-open (scope=%s, %s=%s): %s", scope, kind, ident, exc)
+            report_redis_error(exc)
             return
+        if retry_after is not None:
+            _reject(scope, limit, window, retry_after, kind, ident)
 
     return _dependency
@@ -1,7 +1,11 @@
-# Redis client helper: opt-in, fail-open access to a shared Redis connection.
+# Redis client helper: opt-in, fail-open access to shared Redis connection pools.
 # Controlled by REDIS_ENABLED and REDIS_URL to keep other modules decoupled from Redis availability.
+# A circuit breaker keeps callers off Redis during an outage and retries with backoff, so the
+# process recovers without a restart.
 import logging
 import os
+import threading
+import time
 from typing import Optional
 
 # Module-scoped logger for connection/health messages
@@ -15,56 +19,249 @@ def _truthy(val: Optional[str]) -> bool:
     return val.strip().lower() in {"1", "true", "t", "yes", "y", "on"}
 
 
+def _to_float(val: Optional[str], default: float) -> float:
+    try:
+        return float(val) if val is not None else default
+    except Exception:
+        return default
+
+
 # Feature flag: enable Redis by setting REDIS_ENABLED to a truthy value
 def is_redis_enabled() -> bool:
     return _truthy(os.getenv("REDIS_ENABLED", "false"))
 
 
-# Cached client instance (if connected) and a one-shot initialization guard.
-# Once initialization is attempted (_initialized=True) and fails, we remain fail-open.
+# Connection settings (read when a pool is created):
+# - REDIS_URL (default redis://localhost:6379/0)
+# - REDIS_MAX_CONNECTIONS (default 50): per pool, i.e. per process for sync and asyncio each
+# - REDIS_SOCKET_TIMEOUT / REDIS_CONNECT_TIMEOUT in seconds (default 0.25)
+# - REDIS_HEALTH_CHECK_INTERVAL in seconds (default 30): idle connections are pinged before reuse
+def _pool_kwargs() -> dict:
+    return {
+        "max_connections": int(_to_float(os.getenv("REDIS_MAX_CONNECTIONS"), 50)),
+        "socket_timeout": _to_float(os.getenv("REDIS_SOCKET_TIMEOUT"), 0.25),
+        "socket_connect_timeout": _to_float(os.getenv("REDIS_CONNECT_TIMEOUT"), 0.25),
+        "retry_on_timeout": False,
+        "health_check_interval": int(_to_float(os.getenv("REDIS_HEALTH_CHECK_INTERVAL"), 30)),
+    }
+
+
+def _redis_url() -> str:
+    return os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class CircuitBreaker:
+    """
+    Tracks Redis health for one client and decides when callers may use it.
+
+    States:
+    - closed: Redis is used normally.
+    - open: callers get None (fail-open) until the backoff expires.
+    - half-open: after the backoff, one caller probes with PING; others stay off until it resolves.
+
+    Failures:
+    - A failed connect/PING opens the circuit immediately.
+    - Command errors reported via record_failure() open it after `threshold` failures that are each
+      within `window` seconds of the previous one.
+    - Backoff doubles on every failed probe, from min_backoff up to max_backoff.
+    """
+    def __init__(self, threshold: int = 3, window: float = 10.0, min_backoff: float = 1.0, max_backoff: float = 30.0) -> None:
+        self.threshold = max(1, threshold)
+        self.window = window
+        self.min_backoff = min_backoff
+        self.max_backoff = max(min_backoff, max_backoff)
+        self.backoff = min_backoff
+        self.failures = 0
+        self.trips = 0
+        self.is_open = False
+        self.open_until = 0.0
+        self.last_failure = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if not self.is_open:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def allow(self) -> bool:
+        """True while closed; when the backoff has expired, True for exactly one probing caller."""
+        with self._lock:
+            if not self.is_open:
+                return True
+            now = time.monotonic()
+            if now < self.open_until:
+                return False
+            # Half-open: this caller probes; hold the others off for another backoff period
+            self.open_until = now + self.backoff
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.is_open:
+                _logger.info("Redis circuit closed after %d failures", self.failures)
+            self.is_open = False
+            self.failures = 0
+            self.backoff = self.min_backoff
+
+    def record_failure(self, immediate: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self.last_failure > self.window:
+                self.failures = 0
+            self.last_failure = now
+            self.failures += 1
+            if self.is_open:
+                # Failed probe: back off further
+                self.backoff = min(self.max_backoff, self.backoff * 2)
+                self.open_until = now + self.backoff
+            elif immediate or self.failures >= self.threshold:
+                self.is_open = True
+                self.trips += 1
+                self.open_until = now + self.backoff
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "backoff_seconds": self.backoff,
+            }
+
+
+def _breaker_from_env() -> CircuitBreaker:
+    """
+    Breaker tuning:
+    - REDIS_BREAKER_THRESHOLD (default 3): reported command errors before the circuit opens
+    - REDIS_BREAKER_WINDOW_SECONDS (default 10): max gap between errors that still counts as consecutive
+    - REDIS_RETRY_MIN_SECONDS / REDIS_RETRY_MAX_SECONDS (default 1 / 30): reconnect backoff bounds
+    """
+    return CircuitBreaker(
+        threshold=int(_to_float(os.getenv("REDIS_BREAKER_THRESHOLD"), 3)),
+        window=_to_float(os.getenv("REDIS_BREAKER_WINDOW_SECONDS"), 10.0),
+        min_backoff=_to_float(os.getenv("REDIS_RETRY_MIN_SECONDS"), 1.0),
+        max_backoff=_to_float(os.getenv("REDIS_RETRY_MAX_SECONDS"), 30.0),
+    )
+
+
+# Sync pool/client and its breaker; the client is created once and survives outages (the pool reconnects).
+_pool = None
 _client = None
-_initialized = False
+_breaker = _breaker_from_env()
+_init_lock = threading.Lock()
 
 
 def get_redis():
     """
-    Return a Redis client if enabled and reachable; otherwise return None.
+    Return a Redis client if enabled and healthy; otherwise return None.
 
     Behavior:
-    - Lazy initialization on first call
+    - Lazy initialization on first call: one ConnectionPool per process, verified with PING
     - Fail-open on errors (do not raise), so downstream features can degrade gracefully
-    - After a failed attempt in this process, subsequent calls also return None
+    - While the circuit is open, return None without touching the network; after the backoff,
+      one caller re-PINGs and, on success, everyone gets the client again
     """
-    global _client, _initialized
+    global _pool, _client
     if not is_redis_enabled():
         return None
-    if _client is not None:
+    if _client is not None and not _breaker.is_open:
         return _client
-    if _initialized and _client is None:
-        # Previously attempted and failed; stay fail-open for this process lifetime
+    if not _breaker.allow():
         return None
 
-    # Connection URL; defaults to local Redis database 0
-    url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    with _init_lock:
+        if _client is not None and not _breaker.is_open:
+            return _client
+        url = _redis_url()
+        try:
+            # Import here to avoid import-time failures before dependencies are installed
+            import redis  # type: ignore
 
+            if _pool is None:
+                _pool = redis.ConnectionPool.from_url(url, **_pool_kwargs())
+            client = _client or redis.Redis(connection_pool=_pool)
+            # Ping to verify connectivity and credentials
+            client.ping()
+            _client = client
+            _breaker.record_success()
+            _logger.info("Connected to Redis at %s", url)
+            return _client
+        except Exception as exc:
+            _logger.warning("Redis unavailable (fail-open, retry in %.1fs): %s", _breaker.backoff, exc)
+            _breaker.record_failure(immediate=True)
+            return None
+
+
+def report_redis_error(exc: Optional[BaseException] = None) -> None:
+    """Record a failed command on the sync client; enough of them open the circuit."""
+    if exc is not None:
+        _logger.debug("Redis command error: %s", exc)
+    _breaker.record_failure()
+
+
+# asyncio client (redis.asyncio) for code running on the event loop; same fail-open and breaker
+# contract as get_redis(), with its own pool and breaker
+_async_pool = None
+_async_client = None
+_async_breaker = _breaker_from_env()
+
+
+async def get_async_redis():
+    """
+    Return a redis.asyncio client if enabled and healthy; otherwise return None.
+
+    Behavior mirrors get_redis(): lazy initialization, fail-open, and breaker-driven reconnection.
+    The client must only be used from the event loop that created it.
+    """
+    global _async_pool, _async_client
+    if not is_redis_enabled():
+        return None
+    if _async_client is not None and not _async_breaker.is_open:
+        return _async_client
+    if not _async_breaker.allow():
+        return None
+
+    url = _redis_url()
     try:
-        # Import here to avoid import-time failures before dependencies are installed
-        import redis  # type: ignore
-
-        _client = redis.Redis.from_url(
-            url,
-            socket_timeout=0.25,
-            socket_connect_timeout=0.25,
-            retry_on_timeout=False,
-            health_check_interval=0,
-        )
-        # Ping to verify connectivity and credentials
-        _client.ping()
-        _initialized = True
-        _logger.info("Connected to Redis at %s", url)
-        return _client
+        import redis.asyncio as aioredis  # type: ignore
+
+        if _async_pool is None:
+            _async_pool = aioredis.ConnectionPool.from_url(url, **_pool_kwargs())
+        client = _async_client or aioredis.Redis(connection_pool=_async_pool)
+        await client.ping()
+        _async_client = client
+        _async_breaker.record_success()
+        _logger.info("Connected to Redis (asyncio) at %s", url)
+        return _async_client
     except Exception as exc:
-        _logger.warning("Redis unavailable (fail-open): %s", exc)
-        _client = None
-        _initialized = True
+        _logger.warning("Redis (asyncio) unavailable (fail-open, retry in %.1fs): %s", _async_breaker.backoff, exc)
+        _async_breaker.record_failure(immediate=True)
         return None
+
+
+def report_async_redis_error(exc: Optional[BaseException] = None) -> None:
+    """Record a failed command on the asyncio client; enough of them open its circuit."""
+    if exc is not None:
+        _logger.debug("Redis (asyncio) command error: %s", exc)
+    _async_breaker.record_failure()
+
+
+def _pool_stats(pool) -> dict:
+    if pool is None:
+        return {"created": 0, "in_use": 0, "available": 0, "max": int(_to_float(os.getenv("REDIS_MAX_CONNECTIONS"), 50))}
+    return {
+        "created": getattr(pool, "_created_connections", 0),
+        "in_use": len(getattr(pool, "_in_use_connections", ()) or ()),
+        "available": len(getattr(pool, "_available_connections", ()) or ()),
+        "max": getattr(pool, "max_connections", None),
+    }
+
+
+def redis_stats() -> dict:
+    """Pool usage and breaker state for both clients (served by /healthz/redis)."""
+    return {
+        "enabled": is_redis_enabled(),
+        "sync": {"pool": _pool_stats(_pool), "breaker": _breaker.stats()},
+        "asyncio": {"pool": _pool_stats(_async_pool), "breaker": _async_breaker.stats()},
+    }
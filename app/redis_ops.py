@@ -0,0 +1,137 @@
+# Redis command layer: Lua scripts registered once and invoked by SHA, plus pipelined batches.
+# Callers queue script, counter and publish commands on a batch and pay one network round trip for all of them.
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List, Sequence, Tuple
+
+# name -> (sha1, source); scripts are loaded lazily on the first NOSCRIPT reply
+_SCRIPTS: Dict[str, Tuple[str, str]] = {}
+
+
+def register_script(name: str, lua: str) -> str:
+    """Register a Lua script under `name` and return its SHA1 (computed locally, no Redis call)."""
+    sha = hashlib.sha1(lua.encode("utf-8")).hexdigest()
+    _SCRIPTS[name] = (sha, lua)
+    return sha
+
+
+def _is_noscript(exc: BaseException) -> bool:
+    return str(exc).startswith("NOSCRIPT") or type(exc).__name__ == "NoScriptError"
+
+
+# Release a lock only if we still own it (token matches the current value)
+RELEASE_LOCK_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+else
+  return 0
+end
+"""
+register_script("release_lock", RELEASE_LOCK_LUA)
+
+
+def evalsha(r, name: str, keys: Sequence[Any], args: Sequence[Any]) -> Any:
+    """Run a registered script with EVALSHA, loading it once if the server does not know it yet."""
+    sha, lua = _SCRIPTS[name]
+    try:
+        return r.evalsha(sha, len(keys), *keys, *args)
+    except Exception as exc:
+        if not _is_noscript(exc):
+            raise
+        r.script_load(lua)
+        return r.evalsha(sha, len(keys), *keys, *args)
+
+
+async def async_evalsha(r, name: str, keys: Sequence[Any], args: Sequence[Any]) -> Any:
+    """asyncio variant of evalsha()."""
+    sha, lua = _SCRIPTS[name]
+    try:
+        return await r.evalsha(sha, len(keys), *keys, *args)
+    except Exception as exc:
+        if not _is_noscript(exc):
+            raise
+        await r.script_load(lua)
+        return await r.evalsha(sha, len(keys), *keys, *args)
+
+
+class RedisBatch:
+    """
+    Commands queued on a non-transactional pipeline and sent in one round trip.
+
+    Each queuing method returns the index of its reply in the list returned by execute().
+    Scripts go out as EVALSHA; if Redis replies NOSCRIPT (e.g., after a restart), the scripts are
+    loaded and only those calls are re-sent. The first other error is raised after the batch completes.
+    """
+    def __init__(self, r) -> None:
+        self._r = r
+        self._pipe = r.pipeline(transaction=False)
+        self._size = 0
+        self._scripts: List[Tuple[int, str, Sequence[Any], Sequence[Any]]] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _queued(self) -> int:
+        self._size += 1
+        return self._size - 1
+
+    def command(self, name: str, *args: Any, **kwargs: Any) -> int:
+        getattr(self._pipe, name)(*args, **kwargs)
+        return self._queued()
+
+    def script(self, name: str, keys: Sequence[Any], args: Sequence[Any]) -> int:
+        sha, _ = _SCRIPTS[name]
+        self._pipe.evalsha(sha, len(keys), *keys, *args)
+        idx = self._queued()
+        self._scripts.append((idx, name, keys, args))
+        return idx
+
+    def publish(self, channel: str, data: Any) -> int:
+        return self.command("publish", channel, data)
+
+    def execute(self) -> List[Any]:
+        if not self._size:
+            return []
+        results = self._pipe.execute(raise_on_error=False)
+        missing = [s for s in self._scripts if _is_noscript_result(results[s[0]])]
+        if missing:
+            for name in {s[1] for s in missing}:
+                self._r.script_load(_SCRIPTS[name][1])
+            retry = self._r.pipeline(transaction=False)
+            for _, name, keys, args in missing:
+                retry.evalsha(_SCRIPTS[name][0], len(keys), *keys, *args)
+            for (idx, _, _, _), res in zip(missing, retry.execute(raise_on_error=False)):
+                results[idx] = res
+        _raise_first_error(results)
+        return results
+
+
+class AsyncRedisBatch(RedisBatch):
+    """RedisBatch for the redis.asyncio client; queuing is identical, execute() is awaited."""
+
+    async def execute(self) -> List[Any]:  # type: ignore[override]
+        if not self._size:
+            return []
+        results = await self._pipe.execute(raise_on_error=False)
+        missing = [s for s in self._scripts if _is_noscript_result(results[s[0]])]
+        if missing:
+            for name in {s[1] for s in missing}:
+                await self._r.script_load(_SCRIPTS[name][1])
+            retry = self._r.pipeline(transaction=False)
+            for _, name, keys, args in missing:
+                retry.evalsha(_SCRIPTS[name][0], len(keys), *keys, *args)
+            for (idx, _, _, _), res in zip(missing, await retry.execute(raise_on_error=False)):
+                results[idx] = res
+        _raise_first_error(results)
+        return results
+
+
+def _is_noscript_result(res: Any) -> bool:
+    return isinstance(res, Exception) and _is_noscript(res)
+
+
+def _raise_first_error(results: List[Any]) -> None:
+    for res in results:
+        if isinstance(res, Exception):
+            raise res
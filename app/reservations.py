@@ -0,0 +1,71 @@
+# Per-night reservations: the database arbitrates booking conflicts instead of Redis locks.
+# Confirming a booking inserts one booking_nights row per night; the (property_id, night) key rejects
+# a conflicting confirmation atomically, in the same transaction as the status change.
+from __future__ import annotations
+
+import os
+from datetime import date, timedelta
+from typing import List
+
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+
+# Concurrency engine for booking writes (BOOKING_CONCURRENCY_ENGINE):
+# - lock (default): Redis range lock + SELECT ... FOR UPDATE on the property around the overlap check
+# - nights: no extra locks; the overlap check is advisory and the booking_nights insert at confirmation decides
+ENGINES = ("lock", "nights")
+
+
+def concurrency_engine() -> str:
+    val = (os.getenv("BOOKING_CONCURRENCY_ENGINE") or "lock").strip().lower()
+    return val if val in ENGINES else "lock"
+
+
+def uses_locks() -> bool:
+    return concurrency_engine() == "lock"
+
+
+class NightsTaken(Exception):
+    """Another confirmed booking already holds at least one of the nights."""
+
+
+def _nights(start_date: date, end_date: date) -> List[date]:
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days)]
+
+
+def claim_stmt(booking_id: int, property_id: int, start_date: date, end_date: date):
+    """INSERT of every night in [start_date, end_date); run with Session.execute or AsyncSession.execute."""
+    rows = [
+        {"property_id": property_id, "night": night, "booking_id": booking_id}
+        for night in _nights(start_date, end_date)
+    ]
+    return insert(models.BookingNight).values(rows)
+
+
+def release_stmt(booking_id: int):
+    """DELETE of a booking's nights (on cancellation of a confirmed booking)."""
+    return delete(models.BookingNight).where(models.BookingNight.booking_id == booking_id)
+
+
+def claim_nights(db, booking: models.Booking) -> None:
+    """
+    Claim a booking's nights inside the caller's (sync) transaction.
+
+    Raises NightsTaken on a conflict; the caller rolls back so the status change is undone too.
+    """
+    try:
+        db.execute(claim_stmt(booking.id, booking.property_id, booking.start_date, booking.end_date))
+        db.flush()
+    except IntegrityError as exc:
+        raise NightsTaken(str(exc.orig)) from exc
+
+
+async def async_claim_nights(db, booking: models.Booking) -> None:
+    """AsyncSession variant of claim_nights()."""
+    try:
+        await db.execute(claim_stmt(booking.id, booking.property_id, booking.start_date, booking.end_date))
+        await db.flush()
+    except IntegrityError as exc:
+        raise NightsTaken(str(exc.orig)) from exc
@@ -9,11 +9,13 @@ from typing import Optional
 import jwt
 from fastapi import APIRouter, Depends, HTTPException, Header, status
 from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..db import get_db
+from ..db import get_async_db, get_db
 from .. import models, schemas
 from ..rate_limit import rate_limit
+from ..user_cache import AuthenticatedUser, cached_token_subject, load_user, remember_token
 
 # Router namespace for auth endpoints
 router = APIRouter()
@@ -71,26 +73,41 @@ def bearer_token_from_auth_header(authorization: Optional[str]) -> str:
     return parts[1]
 
 
-def get_current_user(
-    db: Session = Depends(get_db),
-    authorization: Optional[str] = Header(default=None, alias="Authorization"),
-) -> models.User:
-    """Return the authenticated user or raise 401."""
-    token = bearer_token_from_auth_header(authorization)
-    payload = decode_token(token)
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    user = db.get(models.User, int(user_id))
+async def authenticate_token(db: AsyncSession, token: str) -> AuthenticatedUser:
+    """
+    Resolve a bearer token to its user, raising 401 on invalid tokens or unknown users.
+
+    Behavior:
+    - Tokens verified earlier by this worker skip signature checks until they (or the cache entry) expire.
+    - User records come from the user cache; the database is only hit on a miss.
+    """
+    user_id = cached_token_subject(token)
+    if user_id is None:
+        payload = decode_token(token)
+        sub = payload.get("sub")
+        if not sub:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+        user_id = int(sub)
+        remember_token(token, user_id, payload.get("exp"))
+    user = await load_user(db, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
 
 
-def get_current_user_optional(
-    db: Session = Depends(get_db),
+async def get_current_user(
+    db: AsyncSession = Depends(get_async_db),
     authorization: Optional[str] = Header(default=None, alias="Authorization"),
-) -> Optional[models.User]:
+) -> AuthenticatedUser:
+    """Return the authenticated user or raise 401."""
+    token = bearer_token_from_auth_header(authorization)
+    return await authenticate_token(db, token)
+
+
+async def get_current_user_optional(
+    db: AsyncSession = Depends(get_async_db),
+    authorization: Optional[str] = Header(default=None, alias="Authorization"),
+) -> Optional[AuthenticatedUser]:
     """
     Return the current user if a valid Bearer token is present; otherwise None.
 
@@ -100,26 +117,21 @@ def get_current_user_optional(
         return None
     try:
         token = bearer_token_from_auth_header(authorization)
-        payload = decode_token(token)
-        user_id = payload.get("sub")
-        if not user_id:
-            return None
-        user = db.get(models.User, int(user_id))
-        return user
+        return await authenticate_token(db, token)
     except HTTPException:
         # Treat invalid/missing tokens as anonymous for optional auth
         return None
 
 
 # Dependency: enforce landlord role
-def require_landlord(user: models.User = Depends(get_current_user)) -> models.User:
+async def require_landlord(user: AuthenticatedUser = Depends(get_current_user)) -> AuthenticatedUser:
     if user.role != "landlord":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Landlord role required")
     return user
 
 
 # Dependency: enforce tenant role
-def require_tenant(user: models.User = Depends(get_current_user)) -> models.User:
+async def require_tenant(user: AuthenticatedUser = Depends(get_current_user)) -> AuthenticatedUser:
     if user.role != "tenant":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Tenant role required")
     return user
@@ -2,16 +2,22 @@
 # Focus on concurrency safety (Redis locks, optimistic versioning) and clean error semantics.
 from __future__ import annotations
 
+from contextlib import nullcontext
 from datetime import date, datetime, timedelta, timezone
-from typing import List, Optional
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-
-from ..db import get_db
-from .. import models, schemas
-from ..locks import redis_try_lock
+from typing import AsyncContextManager, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import get_async_db
+from ..expiry import hold_expiry
+from .. import availability, models, outbox, reservations, schemas
+from ..locks import BOOKING_LOCK_WAIT_MS, async_redis_range_lock
+from ..property_cache import get_property_meta
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from ..rate_limit import rate_limit
+from ..user_cache import AuthenticatedUser
 from .auth import get_current_user, require_tenant, require_landlord
 import os
 from ..payments import create_payment_intent, retrieve_client_secret, stripe_enabled
@@ -28,27 +34,29 @@ def _validate_dates(start_date: date, end_date: date) -> None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must be before end_date")
 
 
-def _has_overlap(db: Session, property_id: int, start_date: date, end_date: date) -> bool:
+def _booking_guard(property_id: int, start_date: date, end_date: date) -> AsyncContextManager[bool]:
+    """
+    Cross-process guard around overlap check + write, per BOOKING_CONCURRENCY_ENGINE.
+
+    - lock: Redis range lock on the nights (bounded server-side wait)
+    - nights: no lock; the booking_nights insert at confirmation rejects conflicts atomically
+    """
+    if not reservations.uses_locks():
+        return nullcontext(True)
+    return async_redis_range_lock(property_id, start_date, end_date, ttl_ms=5000, wait_ms=BOOKING_LOCK_WAIT_MS)
+
+
+async def _has_overlap(db: AsyncSession, property_id: int, start_date: date, end_date: date) -> bool:
     """
     Return True if any confirmed booking overlaps [start_date, end_date).
 
-    Logic:
-    NOT (existing.end_date <= start_date OR existing.start_date >= end_date)
-    Only considers status='confirmed'.
+    Delegates to the availability index, which answers from memory when enabled and warm,
+    and otherwise runs the SQL overlap query (via run_sync, so the IO still awaits on the loop).
+    With the index, a "free" answer may trail other workers by up to its TTL; the hold it lets
+    through cannot be confirmed, because payment confirmation re-checks in SQL
+    (see payments._has_confirmed_overlap).
     """
-    exists = (
-        db.query(models.Booking.id)
-        .filter(
-            models.Booking.property_id == property_id,
-            models.Booking.status == "confirmed",
-            ~(
-                (models.Booking.end_date <= start_date)
-                | (models.Booking.start_date >= end_date)
-            ),
-        )
-        .first()
-    )
-    return exists is not None
+    return await db.run_sync(availability.has_overlap, property_id, start_date, end_date)
 
 
 @router.post(
@@ -57,10 +65,10 @@ def _has_overlap(db: Session, property_id: int, start_date: date, end_date: date
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(rate_limit("write"))],
 )
-def create_booking(
+async def create_booking(
     payload: schemas.BookingCreate,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(require_tenant),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(require_tenant),
 ) -> schemas.BookingCreateResponse:
     # Validate dates and derive number of nights
     _validate_dates(payload.start_date, payload.end_date)
@@ -69,18 +77,18 @@ def create_booking(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date range")
 
     # Ensure the property exists before proceeding
-    prop = db.get(models.Property, payload.property_id)
+    prop = await get_property_meta(db, payload.property_id)
     if not prop:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Property not found")
 
-    total_cents = (prop.price_cents or 0) * nights
+    total_cents = prop.price_cents * nights
     currency = "USD"
 
-    # Coarse per-property lock to limit cross-process races during availability checks and inserts
-    lock_key = f"lock:booking:property:{payload.property_id}"
-    with redis_try_lock(lock_key, ttl_ms=5000) as locked:
+    # Lock only the requested nights, so bookings for other dates at this property proceed in parallel;
+    # contended requests queue server-side for up to BOOKING_LOCK_WAIT_MS instead of retrying
+    async with _booking_guard(payload.property_id, payload.start_date, payload.end_date) as locked:
         if not locked:
-            # Another process is booking this property; instruct client to retry shortly
+            # Still held after the wait; instruct client to retry shortly
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail={"error": "busy", "retry_after": 1},
@@ -88,19 +96,23 @@ def create_booking(
 
         # Transactional sequence: optional row lock -> overlap check -> insert booking
         try:
-            # Attempt a row lock on the property where supported (skipped on SQLite)
+            # Attempt a row lock on the property where supported (skipped on SQLite and by the nights engine)
             try:
-                if str(db.bind.dialect.name) != "sqlite":
-                    db.query(models.Property).filter(models.Property.id == payload.property_id).with_for_update(nowait=False).first()
+                if reservations.uses_locks() and str(db.bind.dialect.name) != "sqlite":
+                    await db.execute(
+                        select(models.Property.id)
+                        .where(models.Property.id == payload.property_id)
+                        .with_for_update(nowait=False)
+                    )
             except Exception:
                 # Some dialects/drivers don't support FOR UPDATE; proceed without the row lock
                 pass
 
-            if _has_overlap(db, payload.property_id, payload.start_date, payload.end_date):
+            if await _has_overlap(db, payload.property_id, payload.start_date, payload.end_date):
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Dates overlap with an existing booking")
 
             now = datetime.now(timezone.utc)
-            if getattr(prop, "requires_approval", False):
+            if prop.requires_approval:
                 status_val = "requested"
                 expires_at = None
             else:
@@ -119,68 +131,112 @@ def create_booking(
                 version=1,
             )
             db.add(obj)
-            db.commit()
-            db.refresh(obj)
-
-            next_action: dict
-            if obj.status == "pending_payment":
-                # Ensure PaymentIntent exists and return client_secret
-                idem_key = f"booking:{obj.id}:v{obj.version or 1}"
-                if not obj.payment_intent_id:
-                    pi_id, client_secret = create_payment_intent(
-                        amount_cents=obj.total_cents,
-                        currency=obj.currency,
-                        booking_id=obj.id,
-                        property_id=obj.property_id,
-                        idempotency_key=idem_key,
-                    )
-                    obj.payment_intent_id = pi_id
-                    db.add(obj)
-                    db.commit()
-                else:
-                    # Reuse the existing PaymentIntent by retrieving its client_secret
-                    client_secret = retrieve_client_secret(obj.payment_intent_id)
-                next_action = {"type": "pay", "expires_at": obj.expires_at, "client_secret": client_secret}
-            else:
-                next_action = {"type": "await_approval"}
-
-            # Response includes the booking plus the next_action contract for the client
-            return {"booking": obj, "next_action": next_action}  # type: ignore[return-value]
+            # The outbox event commits atomically with the new booking
+            await outbox.async_enqueue(db, [obj])
+            await db.commit()
+            await db.refresh(obj)
+            availability.record_booking(obj)
+            await hold_expiry.schedule(obj.id, obj.expires_at)
         except HTTPException:
             # Bubble up API errors after rolling back if needed
-            db.rollback()
+            await db.rollback()
             raise
         except Exception as exc:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to create booking: {exc}")
 
+    # The hold is committed and the nights are unlocked: a slow payment gateway call from here on
+    # never delays other bookings for the same dates
+    try:
+        next_action: dict
+        if obj.status == "pending_payment":
+            # Ensure PaymentIntent exists and return client_secret
+            idem_key = f"booking:{obj.id}:v{obj.version or 1}"
+            if not obj.payment_intent_id:
+                pi_id, client_secret = await create_payment_intent(
+                    amount_cents=obj.total_cents,
+                    currency=obj.currency,
+                    booking_id=obj.id,
+                    property_id=obj.property_id,
+                    idempotency_key=idem_key,
+                )
+                obj.payment_intent_id = pi_id
+                db.add(obj)
+                await db.commit()
+            else:
+                # Reuse the existing PaymentIntent by retrieving its client_secret
+                client_secret = await retrieve_client_secret(obj.payment_intent_id)
+            next_action = {"type": "pay", "expires_at": obj.expires_at, "client_secret": client_secret}
+        else:
+            next_action = {"type": "await_approval"}
+
+        # Response includes the booking plus the next_action contract for the client
+        return {"booking": obj, "next_action": next_action}  # type: ignore[return-value]
+    except Exception as exc:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to create booking: {exc}")
+
 
 @router.get("/bookings/me", response_model=List[schemas.BookingRead])
-def list_my_bookings(
+async def list_my_bookings(
+    response: Response,
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
-    user: models.User = Depends(get_current_user),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor; enables keyset mode"),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(get_current_user),
 ) -> List[models.Booking]:
+    """
+    List the caller's bookings (tenant: own bookings; landlord: bookings on owned properties).
+
+    Ordering: start_date desc, id desc.
+
+    Pagination:
+    - Offset mode (default, kept for compatibility): limit + offset
+    - Keyset mode: pass the opaque `cursor` from the previous page's X-Next-Cursor header;
+      offset is ignored and each page is an index range seek on (start_date, id)
+    - X-Next-Cursor is set in both modes whenever another page exists
+    """
     if user.role == "tenant":
         q = (
-            db.query(models.Booking)
-            .filter(models.Booking.guest_id == user.id)
+            select(models.Booking)
+            .where(models.Booking.guest_id == user.id)
         )
     else:
         # Landlord: bookings for properties they own
         q = (
-            db.query(models.Booking)
+            select(models.Booking)
             .join(models.Property, models.Property.id == models.Booking.property_id)
-            .filter(models.Property.owner_id == user.id)
+            .where(models.Property.owner_id == user.id)
+        )
+
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        try:
+            after_start = date.fromisoformat(values["s"])
+            after_id = int(values["i"])
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        # Seek strictly past the last row of the previous page in (start_date desc, id desc) order
+        q = q.where(
+            or_(
+                models.Booking.start_date < after_start,
+                and_(models.Booking.start_date == after_start, models.Booking.id < after_id),
+            )
         )
+        offset = 0
 
-    items = (
+    # Fetch one extra row to learn whether another page exists
+    result = await db.execute(
         q.order_by(models.Booking.start_date.desc(), models.Booking.id.desc())
         .offset(offset)
-        .limit(limit)
-        .all()
+        .limit(limit + 1)
     )
+    items = list(result.scalars().all())
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"s": last.start_date.isoformat(), "i": last.id})
     return items
 
 
@@ -189,24 +245,23 @@ def list_my_bookings(
     response_model=schemas.BookingRead,
     dependencies=[Depends(rate_limit("write"))],
 )
-def approve_booking(
+async def approve_booking(
     booking_id: int,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(require_landlord),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(require_landlord),
 ) -> models.Booking:
-    obj = db.get(models.Booking, booking_id)
+    obj = await db.get(models.Booking, booking_id)
     if not obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
 
-    prop = db.get(models.Property, obj.property_id)
+    prop = await get_property_meta(db, obj.property_id)
     if not prop or prop.owner_id != user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to approve this booking")
 
     if obj.status != "requested":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only requested bookings can be approved")
 
-    lock_key = f"lock:booking:property:{obj.property_id}"
-    with redis_try_lock(lock_key, ttl_ms=5000) as locked:
+    async with _booking_guard(obj.property_id, obj.start_date, obj.end_date) as locked:
         if not locked:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -217,11 +272,14 @@ def approve_booking(
             obj.expires_at = datetime.now(timezone.utc) + timedelta(minutes=HOLD_MINUTES)
             obj.version = (obj.version or 1) + 1
             db.add(obj)
-            db.commit()
-            db.refresh(obj)
+            await outbox.async_enqueue(db, [obj])
+            await db.commit()
+            await db.refresh(obj)
+            availability.record_booking(obj)
+            await hold_expiry.schedule(obj.id, obj.expires_at)
             return obj
         except Exception as exc:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to approve booking: {exc}")
 
 
@@ -230,16 +288,16 @@ def approve_booking(
     response_model=schemas.BookingRead,
     dependencies=[Depends(rate_limit("write"))],
 )
-def decline_booking(
+async def decline_booking(
     booking_id: int,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(require_landlord),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(require_landlord),
 ) -> models.Booking:
-    obj = db.get(models.Booking, booking_id)
+    obj = await db.get(models.Booking, booking_id)
     if not obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
 
-    prop = db.get(models.Property, obj.property_id)
+    prop = await get_property_meta(db, obj.property_id)
     if not prop or prop.owner_id != user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to decline this booking")
 
@@ -251,11 +309,13 @@ def decline_booking(
         obj.cancel_reason = "declined"
         obj.version = (obj.version or 1) + 1
         db.add(obj)
-        db.commit()
-        db.refresh(obj)
+        await outbox.async_enqueue(db, [obj])
+        await db.commit()
+        await db.refresh(obj)
+        availability.record_booking(obj)
         return obj
     except Exception as exc:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to decline booking: {exc}")
 
 
@@ -264,12 +324,12 @@ def decline_booking(
     response_model=schemas.BookingRead,
     dependencies=[Depends(rate_limit("write"))],
 )
-def cancel_booking(
+async def cancel_booking(
     booking_id: int,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(get_current_user),
 ) -> models.Booking:
-    obj = db.get(models.Booking, booking_id)
+    obj = await db.get(models.Booking, booking_id)
     if not obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
 
@@ -280,21 +340,27 @@ def cancel_booking(
         if obj.guest_id != user.id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to cancel this booking")
     else:
-        prop = db.get(models.Property, obj.property_id)
+        prop = await get_property_meta(db, obj.property_id)
         if not prop or prop.owner_id != user.id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to cancel this booking")
 
     # Idempotent cancel: only mutate if not already in a terminal state (cancelled/declined/expired)
     if obj.status not in ("cancelled", "cancelled_expired", "declined"):
+        was_confirmed = obj.status == "confirmed"
         obj.status = "cancelled"
         obj.cancel_reason = obj.cancel_reason or "cancelled"
         obj.version = (obj.version or 1) + 1
         try:
             db.add(obj)
-            db.commit()
-            db.refresh(obj)
+            if was_confirmed:
+                # Free the nights in the same transaction as the status change
+                await db.execute(reservations.release_stmt(obj.id))
+            await outbox.async_enqueue(db, [obj])
+            await db.commit()
+            await db.refresh(obj)
+            availability.record_booking(obj)
         except Exception as exc:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to cancel booking: {exc}")
 
     return obj
@@ -0,0 +1,138 @@
+# WebSocket feed of booking status changes for guests and property owners.
+# Events come from the booking outbox relay over Redis Pub/Sub (one channel per user), sharing the chat
+# subscriber's connection, so every worker pushes to the sockets it holds; clients no longer poll.
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from ..db import AsyncSessionLocal
+from ..frames import BOOKING_CHANNEL_PREFIX, Frame, booking_channel, user_from_channel
+from ..outbox import set_local_sink
+from ..pubsub import ChannelSubscriber
+from ..user_cache import AuthenticatedUser
+from .auth import authenticate_token
+from .chat_ws import SendQueue, _get_token_from_ws, subscriber as chat_subscriber
+
+router = APIRouter()
+logger = logging.getLogger("staycircle.bookings_ws")
+
+# Sent instead of a backlog a slow client could not drain; the client refetches GET /bookings/me
+RESYNC_FRAME = json.dumps({"type": "resync", "feed": "bookings"})
+
+
+class BookingFeed:
+    """
+    Live booking sockets by user id.
+
+    - The first socket of a user subscribes to bookings:user:{id}; the last one unsubscribes.
+    - Each socket has a bounded SendQueue with the coalesce policy: status updates are state, so a
+      backlog is replaced by one resync marker instead of dropping individual transitions.
+    """
+    def __init__(self, subscriber: Optional[ChannelSubscriber] = None, queue_size: int = 32) -> None:
+        self.subscriber = subscriber
+        self.queue_size = queue_size
+        self.users: Dict[int, Dict[WebSocket, SendQueue]] = {}
+        self._lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def connect(self, user_id: int, websocket: WebSocket) -> SendQueue:
+        await websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        queue = SendQueue(websocket, None, self.queue_size, "coalesce", resync=RESYNC_FRAME)
+        async with self._lock:
+            sockets = self.users.setdefault(user_id, {})
+            sockets[websocket] = queue
+            if len(sockets) == 1 and self.subscriber is not None:
+                await self.subscriber.acquire(booking_channel(user_id))
+        return queue
+
+    async def disconnect(self, user_id: int, websocket: WebSocket) -> None:
+        async with self._lock:
+            sockets = self.users.get(user_id)
+            queue = sockets.pop(websocket, None) if sockets is not None else None
+            if sockets is not None and not sockets:
+                del self.users[user_id]
+                if self.subscriber is not None:
+                    await self.subscriber.release(booking_channel(user_id))
+        if queue is not None:
+            queue.stop()
+
+    def broadcast(self, frame: Frame) -> int:
+        """Queue a feed frame for every local socket of its user; never awaits."""
+        user_id = user_from_channel(frame.channel)
+        sockets = self.users.get(user_id) if user_id is not None else None
+        if not sockets:
+            return 0
+        queues = list(sockets.values())
+        for queue in queues:
+            queue.offer(frame.text)
+        return len(queues)
+
+    def deliver_threadsafe(self, frames: List[Frame]) -> None:
+        """Local sink for the outbox relay thread when Redis is disabled."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        for frame in frames:
+            loop.call_soon_threadsafe(self.broadcast, frame)
+
+
+# One feed per worker, fed by the shared Redis subscriber (or the local relay sink without Redis)
+feed = BookingFeed(chat_subscriber)
+chat_subscriber.route(BOOKING_CHANNEL_PREFIX, feed.broadcast)
+set_local_sink(feed.deliver_threadsafe)
+
+
+@router.websocket("/bookings")
+async def booking_updates(websocket: WebSocket) -> None:
+    """
+    Push booking status changes to the caller.
+
+    Authentication:
+    - JWT via 'Authorization: Bearer <token>' header or ?token= query parameter
+
+    Delivery:
+    - Tenants receive changes to their own bookings; landlords receive changes to bookings on their properties
+    - Server -> Client: {"type": "booking", "event_id", "booking_id", "property_id", "guest_id", "status",
+      "version", "start_date", "end_date"}; {"type": "resync", "feed": "bookings"} after a dropped backlog
+    - At-least-once and ordered per booking: apply a frame only if its version is newer than the one held
+    - Client messages are ignored
+    """
+    user: Optional[AuthenticatedUser] = None
+    try:
+        token = _get_token_from_ws(websocket)
+        if not token:
+            await websocket.close(code=1008)  # Policy violation
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                user = await authenticate_token(db, token)
+        except HTTPException:
+            await websocket.close(code=1008)
+            return
+        except Exception:
+            await websocket.close(code=1008)
+            return
+
+        await feed.connect(user.id, websocket)
+        logger.info("bookings.ws.connected", extra={"user_id": user.id, "role": user.role})
+
+        while True:
+            try:
+                await websocket.receive_text()
+            except WebSocketDisconnect:
+                break
+            except Exception:
+                break
+    finally:
+        try:
+            if user is not None:
+                await feed.disconnect(user.id, websocket)
+                logger.info("bookings.ws.disconnected", extra={"user_id": user.id, "role": user.role})
+        except Exception:
+            pass
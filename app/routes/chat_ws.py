@@ -1,162 +1,268 @@
 # WebSocket chat endpoints and Redis fan-out for per-property chat rooms.
-# Provides local in-process broadcast plus optional Redis Pub/Sub for multi-worker environments.
+# Provides local in-process broadcast plus optional Redis Pub/Sub (per-room subscriptions) for multi-worker environments.
 from __future__ import annotations
 
 import asyncio
 import json
 import logging
-import time
-from typing import Dict, Set, Optional
+import os
+from typing import Dict, List, Optional
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
 from starlette.websockets import WebSocketState
-from sqlalchemy.orm import Session
-import threading
-from ..redis_client import get_redis, is_redis_enabled
-
-from ..db import SessionLocal
-from .. import models
-from .auth import decode_token  # reuse JWT verification from REST
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..redis_client import get_async_redis, report_async_redis_error
+from ..redis_ops import AsyncRedisBatch
+
+from ..chat_writer import writer_from_env
+from ..frames import Frame, chat_channel
+from ..property_cache import get_property_meta
+from ..pubsub import ChannelSubscriber
+from ..rate_limit import TokenBucket
+from ..db import AsyncSessionLocal
+from ..user_cache import AuthenticatedUser
+from .auth import authenticate_token  # reuse JWT verification and the user cache from REST
 
 router = APIRouter()
 logger = logging.getLogger("staycircle.chat")
 
 
-class TokenBucket:
-    """
-    Minimal token-bucket rate limiter.
+# Slow-consumer policies applied when a connection's outbound queue is full:
+# - drop_oldest: discard the oldest queued frame to make room
+# - disconnect:  close the socket (1013 "try again later"); the client reconnects and refetches history
+# - coalesce:    replace the backlog with one {"type": "resync"} frame telling the client to refetch history
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "disconnect", "coalesce")
 
-    Parameters:
-    - rate: tokens added per second
-    - capacity: maximum burst size
 
-    Calling consume(1) returns True if allowed; False if throttled.
-    """
-    def __init__(self, rate: float, capacity: int) -> None:
-        self.rate = rate
-        self.capacity = capacity
-        self.tokens = float(capacity)
-        self.ts = time.monotonic()
-
-    def consume(self, amount: float = 1.0) -> bool:
-        now = time.monotonic()
-        delta = now - self.ts
-        self.ts = now
-        # Refill tokens
-        self.tokens = min(self.capacity, self.tokens + delta * self.rate)
-        if self.tokens >= amount:
-            self.tokens -= amount
-            return True
-        return False
+def _to_int(val: Optional[str], default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
 
 
-class ConnectionManager:
-    """
-    Track active connections by property and maintain per-connection rate limiters.
+def _slow_consumer_policy() -> str:
+    policy = os.getenv("CHAT_SLOW_CONSUMER_POLICY", "drop_oldest").strip().lower()
+    return policy if policy in SLOW_CONSUMER_POLICIES else "drop_oldest"
 
-    Thread-safety:
-    - Uses an asyncio.Lock to guard mutations to internal maps.
+
+# Close calls started from offer() (strong refs until they finish)
+_closing_tasks: Set["asyncio.Task[None]"] = set()
+
+
+class SendQueue:
     """
-    def __init__(self) -> None:
-        self.rooms: Dict[int, Set[WebSocket]] = {}
-        self.limiters: Dict[WebSocket, TokenBucket] = {}
-        self._lock = asyncio.Lock()
+    Bounded outbound queue plus a writer task for one WebSocket.
 
-    async def connect(self, property_id: int, websocket: WebSocket) -> None:
-        await websocket.accept()
-        async with self._lock:
-            self.rooms.setdefault(property_id, set()).add(websocket)
-            self.limiters[websocket] = TokenBucket(rate=1.0, capacity=5)
+    offer() never awaits, so a broadcast to a large room costs one enqueue per member and a slow
+    client only ever delays its own frames. Frames for a connection are sent in enqueue order.
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        property_id: Optional[int],
+        maxsize: int,
+        policy: str,
+        resync: Optional[str] = None,
+    ) -> None:
+        self.websocket = websocket
+        self.property_id = property_id
+        self.policy = policy
+        # Marker that replaces a coalesced backlog (defaults to the chat room resync frame)
+        self.resync = resync or json.dumps({"type": "resync", "property_id": property_id})
+        self.dropped = 0
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=maxsize)
+        self._closing = False
+        self._task: "asyncio.Task[None]" = asyncio.create_task(self._run(), name="ws-send")
+
+    def offer(self, text: str) -> None:
+        if self._closing:
+            return
+        try:
+            self._queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
 
-    async def disconnect(self, property_id: int, websocket: WebSocket) -> None:
-        async with self._lock:
-            if property_id in self.rooms:
-                self.rooms[property_id].discard(websocket)
-                if not self.rooms[property_id]:
-                    del self.rooms[property_id]
-            self.limiters.pop(websocket, None)
-
-    def get_limiter(self, websocket: WebSocket) -> Optional[TokenBucket]:
-        return self.limiters.get(websocket)
-
-    async def broadcast(self, property_id: int, message_text: str) -> None:
-        # Copy recipients to avoid iterating a mutating set
-        recipients = list(self.rooms.get(property_id, set()))
-        for ws in recipients:
+        self.dropped += 1
+        if self.policy == "disconnect":
+            self._closing = True
+            logger.warning("chat.ws.slow_consumer.disconnect", extra={"property_id": self.property_id})
+            task = asyncio.create_task(self._close(code=1013))
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+        elif self.policy == "coalesce":
+            # Collapse the backlog into a single resync marker; frames queued afterwards still flow
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(self.resync)
+        else:
+            self._queue.get_nowait()
+            self._queue.put_nowait(text)
+
+    async def _run(self) -> None:
+        ws = self.websocket
+        while True:
+            text = await self._queue.get()
             try:
-                if ws.application_state == WebSocketState.CONNECTED:
-                    await ws.send_text(message_text)
+                if ws.application_state != WebSocketState.CONNECTED:
+                    return
+                await ws.send_text(text)
             except Exception:
-                # Best-effort cleanup
-                try:
-                    await ws.close()
-                except Exception:
-                    pass
+                # Best-effort cleanup; the receive loop will observe the disconnect
+                await self._close(code=1011)
+                return
+
+    async def _close(self, code: int) -> None:
+        self._closing = True
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        self._closing = True
+        self._task.cancel()
 
 
-manager = ConnectionManager()
+class Connection:
+    """Per-socket state: the socket, its message limiter and its outbound queue."""
 
+    __slots__ = ("websocket", "property_id", "limiter", "queue")
 
-def start_redis_subscriber(loop: asyncio.AbstractEventLoop) -> None:
+    def __init__(self, websocket: WebSocket, property_id: int, queue_size: int, policy: str) -> None:
+        self.websocket = websocket
+        self.property_id = property_id
+        self.limiter = TokenBucket(rate=1.0, capacity=5)
+        self.queue = SendQueue(websocket, property_id, queue_size, policy)
+
+
+class Room:
     """
-    Start a daemon thread that subscribes to 'chat:property:*' and relays messages to local WebSocket clients.
+    Members of one property's chat room.
 
-    Behavior:
-    - Best-effort fail-open with exponential backoff when Redis is unavailable.
-    - Parses property_id from payload or channel name and schedules a broadcast on the given event loop.
+    The lock serializes join/leave (and the matching subscribe/unsubscribe) for this room only.
     """
-    if not is_redis_enabled():
-        logger.info("redis.subscriber.disabled")
-        return
 
-    def _run() -> None:
-        backoff = 0.5
-        max_backoff = 5.0
+    __slots__ = ("property_id", "members", "lock")
+
+    def __init__(self, property_id: int) -> None:
+        self.property_id = property_id
+        self.members: Dict[WebSocket, Connection] = {}
+        self.lock = asyncio.Lock()
+
+
+class ConnectionManager:
+    """
+    Track active connections by property; each connection record carries its rate limiter and queue.
+
+    Concurrency:
+    - State is sharded into per-room objects with their own asyncio.Lock, so connect/disconnect
+      storms in one room never wait on another.
+    - Broadcasts never take a lock; they iterate a snapshot of the room's members.
+    """
+    def __init__(self, subscriber: Optional[ChannelSubscriber] = None) -> None:
+        self.subscriber = subscriber
+        self.rooms: Dict[int, Room] = {}
+        self.queue_size = _to_int(os.getenv("CHAT_SEND_QUEUE_SIZE"), 64)
+        self.policy = _slow_consumer_policy()
+
+    async def connect(self, property_id: int, websocket: WebSocket) -> Connection:
+        await websocket.accept()
+        conn = Connection(websocket, property_id, self.queue_size, self.policy)
         while True:
-            try:
-                r = get_redis()
-                if r is None:
-                    time.sleep(min(backoff, max_backoff))
-                    backoff = min(max_backoff, backoff * 2)
+            room = self.rooms.get(property_id)
+            if room is None:
+                room = self.rooms[property_id] = Room(property_id)
+            async with room.lock:
+                if self.rooms.get(property_id) is not room:
+                    # The room emptied and was retired while we waited; join its successor
                     continue
+                first_member = not room.members
+                room.members[websocket] = conn
+                if first_member and self.subscriber is not None:
+                    # Start receiving cross-process traffic for this room
+                    await self.subscriber.acquire(chat_channel(property_id))
+            return conn
 
-                pubsub = r.pubsub()
-                pubsub.psubscribe("chat:property:*")
-                logger.info("redis.subscriber.started", extra={})
-                backoff = 0.5  # reset on success
-                for message in pubsub.listen():
-                    if message is None:
-                        continue
-                    if message.get("type") != "pmessage":
-                        continue
-                    data = message.get("data")
-                    try:
-                        if isinstance(data, bytes):
-                            data_str = data.decode("utf-8")
-                        else:
-                            data_str = str(data)
-                        # Broadcast payload as-is; clients de-dup by id if needed
-                        # Extract property_id for routing
-                        try:
-                            payload = json.loads(data_str)
-                            prop_id = int(payload.get("property_id"))
-                        except Exception:
-                            # Fallback parse from channel if payload missing or malformed
-                            channel = message.get("channel")
-                            if isinstance(channel, bytes):
-                                channel = channel.decode("utf-8")
-                            prop_id = int(str(channel).split(":")[-1])
-                        asyncio.run_coroutine_threadsafe(manager.broadcast(prop_id, data_str), loop)
-                    except Exception:
-                        # swallow and continue
-                        continue
-            except Exception:
-                # reconnect with backoff
-                time.sleep(min(backoff, max_backoff))
-                backoff = min(max_backoff, backoff * 2)
+    async def disconnect(self, property_id: int, websocket: WebSocket) -> None:
+        room = self.rooms.get(property_id)
+        conn: Optional[Connection] = None
+        if room is not None:
+            async with room.lock:
+                conn = room.members.pop(websocket, None)
+                if conn is not None and not room.members:
+                    if self.rooms.get(property_id) is room:
+                        del self.rooms[property_id]
+                    if self.subscriber is not None:
+                        await self.subscriber.release(chat_channel(property_id))
+        if conn is not None:
+            conn.queue.stop()
+
+    def get_connection(self, property_id: int, websocket: WebSocket) -> Optional[Connection]:
+        room = self.rooms.get(property_id)
+        return room.members.get(websocket) if room is not None else None
+
+    def get_limiter(self, property_id: int, websocket: WebSocket) -> Optional[TokenBucket]:
+        conn = self.get_connection(property_id, websocket)
+        return conn.limiter if conn is not None else None
+
+    @staticmethod
+    def send_personal(conn: Optional[Connection], message_text: str) -> bool:
+        """Queue a frame for one connection; False if there is no registered connection."""
+        if conn is None:
+            return False
+        conn.queue.offer(message_text)
+        return True
+
+    def broadcast(self, frame: Frame) -> int:
+        """
+        Queue a pre-serialized frame for every local member of its room; returns the recipient count.
+
+        Never awaits: each connection's writer task performs the actual send, and all recipients
+        share the frame's single text buffer.
+        """
+        if frame.room is None:
+            return 0
+        room = self.rooms.get(frame.room)
+        if room is None:
+            return 0
+        members = list(room.members.values())
+        for conn in members:
+            conn.queue.offer(frame.text)
+        return len(members)
+
+
+# Redis fan-out for rooms hosted by this worker; frames are relayed straight into the local broadcast
+subscriber = ChannelSubscriber(on_frame=lambda frame: manager.broadcast(frame))
+manager = ConnectionManager(subscriber)
+
+
+async def _fan_out(messages: List[dict]) -> None:
+    """
+    Deliver a committed batch: local broadcast plus optional Redis publish for cross-process fan-out.
 
-    t = threading.Thread(target=_run, name="redis-subscriber", daemon=True)
-    t.start()
+    All PUBLISH commands for the batch go out in one pipelined round trip.
+    """
+    frames = [Frame.from_message(out["property_id"], out) for out in messages]
+    for frame in frames:
+        manager.broadcast(frame)
+    if not frames:
+        return
+    try:
+        r = await get_async_redis()
+        if r is not None:
+            batch = AsyncRedisBatch(r)
+            for frame in frames:
+                batch.publish(frame.channel, frame.data)
+            await batch.execute()
+    except Exception as exc:
+        logger.warning("redis.publish.failed", extra={"rooms": sorted({f.room for f in frames})})
+        report_async_redis_error(exc)
+
+
+# Group-commit writer shared by all chat connections in this process (started/stopped with the app)
+message_writer = writer_from_env(on_commit=_fan_out)
 
 
 def _get_token_from_ws(websocket: WebSocket) -> Optional[str]:
@@ -173,7 +279,7 @@ def _get_token_from_ws(websocket: WebSocket) -> Optional[str]:
     return None
 
 
-def _load_user_and_authorize(db: Session, token: str, property_id: int) -> models.User:
+async def _load_user_and_authorize(db: AsyncSession, token: str, property_id: int) -> AuthenticatedUser:
     """
     Validate JWT, load the user and property, and enforce authorization rules.
 
@@ -181,17 +287,13 @@ def _load_user_and_authorize(db: Session, token: str, property_id: int) -> model
     - tenant: may join any property's chat
     - landlord: must own the property
     """
-    # Decode JWT
-    payload = decode_token(token)  # raises HTTPException(401) on failure
-    sub = payload.get("sub")
-    if not sub:
-        raise RuntimeError("Invalid token payload (no sub)")
-
-    user = db.get(models.User, int(sub))
-    if not user:
-        raise RuntimeError("User not found")
+    # Verify the token and resolve the user through the user cache
+    try:
+        user = await authenticate_token(db, token)
+    except HTTPException as exc:
+        raise RuntimeError(exc.detail) from exc
 
-    prop = db.get(models.Property, property_id)
+    prop = await get_property_meta(db, property_id)
     if not prop:
         raise RuntimeError("Property not found")
 
@@ -228,8 +330,8 @@ async def property_chat(websocket: WebSocket, property_id: int) -> None:
     - Per-connection 1 msg/s with burst capacity of 5
     """
     # Perform authentication and authorization before accept
-    db: Session = SessionLocal()
-    user: Optional[models.User] = None
+    user: Optional[AuthenticatedUser] = None
+    conn: Optional[Connection] = None
     try:
         token = _get_token_from_ws(websocket)
         if not token:
@@ -237,7 +339,9 @@ async def property_chat(websocket: WebSocket, property_id: int) -> None:
             return
 
         try:
-            user = _load_user_and_authorize(db, token, property_id)
+            # Short-lived session: no DB connection is held while the socket idles
+            async with AsyncSessionLocal() as db:
+                user = await _load_user_and_authorize(db, token, property_id)
         except PermissionError:
             await websocket.close(code=1008)
             return
@@ -249,7 +353,7 @@ async def property_chat(websocket: WebSocket, property_id: int) -> None:
             await websocket.close(code=1008)
             return
 
-        await manager.connect(property_id, websocket)
+        conn = await manager.connect(property_id, websocket)
         logger.info(
             "chat.ws.connected",
             extra={"property_id": property_id, "user_id": user.id, "role": user.role},
@@ -269,62 +373,38 @@ async def property_chat(websocket: WebSocket, property_id: int) -> None:
             try:
                 payload = json.loads(raw)
             except Exception:
-                await _send_ws_error(websocket, "invalid_json", "Payload must be JSON")
+                await _send_ws_error(websocket, "invalid_json", "Payload must be JSON", conn)
                 continue
 
             text = payload.get("text")
             if not isinstance(text, str):
-                await _send_ws_error(websocket, "invalid_payload", "Missing 'text' string")
+                await _send_ws_error(websocket, "invalid_payload", "Missing 'text' string", conn)
                 continue
 
             text = text.strip()
             if not (1 <= len(text) <= 1000):
-                await _send_ws_error(websocket, "invalid_text", "Text length must be 1..1000")
+                await _send_ws_error(websocket, "invalid_text", "Text length must be 1..1000", conn)
                 continue
 
             # Rate-limit per connection
-            limiter = manager.get_limiter(websocket)
-            if limiter is None or not limiter.consume(1.0):
-                await _send_ws_error(websocket, "rate_limited", "Too many messages")
+            if not conn.limiter.consume(1.0):
+                await _send_ws_error(websocket, "rate_limited", "Too many messages", conn)
                 continue
 
-            # Persist and broadcast
+            # Persist via the group-commit writer; it broadcasts once the batch is committed
             try:
-                msg = models.Message(property_id=property_id, sender_id=user.id, text=text)
-                db.add(msg)
-                db.commit()
-                db.refresh(msg)
+                out = await message_writer.submit(property_id, user.id, text)
             except Exception:
-                db.rollback()
-                await _send_ws_error(websocket, "server_error", "Failed to persist message")
+                await _send_ws_error(websocket, "server_error", "Failed to persist message", conn)
                 continue
 
-            out = {
-                "id": msg.id,
-                "property_id": msg.property_id,
-                "sender_id": msg.sender_id,
-                "text": msg.text,
-                "created_at": msg.created_at.isoformat() if msg.created_at else None,
-            }
-            out_text = json.dumps(out)
-
-            await manager.broadcast(property_id, out_text)
-            # Optional Redis publish for cross-process fan-out
-            try:
-                r = get_redis()
-                if r is not None:
-                    channel = f"chat:property:{property_id}"
-                    r.publish(channel, out_text)
-            except Exception:
-                logger.warning("redis.publish.failed", extra={"property_id": property_id})
-
             logger.info(
                 "chat.ws.message",
                 extra={
                     "property_id": property_id,
                     "user_id": user.id,
                     "role": user.role,
-                    "message_id": msg.id,
+                    "message_id": out["id"],
                 },
             )
 
@@ -338,15 +418,19 @@ async def property_chat(websocket: WebSocket, property_id: int) -> None:
                 )
         except Exception:
             pass
-        db.close()
 
 
-async def _send_ws_error(ws: WebSocket, code: str, message: str) -> None:
+async def _send_ws_error(ws: WebSocket, code: str, message: str, conn: Optional[Connection] = None) -> None:
     """
     Send a structured error frame to the client; close the socket on failure.
+
+    Registered connections go through their send queue so errors stay ordered with broadcasts.
     """
+    text = json.dumps({"type": "error", "code": code, "message": message})
+    if manager.send_personal(conn, text):
+        return
     try:
-        await ws.send_text(json.dumps({"type": "error", "code": code, "message": message}))
+        await ws.send_text(text)
     except Exception:
         try:
             await ws.close(code=1008)
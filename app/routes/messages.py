@@ -4,11 +4,14 @@ from typing import List, Optional
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_db
+from ..db import get_async_db
 from .. import models, schemas
+from ..property_cache import get_property_meta
 from .auth import get_current_user
+from ..user_cache import AuthenticatedUser
 
 # Router namespace for message history APIs
 router = APIRouter()
@@ -17,12 +20,12 @@ logger = logging.getLogger("staycircle.chat")
 
 
 @router.get("/messages", response_model=List[schemas.MessageRead])
-def list_messages(
+async def list_messages(
     property_id: int = Query(..., ge=1),
     limit: int = Query(50, ge=1, le=100),
     since_id: Optional[int] = Query(None, ge=1),
-    db: Session = Depends(get_db),
-    user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthenticatedUser = Depends(get_current_user),
 ) -> List[schemas.MessageRead]:
     """
     Return chat history for a property.
@@ -38,7 +41,7 @@ def list_messages(
     - since_id: return messages with id strictly greater than this value
     """
     # Validate property exists
-    prop = db.get(models.Property, property_id)
+    prop = await get_property_meta(db, property_id)
     if not prop:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Property not found")
 
@@ -52,13 +55,13 @@ def list_messages(
     else:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-    q = db.query(models.Message).filter(models.Message.property_id == property_id)
+    q = select(models.Message).where(models.Message.property_id == property_id)
     if since_id is not None:
-        q = q.filter(models.Message.id > since_id)
+        q = q.where(models.Message.id > since_id)
 
     q = q.order_by(models.Message.created_at.asc(), models.Message.id.asc()).limit(limit)
 
-    items = q.all()
+    items = (await db.execute(q)).scalars().all()
 
     logger.info(
         "messages.history",
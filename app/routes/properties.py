@@ -1,39 +1,140 @@
 # Property listing endpoints.
 # Landlords can manage their own listings; tenants/public can browse all listings.
+import hashlib
+import os
+from datetime import date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
+from ..cache import MISSING, CommitInvalidator, TTLCache
 from ..db import get_db
-from .. import models, schemas
+from .. import availability, models, schemas
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from .auth import require_landlord, get_current_user_optional
 from ..rate_limit import rate_limit
+from ..user_cache import AuthenticatedUser
 
 # Router namespace for property APIs
 router = APIRouter()
 
+# Longest calendar window served in one request (nights)
+MAX_AVAILABILITY_NIGHTS = 366
+
+# Page size used when a cursor is given without an explicit limit
+DEFAULT_PAGE_SIZE = 50
+
+# Read-through cache of serialized listing pages; entries age out after PROPERTIES_CACHE_TTL_SECONDS
+# (bounds staleness across worker processes) and are dropped locally whenever a property write commits.
+_listing_cache = TTLCache(
+    max_entries=int(os.getenv("PROPERTIES_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("PROPERTIES_CACHE_TTL_SECONDS", "15")),
+)
+_property_list_adapter = TypeAdapter(List[schemas.PropertyRead])
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match may carry a list of (possibly weak) validators, or '*'
+    if not if_none_match:
+        return False
+    candidates = {c.strip() for c in if_none_match.split(",")}
+    if "*" in candidates:
+        return True
+    return etag in candidates or f"W/{etag}" in candidates
+
 
 @router.get("/properties", response_model=List[schemas.PropertyRead])
-def list_properties(db: Session = Depends(get_db), user: Optional[models.User] = Depends(get_current_user_optional)):
+def list_properties(
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor"),
+    min_price_cents: Optional[int] = Query(None, ge=0),
+    max_price_cents: Optional[int] = Query(None, ge=0),
+    requires_approval: Optional[bool] = Query(None),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+    db: Session = Depends(get_db),
+    user: Optional[AuthenticatedUser] = Depends(get_current_user_optional),
+) -> Response:
     """
-    List properties.
+    List properties, newest first.
 
     Behavior:
     - If caller is a landlord, return only their properties (owner_id == user.id).
     - Otherwise, return all properties.
-    Ordered by newest first.
+    - Optional filters: min_price_cents / max_price_cents (inclusive) and requires_approval.
+
+    Pagination:
+    - Without `limit` or `cursor` every matching property is returned, as before pagination existed.
+    - With either, keyset on id desc (`limit` defaults to DEFAULT_PAGE_SIZE); pass the X-Next-Cursor
+      header value of the previous page as `cursor`.
+
+    Caching:
+    - Serialized pages are cached per (scope, filters, cursor, limit) for PROPERTIES_CACHE_TTL_SECONDS
+      and dropped on every committed property insert/update/delete.
+    - Responses carry an ETag; a matching If-None-Match returns 304 without a body.
     """
-    if user and user.role == "landlord":
-        items = (
-            db.query(models.Property)
-            .filter(models.Property.owner_id == user.id)
-            .order_by(models.Property.id.desc())
-            .all()
-        )
-    else:
-        items = db.query(models.Property).order_by(models.Property.id.desc()).all()
-    return items
+    after_id: Optional[int] = None
+    if cursor is not None:
+        try:
+            after_id = int(decode_cursor(cursor)["i"])
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        if limit is None:
+            limit = DEFAULT_PAGE_SIZE
+
+    owner_id = user.id if user and user.role == "landlord" else None
+    key = (owner_id, after_id, limit, min_price_cents, max_price_cents, requires_approval)
+    cached = _listing_cache.get(key)
+    if cached is MISSING:
+        # Read-through: capture the generation first so a concurrent property write wins
+        generation = _listing_cache.generation
+        q = db.query(models.Property)
+        if owner_id is not None:
+            q = q.filter(models.Property.owner_id == owner_id)
+        if after_id is not None:
+            q = q.filter(models.Property.id < after_id)
+        if min_price_cents is not None:
+            q = q.filter(models.Property.price_cents >= min_price_cents)
+        if max_price_cents is not None:
+            q = q.filter(models.Property.price_cents <= max_price_cents)
+        if requires_approval is not None:
+            q = q.filter(models.Property.requires_approval == requires_approval)
+        q = q.order_by(models.Property.id.desc())
+        next_cursor = None
+        if limit is None:
+            items = q.all()
+        else:
+            # Fetch one extra row to learn whether another page exists
+            items = q.limit(limit + 1).all()
+            if len(items) > limit:
+                items = items[:limit]
+                next_cursor = encode_cursor({"i": items[-1].id})
+        body = _property_list_adapter.dump_json([schemas.PropertyRead.model_validate(o) for o in items])
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        cached = (body, etag, next_cursor)
+        _listing_cache.set(key, cached, generation=generation)
+
+    body, etag, next_cursor = cached
+    headers = {"ETag": etag, "Vary": "Authorization"}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def invalidate_property_listings() -> None:
+    """Drop every cached listing page in this worker."""
+    _listing_cache.clear()
+
+
+# Any committed property write (creation, price or approval change, owner transfer, deletion) can change
+# any page, so it drops them all; writes made outside the HTTP routes (scripts, admin tooling) included.
+_listing_invalidator = CommitInvalidator("properties.listings", lambda property_ids: invalidate_property_listings())
+_listing_invalidator.watch(models.Property, "after_insert", "after_update", "after_delete")
 
 
 @router.post(
@@ -42,7 +143,7 @@ def list_properties(db: Session = Depends(get_db), user: Optional[models.User] =
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(rate_limit("write"))],
 )
-def create_property(payload: schemas.PropertyCreate, db: Session = Depends(get_db), user: models.User = Depends(require_landlord)):
+def create_property(payload: schemas.PropertyCreate, db: Session = Depends(get_db), user: AuthenticatedUser = Depends(require_landlord)):
     """
     Create a new property owned by the authenticated landlord.
 
@@ -58,3 +159,40 @@ def create_property(payload: schemas.PropertyCreate, db: Session = Depends(get_d
     db.commit()
     db.refresh(obj)
     return obj
+
+
+@router.get("/properties/{property_id}/availability", response_model=schemas.AvailabilityRead)
+def get_property_availability(
+    property_id: int,
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    db: Session = Depends(get_db),
+) -> schemas.AvailabilityRead:
+    """
+    Public availability calendar for a property over [from, to).
+
+    Booked nights are those covered by 'confirmed' or 'pending_payment' bookings.
+    Served from the per-property night bitset in the availability index; the DB is only read
+    when the property is cold (first request or after the index TTL).
+    """
+    if from_date >= to_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must be before to")
+    if (to_date - from_date).days > MAX_AVAILABILITY_NIGHTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range must not exceed {MAX_AVAILABILITY_NIGHTS} nights",
+        )
+
+    nights = availability.index.booked_nights(property_id, from_date, to_date)
+    if nights is None:
+        # Cold: confirm the property exists before loading its bookings into the index
+        if not db.get(models.Property, property_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Property not found")
+        nights = availability.booked_nights(db, property_id, from_date, to_date)
+
+    return schemas.AvailabilityRead(
+        property_id=property_id,
+        from_date=from_date,
+        to_date=to_date,
+        booked_nights=nights,
+    )
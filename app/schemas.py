@@ -1,7 +1,7 @@
 # Pydantic models (request/response DTOs) used by the API layer.
 # Keep models minimal and serializable; business logic lives in services/DB.
 from pydantic import BaseModel, Field, ConfigDict, field_validator, EmailStr
-from typing import Literal, Union, Optional
+from typing import List, Literal, Union, Optional
 from datetime import date, datetime
 
 
@@ -32,6 +32,16 @@ class PropertyRead(PropertyBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+# Availability calendar for a property over [from, to); booked nights are confirmed or held
+class AvailabilityRead(BaseModel):
+    property_id: int
+    from_date: date = Field(..., alias="from")
+    to_date: date = Field(..., alias="to")
+    booked_nights: List[date]
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
 # Bookings
 # Common booking fields shared by create/read
 class BookingBase(BaseModel):
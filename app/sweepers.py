@@ -2,63 +2,199 @@
 # These utilities are invoked from startup threads or scheduler jobs.
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Optional
+import logging
+import os
+import time
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
 
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 
 from .db import SessionLocal
-from . import models
+from . import availability, models, outbox
 
+# Namespaced logger for sweep throughput reports
+logger = logging.getLogger("staycircle.sweeper")
 
-def sweep_expired_bookings(db: Optional[Session] = None) -> int:
+
+def _to_int(val: Optional[str], default: int) -> int:
+    try:
+        return int(val) if val is not None else default
+    except Exception:
+        return default
+
+
+# Rows expired per UPDATE/commit; bounds transaction length and memory regardless of backlog size
+SWEEP_CHUNK_SIZE = max(1, _to_int(os.getenv("SWEEP_CHUNK_SIZE"), 500))
+
+# (booking_id, property_id, start_date, end_date) of a hold the sweeper expired
+ExpiredRow = Tuple[int, int, date, date]
+
+
+def _expired_filter(now: datetime) -> tuple:
+    return (
+        models.Booking.status == "pending_payment",
+        models.Booking.expires_at != None,  # noqa: E711
+        models.Booking.expires_at < now,
+    )
+
+
+def _expire_stmt(now: datetime):
+    return (
+        update(models.Booking)
+        .where(*_expired_filter(now))
+        .values(
+            status="cancelled_expired",
+            cancel_reason=func.coalesce(func.nullif(models.Booking.cancel_reason, ""), "expired"),
+            version=func.coalesce(models.Booking.version, 1) + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _expire_ids(db: Session, ids: List[int], now: datetime) -> List[ExpiredRow]:
+    """
+    Expire the given holds and record their outbox events; returns the rows this call expired.
+
+    Every UPDATE re-checks status and expiry, so holds paid, cancelled or extended in between are left alone.
+    - With UPDATE ... RETURNING: one set-based UPDATE hands back exactly the rows it changed.
+    - Without it: the still-expired rows are read with their versions, then each gets an UPDATE guarded by
+      that version. Only rows whose UPDATE matched are reported, so a hold another worker expired in
+      between is not released twice.
+    """
+    cols = (models.Booking.id, models.Booking.property_id, models.Booking.start_date, models.Booking.end_date)
+    if getattr(db.get_bind().dialect, "update_returning", False):
+        rows = db.execute(_expire_stmt(now).where(models.Booking.id.in_(ids)).returning(*cols)).all()
+        expired: List[ExpiredRow] = [(r[0], r[1], r[2], r[3]) for r in rows]
+    else:
+        candidates = db.execute(
+            select(*cols, models.Booking.version).where(models.Booking.id.in_(ids), *_expired_filter(now))
+        ).all()
+        expired = []
+        for booking_id, property_id, start_date, end_date, version in candidates:
+            result = db.execute(
+                _expire_stmt(now).where(models.Booking.id == booking_id, models.Booking.version == version)
+            )
+            if result.rowcount == 1:
+                expired.append((booking_id, property_id, start_date, end_date))
+    if expired:
+        # Events for the expired holds commit with the UPDATE, and only for rows this call changed
+        db.execute(outbox.enqueue_stmt([row[0] for row in expired]))
+    return expired
+
+
+def _expire_chunk(db: Session, now: datetime, chunk_size: int) -> Tuple[int, List[ExpiredRow]]:
+    """
+    Expire up to chunk_size holds; returns (ids selected, rows expired).
+
+    Ids are selected first (LIMIT inside an UPDATE subquery is not portable).
+    """
+    ids = list(db.execute(select(models.Booking.id).where(*_expired_filter(now)).limit(chunk_size)).scalars())
+    if not ids:
+        return 0, []
+    return len(ids), _expire_ids(db, ids, now)
+
+
+def expire_bookings(booking_ids: List[int], db: Optional[Session] = None) -> List[ExpiredRow]:
+    """
+    Expire specific holds (delay-queue path) in one transaction; returns the rows expired.
+
+    Ids that are no longer expired pending holds are skipped, so firing twice or late is harmless.
+    """
+    if not booking_ids:
+        return []
+    created_session = False
+    if db is None:
+        db = SessionLocal()
+        created_session = True
+    try:
+        expired = _expire_ids(db, list(booking_ids), datetime.now(timezone.utc))
+        db.commit()
+        for booking_id, property_id, start_date, end_date in expired:
+            availability.record_status(booking_id, property_id, start_date, end_date, "cancelled_expired")
+        return expired
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if created_session:
+            db.close()
+
+
+def pending_expiries(booking_ids: List[int], db: Optional[Session] = None) -> List[Tuple[int, datetime]]:
+    """Return (id, expires_at) for ids that are still pending holds (e.g., fired early due to clock skew)."""
+    if not booking_ids:
+        return []
+    created_session = False
+    if db is None:
+        db = SessionLocal()
+        created_session = True
+    try:
+        rows = db.execute(
+            select(models.Booking.id, models.Booking.expires_at).where(
+                models.Booking.id.in_(list(booking_ids)),
+                models.Booking.status == "pending_payment",
+                models.Booking.expires_at != None,  # noqa: E711
+            )
+        ).all()
+        return [(r[0], r[1]) for r in rows]
+    finally:
+        if created_session:
+            db.close()
+
+
+def sweep_expired_bookings(db: Optional[Session] = None, chunk_size: Optional[int] = None) -> int:
     """
     Mark expired 'pending_payment' bookings as 'cancelled_expired'.
 
     Semantics:
     - Only processes rows with status == 'pending_payment' and expires_at < now (UTC).
+    - Works in chunks of chunk_size (default SWEEP_CHUNK_SIZE) with one commit per chunk, so a large
+      backlog never becomes one long lock-holding transaction.
     - Idempotent across repeated runs.
     - Accepts an optional Session; otherwise creates and cleans up its own.
+    - Logs rows expired, chunks and rows per second for each sweep that expired anything.
 
     Returns:
-    - Number of rows considered/updated.
+    - Number of rows updated.
     """
+    size = max(1, chunk_size or SWEEP_CHUNK_SIZE)
     # Track whether this call created its own DB session (so we can close it)
     created_session = False
     if db is None:
         db = SessionLocal()
         created_session = True
 
+    started = time.monotonic()
+    total = 0
+    chunks = 0
     try:
         now = datetime.now(timezone.utc)
-        # Find all bookings that are still pending payment, but whose holds have expired
-        items = (
-            db.query(models.Booking)
-            .filter(
-                models.Booking.status == "pending_payment",
-                models.Booking.expires_at != None,  # noqa: E711
-                models.Booking.expires_at < now,
-            )
-            .all()
-        )
-        for obj in items:
-            # Idempotent + timezone-aware guard
-            # Treat naive datetimes (e.g., SQLite) as UTC before comparing.
-            exp = obj.expires_at
-            if exp is not None and getattr(exp, "tzinfo", None) is None:
-                # Some backends (e.g., SQLite) may return naive datetimes; treat stored values as UTC.
-                exp = exp.replace(tzinfo=timezone.utc)
-            if obj.status == "pending_payment" and exp and exp < now:
-                obj.status = "cancelled_expired"
-                if not obj.cancel_reason:
-                    obj.cancel_reason = "expired"
-                obj.version = (obj.version or 1) + 1
-                db.add(obj)
-        if items:
+        while True:
+            selected, expired = _expire_chunk(db, now, size)
+            if not selected:
+                break
             db.commit()
-        return len(items)
+            chunks += 1
+            total += len(expired)
+            # Release the expired holds from the availability index once each chunk is durable
+            for booking_id, property_id, start_date, end_date in expired:
+                availability.record_status(booking_id, property_id, start_date, end_date, "cancelled_expired")
+            if selected < size:
+                break
+        if total:
+            elapsed = time.monotonic() - started
+            logger.info(
+                "expired %d holds in %d chunks (%.3fs, %.0f rows/s)",
+                total,
+                chunks,
+                elapsed,
+                total / elapsed if elapsed > 0 else float(total),
+            )
+        return total
     except Exception:
-        # Roll back partial work, then bubble up the error
+        # Roll back the current chunk (earlier chunks are committed), then bubble up the error
         db.rollback()
         raise
     finally:
@@ -0,0 +1,164 @@
+# Authenticated-user cache: verified tokens and lightweight user records, so most requests skip the users table.
+# Local tier is a bounded TTL/LRU per worker; an optional Redis tier (REDIS_ENABLED) shares records across workers.
+from __future__ import annotations
+
+import json
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .cache import MISSING, CommitInvalidator, SharedTier, TTLCache, env_int
+
+USER_CACHE_MAX_ENTRIES = env_int("USER_CACHE_MAX_ENTRIES", 10000)
+USER_CACHE_TTL_SECONDS = env_int("USER_CACHE_TTL_SECONDS", 60)
+# 0 disables the shared tier even when Redis is enabled
+USER_CACHE_REDIS_TTL_SECONDS = env_int("USER_CACHE_REDIS_TTL_SECONDS", 300)
+REDIS_KEY_PREFIX = "user:record:"
+
+
+class AuthenticatedUser:
+    """
+    Immutable-by-convention view of the fields request handlers read from the caller.
+
+    Handlers only need identity and role; keeping this detached from the ORM session makes it safe
+    to share across requests, threads and workers.
+    """
+
+    __slots__ = ("id", "email", "role")
+
+    def __init__(self, id: int, email: str, role: str) -> None:
+        self.id = id
+        self.email = email
+        self.role = role
+
+    @classmethod
+    def from_model(cls, user: models.User) -> "AuthenticatedUser":
+        return cls(id=user.id, email=user.email, role=user.role)
+
+    def to_json(self) -> str:
+        return json.dumps({"id": self.id, "email": self.email, "role": self.role})
+
+    @classmethod
+    def from_json(cls, raw) -> "AuthenticatedUser":
+        data = json.loads(raw)
+        return cls(id=int(data["id"]), email=data["email"], role=data["role"])
+
+    def __repr__(self) -> str:
+        return f"AuthenticatedUser(id={self.id!r}, role={self.role!r})"
+
+
+# token -> user id for signatures already verified; entries never outlive the token's exp claim
+_tokens = TTLCache(max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS)
+# user id -> AuthenticatedUser
+_users = TTLCache(max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS)
+_shared = SharedTier("user_cache", USER_CACHE_REDIS_TTL_SECONDS)
+
+
+def _redis_key(user_id: int) -> str:
+    return f"{REDIS_KEY_PREFIX}{user_id}"
+
+
+def cached_token_subject(token: str) -> Optional[int]:
+    """Return the user id for a token verified earlier by this worker, or None."""
+    value = _tokens.get(token)
+    return None if value is MISSING else value
+
+
+def remember_token(token: str, user_id: int, expires_at: Optional[int]) -> None:
+    """Cache a verified token's subject until the sooner of the cache TTL and the token's expiry."""
+    ttl = float(USER_CACHE_TTL_SECONDS)
+    if expires_at is not None:
+        ttl = min(ttl, float(expires_at) - time.time())
+    _tokens.set(token, user_id, ttl_seconds=ttl)
+
+
+async def load_user(db: AsyncSession, user_id: int) -> Optional[AuthenticatedUser]:
+    """
+    Resolve a user record through the local tier, then Redis, then the database.
+
+    Behavior:
+    - Local misses consult Redis (when enabled) before issuing a primary-key lookup.
+    - DB results populate both tiers; a local invalidation during the lookup discards the result
+      (TTLCache.pop bumps the generation captured below).
+    - Missing users are not cached, so a just-created account is visible immediately.
+    """
+    user = _users.get(user_id)
+    if user is not MISSING:
+        return user
+
+    generation = _users.generation
+    client = await _shared.async_client()
+    if client is not None:
+        try:
+            raw = await client.get(_redis_key(user_id))
+            if raw is not None:
+                user = AuthenticatedUser.from_json(raw)
+                _users.set(user_id, user, generation=generation)
+                return user
+        except Exception as exc:
+            _shared.async_failed("get", exc, user_id=user_id)
+
+    row = await db.get(models.User, user_id)
+    if row is None:
+        return None
+    user = AuthenticatedUser.from_model(row)
+    _users.set(user_id, user, generation=generation)
+    if client is not None:
+        try:
+            await client.set(_redis_key(user_id), user.to_json(), ex=_shared.ttl_seconds)
+        except Exception as exc:
+            _shared.async_failed("set", exc, user_id=user_id)
+    return user
+
+
+def _evict_local(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        _users.pop(user_id)
+
+
+def invalidate_users(user_ids: Iterable[int]) -> None:
+    """
+    Drop cached records from this worker and the shared tier (blocking Redis call).
+
+    Other workers' local entries age out within USER_CACHE_TTL_SECONDS.
+    """
+    ids = list(user_ids)
+    _evict_local(ids)
+    client = _shared.client()
+    if client is None or not ids:
+        return
+    try:
+        client.delete(*[_redis_key(user_id) for user_id in ids])
+    except Exception as exc:
+        _shared.failed("delete", exc, user_ids=ids)
+
+
+async def async_invalidate_users(user_ids: Iterable[int]) -> None:
+    """Event-loop variant of invalidate_users(); evicts locally again once Redis is updated."""
+    ids = list(user_ids)
+    client = await _shared.async_client()
+    if client is not None and ids:
+        try:
+            await client.delete(*[_redis_key(user_id) for user_id in ids])
+        except Exception as exc:
+            _shared.async_failed("delete", exc, user_ids=ids)
+    # A local refill that read the shared tier before the delete landed is dropped here
+    _evict_local(ids)
+
+
+def reset() -> None:
+    """Clear both local tiers (tests and admin tooling)."""
+    _tokens.clear()
+    _users.clear()
+
+
+# Any ORM write to a user (role change, email change, deletion) evicts its cached record once committed
+_invalidator = CommitInvalidator(
+    "user_cache.dirty",
+    invalidate_users,
+    evict_local=_evict_local,
+    async_invalidate=async_invalidate_users,
+)
+_invalidator.watch(models.User, "after_update", "after_delete")
@@ -19,6 +19,8 @@ if ROOT not in sys.path:
 
 from app.main import app  # noqa: E402
 from app.db import Base, engine  # noqa: E402
+from app import availability, expiry, payment_gateway, property_cache, rate_limit, user_cache  # noqa: E402
+from app.routes.properties import invalidate_property_listings  # noqa: E402
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -43,6 +45,14 @@ def _clean_db() -> Iterator[None]:
     """
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    # In-memory indexes are keyed by row ids, which restart after each schema reset
+    availability.reset()
+    invalidate_property_listings()
+    user_cache.reset()
+    property_cache.reset()
+    rate_limit.hybrid_limiter.reset()
+    expiry.hold_expiry.reset()
+    payment_gateway.set_gateway(None)
     yield
 
 
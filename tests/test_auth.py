@@ -0,0 +1,79 @@
+# Auth test suite: cached token verification and user-record invalidation.
+from __future__ import annotations
+
+from typing import Tuple
+
+from fastapi.testclient import TestClient
+
+from app.db import SessionLocal
+from app import models, user_cache
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+# Convenience header for authenticated requests
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Repeat requests reuse the verified token and user record; ORM updates evict the stale record
+def test_user_cache_hits_and_invalidates_on_update(client: TestClient):
+    token, user = signup(client, "cached@example.com", "changeme123", "landlord")
+
+    r = client.post("/api/v1/properties", headers=auth_headers(token), json={"title": "One", "price_cents": 1000})
+    assert r.status_code == 201, r.text
+    hits_before = user_cache._users.hits
+    r = client.post("/api/v1/properties", headers=auth_headers(token), json={"title": "Two", "price_cents": 1000})
+    assert r.status_code == 201, r.text
+    assert user_cache._users.hits == hits_before + 1
+    assert user_cache.cached_token_subject(token) == user["id"]
+
+    # Demote the landlord directly in the DB; the cached role must not survive the change
+    db = SessionLocal()
+    try:
+        row = db.get(models.User, user["id"])
+        row.role = "tenant"
+        db.commit()
+    finally:
+        db.close()
+
+    r = client.post("/api/v1/properties", headers=auth_headers(token), json={"title": "Three", "price_cents": 1000})
+    assert r.status_code == 403
+
+    # Tampered tokens are still rejected even though a valid sibling is cached
+    r = client.get("/api/v1/bookings/me", headers=auth_headers(token[:-2] + "xx"))
+    assert r.status_code == 401
+
+
+# Invalidation waits for the commit, and a lookup that started before it cannot re-cache the old record
+def test_user_cache_invalidates_after_commit_and_drops_inflight_refills(client: TestClient):
+    token, user = signup(client, "commit@example.com", "changeme123", "landlord")
+    r = client.get("/api/v1/bookings/me", headers=auth_headers(token))
+    assert r.status_code == 200, r.text
+    cached = user_cache._users.get(user["id"])
+    assert cached is not user_cache.MISSING
+
+    db = SessionLocal()
+    try:
+        row = db.get(models.User, user["id"])
+        row.role = "tenant"
+        db.flush()
+        # Flushed but uncommitted: other sessions still read the landlord row, so the entry stays
+        assert user_cache._users.get(user["id"]) is cached
+        generation = user_cache._users.generation
+        db.commit()
+    finally:
+        db.close()
+
+    assert user_cache._users.get(user["id"]) is user_cache.MISSING
+    # A refill that captured the generation before the commit is discarded
+    assert not user_cache._users.set(user["id"], cached, generation=generation)
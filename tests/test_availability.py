@@ -0,0 +1,218 @@
+# Availability index test suite: interval math, index-backed overlap checks, and the consistency checker.
+from __future__ import annotations
+
+from datetime import date
+from typing import Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import availability, models
+from app.availability import IntervalSet
+from app.db import SessionLocal
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+# Convenience header for authenticated requests
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Helper: create a property owned by the authenticated landlord
+def create_property(client: TestClient, token: str, title: str, price_cents: int, requires_approval: bool = False) -> dict:
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(token),
+        json={"title": title, "price_cents": price_cents, "requires_approval": requires_approval},
+    )
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+# Helper: force a booking's status directly in the DB (bypasses the index on purpose)
+def set_status(booking_id: int, status: str) -> None:
+    db = SessionLocal()
+    try:
+        obj = db.get(models.Booking, booking_id)
+        assert obj is not None
+        obj.status = status
+        db.add(obj)
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture()
+def index_on(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("AVAILABILITY_INDEX_ENABLED", "true")
+
+
+# Interval math: half-open ranges, overlapping members, and removal
+def test_interval_set_overlap_and_discard():
+    s = IntervalSet()
+    s.add(1, date(2025, 1, 10), date(2025, 1, 20))
+    s.add(2, date(2025, 1, 12), date(2025, 1, 14))
+    s.add(3, date(2025, 2, 1), date(2025, 2, 3))
+
+    assert s.overlaps(date(2025, 1, 19), date(2025, 1, 21))
+    assert not s.overlaps(date(2025, 1, 20), date(2025, 1, 25))  # checkout day is free
+    assert not s.overlaps(date(2025, 1, 5), date(2025, 1, 10))  # checkin day is free
+    assert s.overlaps(date(2025, 2, 2), date(2025, 2, 5))
+
+    s.discard(1)
+    assert not s.overlaps(date(2025, 1, 15), date(2025, 1, 20))
+    assert s.overlaps(date(2025, 1, 13), date(2025, 1, 15))
+    assert len(s) == 2 and 1 not in s
+
+
+# Index-backed path: confirmations made through the API are applied without a reload
+def test_index_tracks_confirmations_and_cancellations(client: TestClient, index_on: None):
+    landlord_token, _ = signup(client, "host-ix@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Index Place", 10000)
+    tenant_token, _ = signup(client, "guest-ix@example.com", "changeme123", "tenant")
+
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-07-10", "end_date": "2025-07-12"},
+    )
+    assert r.status_code == 201, r.text
+    booking = r.json()["booking"]
+    snap = availability.index.snapshot(prop["id"])
+    assert snap is not None and snap[booking["id"]][2] == "pending_payment"
+
+    # Simulate a confirmation recorded by the payments path
+    set_status(booking["id"], "confirmed")
+    availability.record_status(booking["id"], prop["id"], date(2025, 7, 10), date(2025, 7, 12), "confirmed")
+
+    r2 = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-07-11", "end_date": "2025-07-13"},
+    )
+    assert r2.status_code == 409, r2.text
+
+    # Cancelling frees the nights again
+    r3 = client.delete(f"/api/v1/bookings/{booking['id']}", headers=auth_headers(tenant_token))
+    assert r3.status_code == 200, r3.text
+    r4 = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-07-11", "end_date": "2025-07-13"},
+    )
+    assert r4.status_code == 201, r4.text
+
+
+# Consistency checker: out-of-band DB writes are reported and repaired on request
+def test_consistency_checker_reports_and_repairs_drift(client: TestClient, index_on: None):
+    landlord_token, _ = signup(client, "host-cc@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Drift Place", 10000)
+    tenant_token, _ = signup(client, "guest-cc@example.com", "changeme123", "tenant")
+
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-08-10", "end_date": "2025-08-12"},
+    )
+    assert r.status_code == 201, r.text
+    booking = r.json()["booking"]
+
+    db = SessionLocal()
+    try:
+        assert availability.check_consistency(db) == {"checked": 1, "mismatches": []}
+
+        # Confirm behind the index's back
+        set_status(booking["id"], "confirmed")
+        report = availability.check_consistency(db, repair=True)
+        assert report["checked"] == 1
+        assert report["mismatches"] == [
+            {"property_id": prop["id"], "missing": [], "unexpected": [], "changed": [booking["id"]]}
+        ]
+
+        # Repaired entry reloads from the DB and now blocks overlapping requests
+        assert availability.has_overlap(db, prop["id"], date(2025, 8, 11), date(2025, 8, 13))
+        assert availability.check_consistency(db)["mismatches"] == []
+    finally:
+        db.close()
+
+
+# Freshness: a conflict seen in memory is re-checked in SQL, and authoritative checks never use the index
+def test_index_rechecks_hits_and_authoritative_checks_skip_it(client: TestClient, index_on: None):
+    landlord_token, _ = signup(client, "host-fr@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Fresh Place", 10000)
+    tenant_token, _ = signup(client, "guest-fr@example.com", "changeme123", "tenant")
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-09-10", "end_date": "2025-09-12"},
+    )
+    assert r.status_code == 201, r.text
+    booking = r.json()["booking"]
+    nights = (date(2025, 9, 10), date(2025, 9, 12))
+
+    db = SessionLocal()
+    try:
+        # Another worker confirms: this worker's warm entry still says "free" until its TTL runs out
+        set_status(booking["id"], "confirmed")
+        assert availability.index.property_ids() == [prop["id"]]
+        assert not availability.has_overlap(db, prop["id"], *nights)
+        assert availability.has_overlap(db, prop["id"], *nights, authoritative=True)
+
+        # Index says taken, DB says cancelled (another worker cancelled): no false conflict, entry dropped
+        availability.record_status(booking["id"], prop["id"], *nights, "confirmed")
+        set_status(booking["id"], "cancelled")
+        assert not availability.has_overlap(db, prop["id"], *nights)
+        assert availability.index.property_ids() == []
+    finally:
+        db.close()
+
+
+# Calendar: held and confirmed nights are booked; cancel/decline/expiry free them incrementally
+def test_availability_calendar_tracks_transitions(client: TestClient):
+    landlord_token, _ = signup(client, "host-cal@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Calendar Place", 10000)
+    tenant_token, _ = signup(client, "guest-cal@example.com", "changeme123", "tenant")
+
+    url = f"/api/v1/properties/{prop['id']}/availability?from=2025-09-01&to=2025-09-08"
+    r0 = client.get(url)
+    assert r0.status_code == 200, r0.text
+    assert r0.json() == {"property_id": prop["id"], "from": "2025-09-01", "to": "2025-09-08", "booked_nights": []}
+
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-09-02", "end_date": "2025-09-04"},
+    )
+    assert r.status_code == 201, r.text
+    booking = r.json()["booking"]
+    r2 = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2025-09-03", "end_date": "2025-09-06"},
+    )
+    assert r2.status_code == 201, r2.text
+
+    r1 = client.get(url)
+    assert r1.json()["booked_nights"] == ["2025-09-02", "2025-09-03", "2025-09-04", "2025-09-05"]
+
+    # Cancelling one overlapping hold keeps the nights still covered by the other
+    r3 = client.delete(f"/api/v1/bookings/{booking['id']}", headers=auth_headers(tenant_token))
+    assert r3.status_code == 200, r3.text
+    assert client.get(url).json()["booked_nights"] == ["2025-09-03", "2025-09-04", "2025-09-05"]
+
+
+# Calendar validation: inverted/oversized ranges are rejected; unknown properties are 404
+def test_availability_calendar_validation(client: TestClient):
+    assert client.get("/api/v1/properties/999/availability?from=2025-01-01&to=2025-01-05").status_code == 404
+    assert client.get("/api/v1/properties/1/availability?from=2025-01-05&to=2025-01-01").status_code == 400
+    assert client.get("/api/v1/properties/1/availability?from=2025-01-01&to=2026-06-01").status_code == 400
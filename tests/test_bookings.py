@@ -6,10 +6,11 @@ from typing import Tuple
 from datetime import datetime, timedelta, timezone
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event, update
 
 from app.sweepers import sweep_expired_bookings
-from app.db import SessionLocal
-from app import models
+from app.db import SessionLocal, engine
+from app import availability, models
 
 
 # Helper: create a user and return (access_token, user JSON)
@@ -201,6 +202,145 @@ def test_expiry_sweeper_converts_pending_to_cancelled_expired(client: TestClient
     assert found["status"] == "cancelled_expired"
 
 
+# Chunked sweeper: a backlog larger than one chunk is fully expired, leaving live holds untouched
+def test_expiry_sweeper_processes_backlog_in_chunks(client: TestClient):
+    landlord_token, _ = signup(client, "host6@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Backlog Place", 12000, requires_approval=False)
+    tenant_token, _ = signup(client, "guest6@example.com", "changeme123", "tenant")
+
+    ids = []
+    for day in (1, 4, 7, 10, 13):
+        res = create_booking(client, tenant_token, prop["id"], f"2025-08-{day:02d}", f"2025-08-{day + 2:02d}")
+        assert res["status_code"] == 201, res["data"]
+        ids.append(res["data"]["booking"]["id"])
+    live = ids.pop()
+
+    db = SessionLocal()
+    try:
+        for booking_id in ids:
+            obj = db.get(models.Booking, booking_id)
+            obj.expires_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+            db.add(obj)
+        db.commit()
+    finally:
+        db.close()
+
+    assert sweep_expired_bookings(chunk_size=3) == 4
+    assert sweep_expired_bookings(chunk_size=3) == 0
+
+    db = SessionLocal()
+    try:
+        for booking_id in ids:
+            obj = db.get(models.Booking, booking_id)
+            assert obj.status == "cancelled_expired"
+            assert obj.cancel_reason == "expired"
+            assert obj.version == 2
+        assert db.get(models.Booking, live).status == "pending_payment"
+    finally:
+        db.close()
+
+
+# Sweeper without UPDATE ... RETURNING: a hold another sweeper expires between selection and update
+# is neither counted, released nor announced again
+def test_expiry_sweeper_without_returning_skips_rows_expired_elsewhere(client: TestClient, monkeypatch):
+    landlord_token, _ = signup(client, "host7@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Race Place", 12000, requires_approval=False)
+    tenant_token, _ = signup(client, "guest7@example.com", "changeme123", "tenant")
+
+    ids = []
+    for day in (1, 4, 7):
+        res = create_booking(client, tenant_token, prop["id"], f"2025-09-{day:02d}", f"2025-09-{day + 2:02d}")
+        assert res["status_code"] == 201, res["data"]
+        ids.append(res["data"]["booking"]["id"])
+    victim = ids[0]
+
+    db = SessionLocal()
+    try:
+        for booking_id in ids:
+            obj = db.get(models.Booking, booking_id)
+            obj.expires_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+            db.add(obj)
+        db.commit()
+    finally:
+        db.close()
+
+    released = []
+    monkeypatch.setattr(availability, "record_status", lambda booking_id, *args: released.append(booking_id))
+    monkeypatch.setattr(engine.dialect, "update_returning", False)
+
+    # Another sweeper expires the victim right before our first UPDATE reaches the database
+    raced = []
+
+    def concurrent_sweeper(conn, cursor, statement, parameters, context, executemany):
+        if not raced and statement.lstrip().upper().startswith("UPDATE BOOKINGS"):
+            raced.append(statement)
+            with engine.begin() as other:
+                other.execute(
+                    update(models.Booking)
+                    .where(models.Booking.id == victim)
+                    .values(status="cancelled_expired", cancel_reason="expired", version=models.Booking.version + 1)
+                )
+
+    event.listen(engine, "before_cursor_execute", concurrent_sweeper)
+    try:
+        assert sweep_expired_bookings() == 2
+    finally:
+        event.remove(engine, "before_cursor_execute", concurrent_sweeper)
+    assert raced and sorted(released) == sorted(ids[1:])
+
+    db = SessionLocal()
+    try:
+        assert [db.get(models.Booking, booking_id).version for booking_id in ids] == [2, 2, 2]
+        # The victim's expiry belongs to the other sweeper: this sweep wrote events only for its own rows
+        expired_events = (
+            db.query(models.BookingEvent.booking_id).filter(models.BookingEvent.status == "cancelled_expired").all()
+        )
+        assert sorted(row[0] for row in expired_events) == sorted(ids[1:])
+    finally:
+        db.close()
+
+
+# Delay queue: a scheduled hold fires once its deadline passes; future deadlines are left queued
+def test_hold_expiry_delay_queue_fires_at_deadline(client: TestClient):
+    import asyncio
+    from app.expiry import HoldExpiryScheduler
+
+    landlord_token, _ = signup(client, "host7@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Deadline Place", 9000, requires_approval=False)
+    tenant_token, _ = signup(client, "guest7@example.com", "changeme123", "tenant")
+    due = create_booking(client, tenant_token, prop["id"], "2025-09-01", "2025-09-03")["data"]["booking"]
+    later = create_booking(client, tenant_token, prop["id"], "2025-09-05", "2025-09-07")["data"]["booking"]
+
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db = SessionLocal()
+    try:
+        obj = db.get(models.Booking, due["id"])
+        obj.expires_at = past
+        db.add(obj)
+        db.commit()
+        later_expires = db.get(models.Booking, later["id"]).expires_at
+    finally:
+        db.close()
+
+    scheduler = HoldExpiryScheduler()
+
+    async def scenario():
+        await scheduler.schedule(due["id"], past)
+        await scheduler.schedule(later["id"], later_expires)
+        return await scheduler.run_once()
+
+    expired, next_ms = asyncio.run(scenario())
+    assert expired == 1
+    assert next_ms is not None and next_ms > datetime.now(timezone.utc).timestamp() * 1000
+
+    db = SessionLocal()
+    try:
+        assert db.get(models.Booking, due["id"]).status == "cancelled_expired"
+        assert db.get(models.Booking, later["id"]).status == "pending_payment"
+    finally:
+        db.close()
+
+
 # Authorization: only owner landlord can approve/decline; tenant can cancel own booking
 def test_authorization_for_approve_decline_and_cancel(client: TestClient):
     # Landlord A owns property; Landlord B tries to approve -> 403
@@ -226,3 +366,61 @@ def test_authorization_for_approve_decline_and_cancel(client: TestClient):
     r3 = client.delete(f"/api/v1/bookings/{booking['id']}", headers=auth_headers(tenant_token))
     assert r3.status_code == 200
     assert r3.json()["status"] == "cancelled"
+
+
+# Pagination: keyset cursor pages match offset pages and end without X-Next-Cursor
+def test_list_my_bookings_cursor_pagination(client: TestClient):
+    landlord_token, _ = signup(client, "host6@example.com", "changeme123", "landlord")
+    prop = create_property(client, landlord_token, "Paged Place", 10000, requires_approval=False)
+    tenant_token, _ = signup(client, "guest6@example.com", "changeme123", "tenant")
+
+    # Two bookings share a start_date so the id tie-breaker is exercised
+    for start, end in [("2025-07-01", "2025-07-03"), ("2025-07-01", "2025-07-02"), ("2025-07-05", "2025-07-06"),
+                       ("2025-06-01", "2025-06-02"), ("2025-08-01", "2025-08-03")]:
+        res = create_booking(client, tenant_token, prop["id"], start, end)
+        assert res["status_code"] == 201, res["data"]
+
+    r_all = client.get("/api/v1/bookings/me?limit=100", headers=auth_headers(tenant_token))
+    assert r_all.status_code == 200
+    expected = [b["id"] for b in r_all.json()]
+    assert len(expected) == 5
+    assert "X-Next-Cursor" not in r_all.headers
+
+    seen: list[int] = []
+    r = client.get("/api/v1/bookings/me?limit=2", headers=auth_headers(tenant_token))
+    while True:
+        assert r.status_code == 200, r.text
+        seen.extend(b["id"] for b in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        r = client.get(f"/api/v1/bookings/me?limit=2&cursor={cursor}", headers=auth_headers(tenant_token))
+    assert seen == expected
+
+    # Landlord sees the same rows through the property join
+    r_landlord = client.get("/api/v1/bookings/me?limit=3", headers=auth_headers(landlord_token))
+    cursor = r_landlord.headers["X-Next-Cursor"]
+    r_next = client.get(f"/api/v1/bookings/me?limit=3&cursor={cursor}", headers=auth_headers(landlord_token))
+    assert [b["id"] for b in r_landlord.json() + r_next.json()] == expected
+
+    # Malformed cursor
+    r_bad = client.get("/api/v1/bookings/me?cursor=not-a-cursor", headers=auth_headers(tenant_token))
+    assert r_bad.status_code == 400
+
+
+# Range-lock buckets: bookings share keys only when their nights (or buckets) overlap
+def test_booking_range_lock_keys(monkeypatch):
+    from datetime import date
+    from app import locks
+
+    keys = locks.booking_range_keys(7, date(2030, 1, 1), date(2030, 1, 4))
+    assert len(keys) == 3 and all(k.startswith("lock:booking:{7}:b1:") for k in keys)
+    # Checkout day is not a night of the stay, so back-to-back bookings don't contend
+    after = locks.booking_range_keys(7, date(2030, 1, 4), date(2030, 1, 6))
+    assert not set(keys) & set(after)
+    assert set(keys) & set(locks.booking_range_keys(7, date(2029, 12, 30), date(2030, 1, 2)))
+    assert not set(keys) & set(locks.booking_range_keys(8, date(2030, 1, 1), date(2030, 1, 4)))
+
+    # Week-sized buckets trade parallelism for fewer keys
+    monkeypatch.setattr(locks, "BOOKING_LOCK_BUCKET_DAYS", 7)
+    assert len(locks.booking_range_keys(7, date(2030, 1, 1), date(2030, 1, 4))) == 1
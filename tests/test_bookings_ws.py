@@ -0,0 +1,90 @@
+# Booking feed WebSocket: status changes are pushed to the guest and the property owner.
+from __future__ import annotations
+
+import json
+from typing import Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import outbox
+from app.frames import Frame, booking_channel, user_from_channel
+from app.routes.chat_ws import subscriber
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Guest and owner both receive each transition, in commit order, without polling
+def test_booking_feed_pushes_status_to_guest_and_owner(client: TestClient):
+    landlord_token, landlord = signup(client, "hostfeed@example.com", "changeme123", "landlord")
+    tenant_token, tenant = signup(client, "guestfeed@example.com", "changeme123", "tenant")
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(landlord_token),
+        json={"title": "Feed Place", "price_cents": 10000, "requires_approval": True},
+    )
+    assert r.status_code == 201, r.text
+    property_id = r.json()["id"]
+
+    with client.websocket_connect(f"/ws/bookings?token={tenant_token}") as ws_tenant, \
+         client.websocket_connect(f"/ws/bookings?token={landlord_token}") as ws_landlord:
+        r = client.post(
+            "/api/v1/bookings",
+            headers=auth_headers(tenant_token),
+            json={"property_id": property_id, "start_date": "2031-09-01", "end_date": "2031-09-03"},
+        )
+        assert r.status_code == 201, r.text
+        booking_id = r.json()["booking"]["id"]
+        r = client.post(f"/api/v1/bookings/{booking_id}/approve", headers=auth_headers(landlord_token))
+        assert r.status_code == 200, r.text
+        # The background relay may already have pushed these; a direct pass flushes whatever is left
+        outbox.relay_once()
+
+        for ws in (ws_tenant, ws_landlord):
+            first, second = json.loads(ws.receive_text()), json.loads(ws.receive_text())
+            assert first["type"] == "booking" and first["booking_id"] == booking_id
+            assert [(first["status"], first["version"]), (second["status"], second["version"])] == [
+                ("requested", 1),
+                ("pending_payment", 2),
+            ]
+            assert first["guest_id"] == tenant["id"]
+
+
+# Missing or invalid tokens are rejected with a policy-violation close
+def test_booking_feed_requires_token(client: TestClient):
+    for url in ("/ws/bookings", "/ws/bookings?token=not-a-jwt"):
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect(url) as ws:
+                ws.receive_text()
+        assert exc.value.code == 1008
+
+
+# Feed frames share the chat subscriber but are routed by channel prefix, not to chat rooms
+def test_booking_frames_route_to_feed():
+    assert user_from_channel(booking_channel(42)) == 42
+    assert user_from_channel("chat:property:42") is None
+    frame = Frame.from_wire(booking_channel(42), b'{"type": "booking"}')
+    assert frame.room is None
+    seen = []
+    original = dict(subscriber._routes)
+    try:
+        subscriber.route("bookings:user:", seen.append)
+        subscriber.dispatch(frame)
+    finally:
+        subscriber._routes.clear()
+        subscriber._routes.update(original)
+    assert seen == [frame]
@@ -1,12 +1,18 @@
 # WebSocket chat test suite: connection auth, owner checks, broadcast/persistence, and rate limiting.
 from __future__ import annotations
 
+import asyncio
 import json
 import time
-from typing import Tuple
+from typing import List, Tuple
 
 from fastapi.testclient import TestClient
 
+from starlette.websockets import WebSocketState
+
+from app.chat_writer import MessageWriter
+from app.frames import Frame
+from app.routes.chat_ws import ConnectionManager, SendQueue, subscriber
 from app.db import SessionLocal
 from app import models
 
@@ -129,3 +135,162 @@ def test_ws_validation_and_rate_limit(client: TestClient):
         time.sleep(1.2)
         ws.send_text(json.dumps({"text": "after-refill"}))
         _ = json.loads(ws.receive_text())  # broadcast
+
+
+# Group commit: concurrent submits from several rooms land in one batch with ids assigned in order
+def test_message_writer_group_commits_across_rooms(client: TestClient):
+    landlord_token, landlord = signup(client, "hostbatch@example.com", "changeme123", "landlord")
+    tenant_token, tenant = signup(client, "guestbatch@example.com", "changeme123", "tenant")
+    prop_a = create_property(client, landlord_token, "Batch A", 1000)
+    prop_b = create_property(client, landlord_token, "Batch B", 1000)
+
+    batches: List[List[dict]] = []
+
+    async def on_commit(messages: List[dict]) -> None:
+        batches.append(messages)
+
+    async def scenario() -> List[dict]:
+        writer = MessageWriter(on_commit=on_commit, max_batch=10, max_latency_ms=50)
+        await writer.start()
+        try:
+            return await asyncio.gather(
+                *(writer.submit(pid, tenant["id"], f"msg {i}") for i, pid in enumerate([prop_a["id"], prop_b["id"]] * 3))
+            )
+        finally:
+            await writer.stop()
+
+    results = asyncio.run(scenario())
+    assert len(batches) == 1 and len(batches[0]) == 6
+    assert [m["id"] for m in results] == [m["id"] for m in batches[0]]
+    assert [m["id"] for m in results] == sorted(m["id"] for m in results)
+    assert count_messages_for_property(prop_a["id"]) == 3
+    assert count_messages_for_property(prop_b["id"]) == 3
+
+
+class _StalledSocket:
+    """WebSocket stand-in whose sends block until released, to simulate a slow consumer."""
+    def __init__(self) -> None:
+        self.application_state = WebSocketState.CONNECTED
+        self.sent: List[str] = []
+        self.closed_with: int | None = None
+        self.release = asyncio.Event()
+
+    async def send_text(self, text: str) -> None:
+        await self.release.wait()
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+# Slow consumers: each policy bounds the backlog without blocking the broadcaster
+def test_send_queue_slow_consumer_policies():
+    async def run(policy: str) -> _StalledSocket:
+        ws = _StalledSocket()
+        box = SendQueue(ws, property_id=7, maxsize=2, policy=policy)  # type: ignore[arg-type]
+        box.offer("m0")
+        for _ in range(3):
+            await asyncio.sleep(0)  # let the writer pick up m0 and stall on it
+        for i in range(1, 6):
+            box.offer(f"m{i}")  # queue holds 2 behind the in-flight frame
+        ws.release.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        box.stop()
+        return ws
+
+    dropped = asyncio.run(run("drop_oldest"))
+    assert dropped.sent == ["m0", "m4", "m5"]
+
+    coalesced = asyncio.run(run("coalesce"))
+    assert coalesced.sent[0] == "m0"
+    assert json.loads(coalesced.sent[1]) == {"type": "resync", "property_id": 7}
+
+    disconnected = asyncio.run(run("disconnect"))
+    assert disconnected.closed_with == 1013
+
+
+# Frames: serialized once, routed by channel name without touching the JSON body
+def test_frame_routing_from_wire():
+    frame = Frame.from_message(42, {"id": 1, "property_id": 42, "text": "hi"})
+    assert frame.channel == "chat:property:42" and frame.room == 42
+    assert frame.data is frame.data  # encoded once, then cached
+
+    relayed = Frame.from_wire(b"chat:property:42", frame.data)
+    assert relayed.room == 42 and relayed.text == frame.text
+
+    # Body is never parsed, so even non-JSON payloads route by channel
+    assert Frame.from_wire("chat:property:7", b"not json").room == 7
+    assert Frame.from_wire("other:channel:7", b"{}").room is None
+
+
+# Per-room subscriptions: a room's channel is held only while it has local members
+def test_room_subscription_follows_local_membership(client: TestClient):
+    landlord_token, _ = signup(client, "hostsub@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "guestsub@example.com", "changeme123", "tenant")
+    prop = create_property(client, landlord_token, "Sub Place", 1000)
+    channel = f"chat:property:{prop['id']}"
+
+    with client.websocket_connect(f"/ws/chat/property/{prop['id']}?token={tenant_token}") as ws_a:
+        with client.websocket_connect(f"/ws/chat/property/{prop['id']}?token={landlord_token}") as ws_b:
+            ws_b.send_text(json.dumps({"text": "ping"}))
+            ws_a.receive_text()
+            ws_b.receive_text()
+            assert subscriber.channels == [channel]
+        ws_a.send_text(json.dumps({"text": "still here"}))
+        ws_a.receive_text()
+        assert subscriber.channels == [channel]
+
+    # Disconnect cleanup runs after the client closes; wait for it briefly
+    deadline = time.time() + 2
+    while subscriber.channels and time.time() < deadline:
+        time.sleep(0.01)
+    assert subscriber.channels == []
+
+
+class _AcceptingSocket(_StalledSocket):
+    async def accept(self) -> None:
+        return None
+
+
+class _CountingSubscriber:
+    def __init__(self) -> None:
+        self.active: List[str] = []
+        self.calls: List[Tuple[str, str]] = []
+
+    async def acquire(self, channel: str) -> None:
+        await asyncio.sleep(0)
+        self.calls.append(("acquire", channel))
+        self.active.append(channel)
+
+    async def release(self, channel: str) -> None:
+        await asyncio.sleep(0)
+        self.calls.append(("release", channel))
+        self.active.remove(channel)
+
+
+# Join/leave storms: per-room locks keep each room's subscription balanced
+def test_connection_manager_per_room_churn():
+    async def run() -> Tuple[ConnectionManager, _CountingSubscriber]:
+        sub = _CountingSubscriber()
+        mgr = ConnectionManager(sub)  # type: ignore[arg-type]
+
+        async def churn(room: int) -> None:
+            ws = _AcceptingSocket()
+            conn = await mgr.connect(room, ws)  # type: ignore[arg-type]
+            assert mgr.get_limiter(room, ws) is conn.limiter  # type: ignore[arg-type]
+            await asyncio.sleep(0)
+            await mgr.disconnect(room, ws)  # type: ignore[arg-type]
+
+        await asyncio.gather(*(churn(room) for room in (1, 2, 3) for _ in range(20)))
+        return mgr, sub
+
+    mgr, sub = asyncio.run(run())
+    assert mgr.rooms == {}
+    assert sub.active == []
+    for room in (1, 2, 3):
+        channel = f"chat:property:{room}"
+        acquires = sum(1 for op, ch in sub.calls if op == "acquire" and ch == channel)
+        releases = sum(1 for op, ch in sub.calls if op == "release" and ch == channel)
+        assert acquires == releases >= 1
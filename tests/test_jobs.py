@@ -0,0 +1,67 @@
+# Job coordination tests: singleton jobs run only on the leader and record per-run metrics.
+from __future__ import annotations
+
+import time
+
+from fastapi.testclient import TestClient
+
+from app.jobs import SingletonJob
+
+
+# The leader runs the job once per interval and records runs, failures and the last result
+def test_singleton_job_runs_on_leader_and_records_metrics():
+    calls = []
+
+    def work():
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return len(calls)
+
+    # Redis is disabled in tests and SQLite has no advisory locks, so this node is the leader
+    job = SingletonJob("test-job", work, interval_seconds=0.1)
+    assert job.step() is True
+    assert job.step() is False  # not due yet
+    job._next_run = 0.0
+    assert job.step() is True
+
+    stats = job.stats()
+    assert stats["is_leader"] is True
+    assert stats["leader_changes"] == 1
+    assert stats["runs"] == 2 and stats["failures"] == 1
+    assert stats["last_error"] == "boom"
+    assert stats["last_result"] == 1
+    assert stats["last_duration_seconds"] is not None
+
+
+# A follower never runs the job; on taking over leadership it runs immediately
+def test_singleton_job_follower_waits_then_takes_over(monkeypatch):
+    calls = []
+    job = SingletonJob("test-failover", lambda: calls.append(1), interval_seconds=60)
+    monkeypatch.setattr(job.lease, "acquire_or_renew", lambda: False)
+    assert job.step() is False
+    assert calls == []
+
+    monkeypatch.setattr(job.lease, "acquire_or_renew", lambda: True)
+    assert job.step() is True
+    assert calls == [1]
+
+
+# A run spanning several ticks keeps renewing the lease from a side thread
+def test_singleton_job_renews_lease_during_long_run(monkeypatch):
+    renewals = []
+    job = SingletonJob("test-long-run", lambda: time.sleep(0.35), interval_seconds=0.1, lease_ttl_seconds=1.0)
+    monkeypatch.setattr(job.lease, "acquire_or_renew", lambda: renewals.append(time.monotonic()) or True)
+    assert job.step() is True
+    # One renewal before the run, then at least two while func() was sleeping
+    assert len(renewals) >= 3
+    assert job.stats()["runs"] == 1
+
+
+# Health endpoint reports the expiry sweeper registered at startup
+def test_jobs_health_endpoint(client: TestClient):
+    r = client.get("/healthz/jobs")
+    assert r.status_code == 200, r.text
+    sweeper = r.json()["expiry-sweeper"]
+    assert sweeper["interval_seconds"] > 0
+    assert {"is_leader", "runs", "failures", "last_run_at"} <= set(sweeper)
@@ -0,0 +1,257 @@
+# Lock helper test suite: async acquisition, contention, release and fail-open behavior; range lock
+# arguments, timeout and mid-wait failures with stubbed clients, and the fair wait queue against a real
+# Redis server (skipped when none is reachable).
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+from typing import List
+from uuid import uuid4
+
+import pytest
+
+from app import locks
+from app.locks import _RangeAttempt, async_redis_range_lock, lock_stats
+from app.redis_ops import _SCRIPTS
+
+START = date(2031, 5, 1)
+
+
+def night(n: int) -> date:
+    return START + timedelta(days=n)
+
+
+class FakeRedis:
+    """Just enough of SET NX PX and the token-checked release script."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.data: dict = {}
+        self.fail = fail
+
+    def set(self, key, value, nx=False, px=None):
+        if self.fail:
+            raise ConnectionError("redis down")
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def evalsha(self, sha, numkeys, key, token):
+        if self.fail:
+            raise ConnectionError("redis down")
+        assert sha == _SCRIPTS["release_lock"][0]
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+# The async lock excludes a second holder and releases even when the block raises
+def test_async_try_lock_contention_and_release(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(locks, "get_redis", lambda: fake)
+
+    async def scenario() -> None:
+        with pytest.raises(ValueError):
+            async with locks.async_redis_try_lock("lock:k") as first:
+                assert first is True
+                async with locks.async_redis_try_lock("lock:k") as second:
+                    assert second is False
+                raise ValueError("boom")
+        assert fake.data == {}
+        async with locks.async_redis_try_lock("lock:k") as again:
+            assert again is True
+
+    asyncio.run(scenario())
+
+
+# Redis disabled or erroring: the async key lock fails open
+def test_async_try_lock_fails_open(monkeypatch):
+    async def acquire() -> bool:
+        async with locks.async_redis_try_lock("lock:k") as locked:
+            return locked
+
+    monkeypatch.setattr(locks, "get_redis", lambda: None)
+    assert asyncio.run(acquire()) is True
+    monkeypatch.setattr(locks, "get_redis", lambda: FakeRedis(fail=True))
+    assert asyncio.run(acquire()) is True
+
+
+class StubRedis:
+    """
+    redis.asyncio stand-in for the range lock: every acquire reports "blocked", BLPOP never gets a
+    wake-up, `fail` makes every script call raise like a dropped connection, and `fail_blpop`
+    drops the connection while waiting.
+    """
+    def __init__(self, fail: bool = False, fail_blpop: bool = False) -> None:
+        self.fail = fail
+        self.fail_blpop = fail_blpop
+        self.scripts: List[str] = []
+        self.timeouts: List[float] = []
+
+    @property
+    def blpops(self) -> int:
+        return len(self.timeouts)
+
+    async def evalsha(self, sha, numkeys, *keys_and_args):
+        name = next(n for n, (s, _) in _SCRIPTS.items() if s == sha)
+        self.scripts.append(name)
+        if self.fail:
+            raise ConnectionError("Connection reset by peer")
+        return 1 if name == "range_lock_acquire" else 0
+
+    async def blpop(self, keys, timeout=0):
+        self.timeouts.append(timeout)
+        if self.fail_blpop:
+            raise ConnectionError("Connection reset by peer")
+        await asyncio.sleep(timeout)
+        return None
+
+
+def use_client(monkeypatch, client) -> None:
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(locks, "get_async_redis", get_client)
+
+
+# Waiting attempts queue under a waiter id; the record outlives the wait by one lock TTL
+def test_acquire_args_with_wait():
+    attempt = _RangeAttempt(7, night(0), night(2), ttl_ms=5000, wait_ms=2000)
+    assert attempt.keys == ["lock:booking:{7}:q"] + locks.booking_range_keys(7, night(0), night(2))
+    token, ttl, waiter, prefix, record_ttl, enqueue = attempt.acquire_args()
+    assert (token, ttl, prefix, enqueue) == (attempt.token, 5000, "lock:booking:{7}:", "1")
+    assert waiter and attempt.wake_key == f"lock:booking:{{7}}:n:{waiter}"
+    assert 6900 <= record_ttl <= 7000
+
+
+# wait_ms=0 tries once: no waiter id, no enqueue, and a record TTL of just the lock TTL
+def test_acquire_args_without_wait():
+    attempt = _RangeAttempt(7, night(0), night(2), ttl_ms=5000, wait_ms=0)
+    _, _, waiter, _, record_ttl, enqueue = attempt.acquire_args()
+    assert (waiter, record_ttl, enqueue) == ("", 5000, "0")
+
+
+# Redis errors (or no client at all) fail open: the caller proceeds as if it held the lock
+def test_async_range_lock_fails_open(monkeypatch):
+    lock_stats.reset()
+
+    async def run():
+        async with async_redis_range_lock(7, night(0), night(2), wait_ms=500) as locked:
+            return locked
+
+    stub = StubRedis(fail=True)
+    use_client(monkeypatch, stub)
+    assert asyncio.run(run()) is True
+    assert stub.scripts == ["range_lock_acquire"]
+
+    use_client(monkeypatch, None)
+    assert asyncio.run(run()) is True
+    assert lock_stats.snapshot()["booking_range"]["fail_open"] == 2
+
+
+# A range still held at the deadline yields False after waiting, and the waiter leaves the queue
+def test_async_range_lock_times_out(monkeypatch):
+    lock_stats.reset()
+    stub = StubRedis()
+    use_client(monkeypatch, stub)
+
+    async def run():
+        async with async_redis_range_lock(7, night(0), night(2), wait_ms=250) as locked:
+            return locked
+
+    started = time.monotonic()
+    assert asyncio.run(run()) is False
+    assert time.monotonic() - started >= 0.25
+    assert stub.blpops >= 2  # waits in WAKE_SLICE_SECONDS slices
+    assert stub.scripts[-1] == "range_lock_leave"
+    assert "range_lock_release" not in stub.scripts
+    stats = lock_stats.snapshot()["booking_range"]
+    assert (stats["contended"], stats["waited"], stats["acquired"]) == (1, 1, 0)
+
+
+# A waiter near its deadline stops instead of sending BLPOP a timeout Redis would read as "block forever"
+def test_wake_timeout_stops_short_of_deadline():
+    attempt = _RangeAttempt(7, night(0), night(2), ttl_ms=5000, wait_ms=2000)
+    assert attempt.wake_timeout() == locks.WAKE_SLICE_SECONDS
+    attempt.deadline = time.monotonic() + 0.05
+    assert locks.MIN_WAKE_SECONDS <= attempt.wake_timeout() <= 0.05
+    attempt.deadline = time.monotonic() + 0.005
+    assert attempt.wake_timeout() == 0
+    assert _RangeAttempt(7, night(0), night(2), ttl_ms=5000, wait_ms=0).wake_timeout() == 0
+
+
+# A Redis error after queueing behind a holder answers "busy" instead of failing open,
+# and the attempt leaves the queue on the way out
+def test_async_range_lock_error_while_queued_is_contended(monkeypatch):
+    lock_stats.reset()
+    stub = StubRedis(fail_blpop=True)
+    use_client(monkeypatch, stub)
+
+    async def run():
+        async with async_redis_range_lock(7, night(0), night(2), wait_ms=500) as locked:
+            return locked
+
+    assert asyncio.run(run()) is False
+    assert stub.scripts == ["range_lock_acquire", "range_lock_leave", "range_lock_release"]
+    stats = lock_stats.snapshot()["booking_range"]
+    assert (stats["contended"], stats["fail_open"]) == (1, 0)
+
+
+@pytest.fixture()
+def redis_url() -> str:
+    redis = pytest.importorskip("redis")
+    url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    probe = redis.Redis.from_url(url, socket_connect_timeout=0.2)
+    try:
+        probe.ping()
+    except Exception:
+        pytest.skip("no Redis server reachable")
+    finally:
+        probe.close()
+    return url
+
+
+# With a real server: a newcomer cannot barge past an earlier overlapping waiter, while
+# non-overlapping ranges proceed; the waiter gets the range once the holder releases
+def test_range_lock_queue_is_fair(monkeypatch, redis_url):
+    import redis.asyncio as aioredis
+
+    property_id = int(uuid4().int % 1_000_000_000)
+
+    async def run():
+        client = aioredis.Redis.from_url(redis_url)
+        use_client(monkeypatch, client)
+        order: List[str] = []
+
+        async def waiter():
+            async with async_redis_range_lock(property_id, night(1), night(3), wait_ms=2000) as locked:
+                order.append("waiter")
+                return locked
+
+        try:
+            async with async_redis_range_lock(property_id, night(0), night(2)) as holder:
+                assert holder is True
+                task = asyncio.create_task(waiter())
+                await asyncio.sleep(0.1)  # the waiter is queued behind the holder for night 1
+                # Night 2 is free, but the earlier waiter wants it: no barging
+                async with async_redis_range_lock(property_id, night(2), night(4)) as newcomer:
+                    assert newcomer is False
+                # Nights nobody waits for are taken immediately
+                async with async_redis_range_lock(property_id, night(5), night(7)) as other:
+                    assert other is True
+                order.append("holder")
+            assert await asyncio.wait_for(task, 2.0) is True
+            assert order == ["holder", "waiter"]
+            # The queue is empty again; the newcomer's range is free
+            async with async_redis_range_lock(property_id, night(2), night(4)) as newcomer:
+                assert newcomer is True
+        finally:
+            keys = [k async for k in client.scan_iter(match=f"lock:booking:{{{property_id}}}:*")]
+            if keys:
+                await client.delete(*keys)
+            await client.aclose()
+
+    asyncio.run(run())
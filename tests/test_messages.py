@@ -138,3 +138,25 @@ def test_messages_limit_bounds_validation(client: TestClient):
     # limit too high -> 422
     r_high = client.get(f"/api/v1/messages?property_id={prop['id']}&limit=101", headers=auth_headers(tenant_token))
     assert r_high.status_code == 422, r_high.text
+
+
+# Property metadata is cached for authz checks; an ownership transfer evicts the cached owner
+def test_messages_authz_follows_property_ownership_changes(client: TestClient):
+    token_a, _ = signup(client, "hostC@example.com", "changeme123", "landlord")
+    token_b, user_b = signup(client, "hostD@example.com", "changeme123", "landlord")
+    prop = create_property(client, token_a, "Transfer Place", 9000)
+    url = f"/api/v1/messages?property_id={prop['id']}"
+
+    assert client.get(url, headers=auth_headers(token_a)).status_code == 200
+    assert client.get(url, headers=auth_headers(token_b)).status_code == 403
+
+    db = SessionLocal()
+    try:
+        row = db.get(models.Property, prop["id"])
+        row.owner_id = user_b["id"]
+        db.commit()
+    finally:
+        db.close()
+
+    assert client.get(url, headers=auth_headers(token_a)).status_code == 403
+    assert client.get(url, headers=auth_headers(token_b)).status_code == 200
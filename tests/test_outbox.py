@@ -0,0 +1,121 @@
+# Transactional outbox: every booking status/version change records an event in its own transaction,
+# and the relay drains events in order.
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from fastapi.testclient import TestClient
+
+from app import models, outbox, payments
+from app.db import SessionLocal
+from app.sweepers import sweep_expired_bookings
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_property(client: TestClient, token: str, requires_approval: bool = False) -> int:
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(token),
+        json={"title": "Outbox Place", "price_cents": 10000, "requires_approval": requires_approval},
+    )
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def book(client: TestClient, token: str, property_id: int, start_date: str, end_date: str) -> int:
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(token),
+        json={"property_id": property_id, "start_date": start_date, "end_date": end_date},
+    )
+    assert r.status_code == 201, r.text
+    return r.json()["booking"]["id"]
+
+
+def events_for(booking_id: int) -> List[Tuple[str, int]]:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.BookingEvent)
+            .filter(models.BookingEvent.booking_id == booking_id)
+            .order_by(models.BookingEvent.id)
+            .all()
+        )
+        return [(row.status, row.version) for row in rows]
+    finally:
+        db.close()
+
+
+# Request -> approve -> cancel records one event per transition with the committed version
+def test_route_transitions_record_events(client: TestClient):
+    landlord_token, _ = signup(client, "host@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "guest@example.com", "changeme123", "tenant")
+    property_id = create_property(client, landlord_token, requires_approval=True)
+
+    booking_id = book(client, tenant_token, property_id, "2031-06-01", "2031-06-04")
+    r = client.post(f"/api/v1/bookings/{booking_id}/approve", headers=auth_headers(landlord_token))
+    assert r.status_code == 200, r.text
+    r = client.delete(f"/api/v1/bookings/{booking_id}", headers=auth_headers(tenant_token))
+    assert r.status_code == 200, r.text
+
+    assert events_for(booking_id) == [("requested", 1), ("pending_payment", 2), ("cancelled", 3)]
+
+
+# Confirmation and the set-based expiry sweep record events; failed transitions record none
+def test_confirm_and_sweep_record_events(client: TestClient):
+    landlord_token, _ = signup(client, "host@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "guest@example.com", "changeme123", "tenant")
+    property_id = create_property(client, landlord_token)
+
+    paid = book(client, tenant_token, property_id, "2031-07-01", "2031-07-03")
+    stale = book(client, tenant_token, property_id, "2031-07-02", "2031-07-04")
+    db = SessionLocal()
+    try:
+        assert payments._confirm_pending(db, db.get(models.Booking, paid)) == "confirmed"
+        assert payments._confirm_pending(db, db.get(models.Booking, stale)) == "overlap"
+        # Push the remaining hold past its deadline and let the sweeper expire it
+        obj = db.get(models.Booking, stale)
+        obj.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+        db.commit()
+    finally:
+        db.close()
+    assert sweep_expired_bookings() == 1
+
+    assert events_for(paid) == [("pending_payment", 1), ("confirmed", 2)]
+    assert events_for(stale) == [("pending_payment", 1), ("cancelled_expired", 2)]
+
+
+# The relay drains all pending events in id order across batches
+def test_relay_marks_events_published_in_order(client: TestClient):
+    landlord_token, _ = signup(client, "host@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "guest@example.com", "changeme123", "tenant")
+    property_id = create_property(client, landlord_token)
+    for day in range(1, 6):
+        book(client, tenant_token, property_id, f"2031-08-{day:02d}", f"2031-08-{day + 1:02d}")
+
+    # The background relay may already have taken some; a direct pass must leave nothing pending
+    outbox.relay_once(batch_size=2)
+    db = SessionLocal()
+    try:
+        rows = db.query(models.BookingEvent).order_by(models.BookingEvent.id).all()
+        assert len(rows) == 5
+        assert all(row.published_at is not None for row in rows)
+        assert [row.booking_id for row in rows] == sorted(row.booking_id for row in rows)
+        assert outbox.purge_published(db, retention_seconds=0) == 5
+    finally:
+        db.close()
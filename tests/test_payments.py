@@ -0,0 +1,157 @@
+# Payment flows: offline gateway behavior for booking payments, the Stripe client's retry contract, and
+# webhook handling on the async session.
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from typing import List, Tuple
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import payments
+from app.payment_gateway import FakePaymentGateway, PaymentGateway, PaymentGatewayError, StripeGateway
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+# Convenience header for authenticated requests
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def stripe_gateway(responses: List[httpx.Response], seen: List[httpx.Request]) -> StripeGateway:
+    """StripeGateway whose pooled client is served by a scripted transport."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return responses.pop(0)
+
+    gw = StripeGateway("sk_test_123", base_url="https://stripe.test", max_retries=2)
+    gw._client = httpx.AsyncClient(base_url="https://stripe.test", transport=httpx.MockTransport(handler))
+    return gw
+
+
+# Booking creation and payment_info go through the offline gateway with a stable idempotency key
+def test_payment_info_uses_offline_gateway(client: TestClient):
+    landlord_token, _ = signup(client, "hostpay@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "guestpay@example.com", "changeme123", "tenant")
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(landlord_token),
+        json={"title": "Pay Place", "price_cents": 10000, "requires_approval": False},
+    )
+    assert r.status_code == 201, r.text
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": r.json()["id"], "start_date": "2031-10-01", "end_date": "2031-10-03"},
+    )
+    assert r.status_code == 201, r.text
+    booking_id = r.json()["booking"]["id"]
+    assert r.json()["next_action"]["client_secret"] == f"test_client_secret_{booking_id}"
+
+    r = client.get(f"/api/v1/bookings/{booking_id}/payment_info", headers=auth_headers(tenant_token))
+    assert r.status_code == 200, r.text
+    assert r.json()["client_secret"] == f"test_client_secret_pi_test_{booking_id}"
+
+    gw = payments.gateway()
+    assert isinstance(gw, FakePaymentGateway)
+    assert gw.calls == [("create", f"booking:{booking_id}:v1"), ("retrieve", f"pi_test_{booking_id}")]
+
+    r = client.post(f"/api/v1/bookings/{booking_id}/finalize_payment", headers=auth_headers(tenant_token))
+    assert r.status_code == 200, r.text
+    assert r.json() == {"status": "stripe_disabled"}
+
+
+# Retryable failures are retried with the same Idempotency-Key; the pooled client is reused
+def test_stripe_gateway_retries_with_idempotency_key():
+    seen: List[httpx.Request] = []
+    gw = stripe_gateway(
+        [
+            httpx.Response(500, json={"error": {"message": "try again"}}),
+            httpx.Response(200, json={"id": "pi_1", "status": "requires_payment_method", "client_secret": "cs_1"}),
+        ],
+        seen,
+    )
+
+    async def run():
+        try:
+            return await gw.create_intent(12000, "USD", booking_id=7, property_id=3, idempotency_key="booking:7:v1")
+        finally:
+            await gw.aclose()
+
+    intent = asyncio.run(run())
+    assert (intent.id, intent.client_secret) == ("pi_1", "cs_1")
+    assert len(seen) == 2
+    assert {req.headers["Idempotency-Key"] for req in seen} == {"booking:7:v1"}
+    assert b"metadata%5Bbooking_id%5D=7" in seen[0].content
+
+
+# Non-retryable responses fail immediately with the Stripe error message
+def test_stripe_gateway_surfaces_card_errors():
+    seen: List[httpx.Request] = []
+    gw = stripe_gateway([httpx.Response(402, json={"error": {"message": "Your card was declined."}})], seen)
+
+    async def run():
+        try:
+            await gw.retrieve_intent("pi_1")
+        finally:
+            await gw.aclose()
+
+    with pytest.raises(PaymentGatewayError, match="declined"):
+        asyncio.run(run())
+    assert len(seen) == 1
+
+
+# The gateway interface is abstract: an implementation missing an intent call fails at construction
+def test_payment_gateway_requires_intent_methods():
+    class Partial(PaymentGateway):
+        async def create_intent(self, amount_cents, currency, booking_id, property_id, idempotency_key):
+            raise AssertionError("not called")
+
+    with pytest.raises(TypeError):
+        PaymentGateway()
+    with pytest.raises(TypeError, match="retrieve_intent"):
+        Partial()
+
+
+# The webhook confirms a paid hold on the async session and is idempotent on redelivery
+def test_webhook_confirms_pending_booking(client: TestClient, monkeypatch):
+    landlord_token, _ = signup(client, "hosthook@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "guesthook@example.com", "changeme123", "tenant")
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(landlord_token),
+        json={"title": "Hook Place", "price_cents": 10000, "requires_approval": False},
+    )
+    assert r.status_code == 201, r.text
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": r.json()["id"], "start_date": "2031-11-01", "end_date": "2031-11-03"},
+    )
+    assert r.status_code == 201, r.text
+    booking_id = r.json()["booking"]["id"]
+
+    # Signature verification is the SDK's job; a stub hands back the parsed event
+    event = SimpleNamespace(type="payment_intent.succeeded", data={"object": {"id": f"pi_test_{booking_id}"}})
+    monkeypatch.setattr(payments, "stripe", SimpleNamespace(Webhook=SimpleNamespace(construct_event=lambda **kw: event)))
+    monkeypatch.setattr(payments, "STRIPE_SECRET_KEY", "sk_test_123")
+    monkeypatch.setattr(payments, "STRIPE_WEBHOOK_SECRET", "whsec_test")
+
+    for expected in ("confirmed", "already_confirmed"):
+        r = client.post("/payments/webhook", content=b"{}", headers={"Stripe-Signature": "t=1,v1=sig"})
+        assert r.status_code == 200, r.text
+        assert r.json() == {"status": expected}
+    r = client.get("/api/v1/bookings/me", headers=auth_headers(tenant_token))
+    assert [b["status"] for b in r.json()] == ["confirmed"]
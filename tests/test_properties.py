@@ -0,0 +1,152 @@
+# Property listing test suite: landlord scoping, filters, cursor pagination, ETag revalidation, and cache invalidation.
+from __future__ import annotations
+
+from typing import Tuple
+
+from fastapi.testclient import TestClient
+
+from app import models, property_cache
+from app.cache import MISSING
+from app.db import SessionLocal
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+# Convenience header for authenticated requests
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Helper: create a property owned by the authenticated landlord
+def create_property(client: TestClient, token: str, title: str, price_cents: int, requires_approval: bool = False) -> dict:
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(token),
+        json={"title": title, "price_cents": price_cents, "requires_approval": requires_approval},
+    )
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+# Listing: newest first, landlord scoping, and price/approval filters
+def test_list_properties_scoping_and_filters(client: TestClient):
+    token_a, _ = signup(client, "hostA-list@example.com", "changeme123", "landlord")
+    token_b, _ = signup(client, "hostB-list@example.com", "changeme123", "landlord")
+    p1 = create_property(client, token_a, "Cheap", 5000)
+    p2 = create_property(client, token_a, "Mid", 15000, requires_approval=True)
+    p3 = create_property(client, token_b, "Pricey", 40000)
+
+    r = client.get("/api/v1/properties")
+    assert [p["id"] for p in r.json()] == [p3["id"], p2["id"], p1["id"]]
+
+    r_own = client.get("/api/v1/properties", headers=auth_headers(token_a))
+    assert [p["id"] for p in r_own.json()] == [p2["id"], p1["id"]]
+
+    r_price = client.get("/api/v1/properties?min_price_cents=10000&max_price_cents=40000")
+    assert [p["id"] for p in r_price.json()] == [p3["id"], p2["id"]]
+
+    r_appr = client.get("/api/v1/properties?requires_approval=false")
+    assert [p["id"] for p in r_appr.json()] == [p3["id"], p1["id"]]
+
+
+# Pagination + caching: cursor pages, 304 on matching ETag, and invalidation on create
+def test_list_properties_cursor_etag_and_invalidation(client: TestClient):
+    token, _ = signup(client, "host-page@example.com", "changeme123", "landlord")
+    ids = [create_property(client, token, f"Place {i}", 1000 + i)["id"] for i in range(5)]
+
+    r1 = client.get("/api/v1/properties?limit=2")
+    assert [p["id"] for p in r1.json()] == ids[::-1][:2]
+    r2 = client.get(f"/api/v1/properties?limit=2&cursor={r1.headers['X-Next-Cursor']}")
+    r3 = client.get(f"/api/v1/properties?limit=2&cursor={r2.headers['X-Next-Cursor']}")
+    assert [p["id"] for p in r2.json() + r3.json()] == ids[::-1][2:]
+    assert "X-Next-Cursor" not in r3.headers
+
+    etag = r1.headers["ETag"]
+    r_304 = client.get("/api/v1/properties?limit=2", headers={"If-None-Match": etag})
+    assert r_304.status_code == 304
+    assert r_304.content == b""
+
+    # A new listing invalidates the cached first page, so the old ETag no longer matches
+    new = create_property(client, token, "Newest", 999)
+    r_new = client.get("/api/v1/properties?limit=2", headers={"If-None-Match": etag})
+    assert r_new.status_code == 200
+    assert r_new.json()[0]["id"] == new["id"]
+    assert r_new.headers["ETag"] != etag
+
+    assert client.get("/api/v1/properties?cursor=bogus").status_code == 400
+
+
+# Without limit or cursor every listing is returned; a cursor alone pages at DEFAULT_PAGE_SIZE
+def test_list_properties_unpaginated_by_default(client: TestClient, monkeypatch):
+    from app.routes import properties
+
+    monkeypatch.setattr(properties, "DEFAULT_PAGE_SIZE", 2)
+    token, _ = signup(client, "host-all@example.com", "changeme123", "landlord")
+    ids = [create_property(client, token, f"Flat {i}", 2000 + i)["id"] for i in range(5)]
+
+    r_all = client.get("/api/v1/properties")
+    assert [p["id"] for p in r_all.json()] == ids[::-1]
+    assert "X-Next-Cursor" not in r_all.headers
+
+    r_page = client.get("/api/v1/properties?limit=3")
+    r_rest = client.get(f"/api/v1/properties?cursor={r_page.headers['X-Next-Cursor']}")
+    assert [p["id"] for p in r_rest.json()] == ids[::-1][3:5]
+
+
+# Property updates made outside create_property drop cached pages once committed, not at flush
+def test_list_properties_invalidated_on_committed_update(client: TestClient):
+    token, _ = signup(client, "host-update@example.com", "changeme123", "landlord")
+    prop = create_property(client, token, "Loft", 7000)
+    assert client.get("/api/v1/properties").json()[0]["price_cents"] == 7000
+
+    with SessionLocal() as db:
+        db.get(models.Property, prop["id"]).price_cents = 9000
+        db.flush()
+        assert client.get("/api/v1/properties").json()[0]["price_cents"] == 7000
+        db.commit()
+    assert client.get("/api/v1/properties").json()[0]["price_cents"] == 9000
+
+    with SessionLocal() as db:
+        db.delete(db.get(models.Property, prop["id"]))
+        db.commit()
+    assert client.get("/api/v1/properties").json() == []
+
+
+# Metadata eviction waits for the commit, and a refill that started before it cannot re-cache the old row
+def test_property_meta_invalidates_after_commit(client: TestClient):
+    landlord_token, _ = signup(client, "metahost@example.com", "changeme123", "landlord")
+    tenant_token, _ = signup(client, "metaguest@example.com", "changeme123", "tenant")
+    prop = create_property(client, landlord_token, "Meta Place", 10000)
+    # Booking creation resolves (and caches) the property metadata
+    r = client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(tenant_token),
+        json={"property_id": prop["id"], "start_date": "2031-11-01", "end_date": "2031-11-02"},
+    )
+    assert r.status_code == 201, r.text
+    cached = property_cache._local.get(prop["id"])
+    assert cached is not MISSING and cached.price_cents == 10000
+
+    db = SessionLocal()
+    try:
+        row = db.get(models.Property, prop["id"])
+        row.price_cents = 20000
+        db.flush()
+        # Flushed but uncommitted: other sessions still read the old price, so the entry stays
+        assert property_cache._local.get(prop["id"]) is cached
+        generation = property_cache._local.generation
+        db.commit()
+    finally:
+        db.close()
+
+    assert property_cache._local.get(prop["id"]) is MISSING
+    assert not property_cache._local.set(prop["id"], cached, generation=generation)
@@ -0,0 +1,183 @@
+# Rate limiter configuration tests: engine selection per scope and caller identity for keys.
+from __future__ import annotations
+
+from typing import Tuple
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app import rate_limit as rl
+from app.redis_ops import _SCRIPTS
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+def make_request(authorization: str | None = None, ip: str = "203.0.113.7") -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "headers": headers, "client": (ip, 5555)})
+
+
+class GcraRedis:
+    """
+    Scripted Redis for the GCRA engine: evalsha mirrors GCRA_LUA step by step against an in-memory
+    store and a clock the test advances (`now_ms`, standing in for Redis TIME).
+    """
+    def __init__(self) -> None:
+        self.now_ms = 1_000_000
+        self.tat: dict = {}
+
+    def evalsha(self, sha, numkeys, key, interval, burst):
+        assert sha == _SCRIPTS["gcra"][0]
+        now = self.now_ms
+        tat = max(self.tat.get(key, now), now)
+        new_tat = tat + int(interval)
+        allow_at = new_tat - int(burst)
+        if allow_at > now:
+            return [0, allow_at - now]
+        self.tat[key] = new_tat
+        return [1, 0]
+
+
+# Engines and key identities resolve per scope, with global defaults and safe fallbacks
+def test_engine_and_key_by_per_scope(monkeypatch):
+    assert rl._engine_for_scope("write") == "gcra"
+    monkeypatch.setenv("RATE_LIMIT_ENGINE", "fixed")
+    monkeypatch.setenv("RATE_LIMIT_LOGIN_ENGINE", "gcra")
+    monkeypatch.setenv("RATE_LIMIT_SIGNUP_ENGINE", "bogus")
+    assert rl._engine_for_scope("write") == "fixed"
+    assert rl._engine_for_scope("login") == "gcra"
+    assert rl._engine_for_scope("signup") == "gcra"
+
+    assert rl._key_by_for_scope("write") == "user"
+    assert rl._key_by_for_scope("login") == "ip"
+    monkeypatch.setenv("RATE_LIMIT_WRITE_KEY_BY", "ip")
+    assert rl._key_by_for_scope("write") == "ip"
+
+    assert rl._burst_for_scope("write", 30) == 6
+    assert rl._burst_for_scope("signup", 3) == 1
+    monkeypatch.setenv("RATE_LIMIT_BURST", "4")
+    monkeypatch.setenv("RATE_LIMIT_LOGIN_BURST", "2")
+    assert rl._burst_for_scope("write", 30) == 4
+    assert rl._burst_for_scope("login", 10) == 2
+
+
+# User-keyed scopes use the token subject; anonymous or invalid tokens fall back to the client IP
+def test_identity_prefers_user_id_with_ip_fallback(client: TestClient):
+    token, user = signup(client, "limited@example.com", "changeme123", "tenant")
+
+    assert rl._identity(make_request(f"Bearer {token}"), "user") == ("user", str(user["id"]))
+    assert rl._identity(make_request(f"Bearer {token}"), "ip") == ("ip", "203.0.113.7")
+    assert rl._identity(make_request("Bearer not-a-jwt"), "user") == ("ip", "203.0.113.7")
+    assert rl._identity(make_request(), "user") == ("ip", "203.0.113.7")
+
+
+# GCRA: `burst` requests pass back to back, the next waits one emission interval, and rejections are free
+def test_gcra_admits_burst_then_rejects_with_retry_after():
+    r = GcraRedis()
+    key = "rl:v2:user:1:write"
+    # 3 per 60s -> one request every 20s, burst of 2
+    assert [rl._gcra(r, key, 3, 60, burst=2) for _ in range(2)] == [None, None]
+    assert rl._gcra(r, key, 3, 60, burst=2) == 20
+    # A rejected request does not consume budget; 5s later the wait is 15s
+    r.now_ms += 5_000
+    assert rl._gcra(r, key, 3, 60, burst=2) == 15
+    # One interval after the burst, exactly one more request fits
+    r.now_ms += 15_000
+    assert rl._gcra(r, key, 3, 60, burst=2) is None
+    assert rl._gcra(r, key, 3, 60, burst=2) == 20
+    # Other keys keep their own budget
+    assert rl._gcra(r, "rl:v2:user:2:write", 3, 60, burst=2) is None
+
+
+# GCRA under constant pressure: no rolling window admits more than limit + burst - 1
+def test_gcra_rolling_window_bound():
+    r = GcraRedis()
+    admitted = []
+    for second in range(300):
+        r.now_ms = 1_000_000 + second * 1000
+        if rl._gcra(r, "rl:v2:ip:x:write", 10, 60, burst=3) is None:
+            admitted.append(second)
+    busiest = max(sum(1 for t in admitted if start <= t < start + 60) for start in range(240))
+    assert busiest == 10 + 3 - 1
+
+
+# The dependency turns a GCRA rejection into a 429 carrying retry_after, keyed by the caller identity
+def test_gcra_dependency_rejects_with_429(monkeypatch):
+    r = GcraRedis()
+    monkeypatch.setenv("REDIS_ENABLED", "true")
+    monkeypatch.setenv("RATE_LIMIT_WRITE_PER_WINDOW", "2")
+    monkeypatch.setenv("RATE_LIMIT_WRITE_BURST", "2")
+    monkeypatch.setenv("RATE_LIMIT_WINDOW_SECONDS", "10")
+    monkeypatch.setattr(rl, "get_redis", lambda: r)
+    check = rl.rate_limit("write")
+
+    check(make_request())
+    check(make_request())
+    with pytest.raises(HTTPException) as exc:
+        check(make_request())
+    assert exc.value.status_code == 429
+    assert exc.value.detail["retry_after"] == 5
+    assert exc.value.detail["ip"] == "203.0.113.7"
+    assert set(r.tat) == {"rl:v2:ip:203.0.113.7:write"}
+
+
+# Hybrid engine: local buckets admit up to the limit, then reject with a retry hint
+def test_hybrid_local_bucket_enforces_limit():
+    limiter = rl.HybridLimiter(drift=0.0)
+    key = "rl:v3:user:1:write"
+    assert all(limiter.check(key, 3, 60) is None for _ in range(3))
+    retry = limiter.check(key, 3, 60)
+    assert retry is not None and retry >= 1
+    # Other keys keep their own budget
+    assert limiter.check("rl:v3:user:2:write", 3, 60) is None
+
+
+# Reconciliation: the global count clamps the local bucket and blocks the key once the allowance is spent
+def test_hybrid_reconciliation_clamps_and_blocks():
+    limiter = rl.HybridLimiter(drift=0.5)
+    key = "rl:v3:ip:203.0.113.7:write"
+    assert limiter.check(key, 10, 60) is None
+
+    batch = limiter._drain()
+    assert [(k, count) for k, _, count, _ in batch] == [(key, 1)]
+    idx = batch[0][1]
+
+    # Other workers used most of the window: 15 allowed (10 * 1.5), 13 counted -> 2 local tokens left
+    limiter._apply(key, idx, 13)
+    assert limiter.check(key, 10, 60) is None
+    assert limiter.check(key, 10, 60) is None
+    assert limiter.check(key, 10, 60) is not None
+
+    # Allowance exhausted cluster-wide: blocked until the window ends
+    limiter._apply(key, idx, 15)
+    assert limiter.check(key, 10, 60) is not None
+
+
+# With Redis disabled the hybrid engine still enforces its local buckets (gcra/fixed fail open)
+def test_hybrid_dependency_enforces_without_redis(monkeypatch):
+    monkeypatch.setenv("REDIS_ENABLED", "false")
+    monkeypatch.setenv("RATE_LIMIT_WRITE_ENGINE", "hybrid")
+    monkeypatch.setenv("RATE_LIMIT_WRITE_PER_WINDOW", "2")
+    monkeypatch.setattr(rl, "hybrid_limiter", rl.HybridLimiter(drift=0.0))
+    check = rl.rate_limit("write")
+
+    check(make_request())
+    check(make_request())
+    with pytest.raises(HTTPException) as exc:
+        check(make_request())
+    assert exc.value.status_code == 429
+
+    monkeypatch.setenv("RATE_LIMIT_WRITE_ENGINE", "gcra")
+    open_check = rl.rate_limit("write")
+    assert all(open_check(make_request()) is None for _ in range(5))
@@ -0,0 +1,50 @@
+# Redis client tests: circuit-breaker transitions and the pool/breaker health endpoint.
+from __future__ import annotations
+
+import time
+
+from fastapi.testclient import TestClient
+
+from app.redis_client import CircuitBreaker
+
+
+# Reported command errors open the circuit at the threshold; a failed probe backs off further
+def test_breaker_opens_at_threshold_and_backs_off():
+    breaker = CircuitBreaker(threshold=2, window=10.0, min_backoff=0.05, max_backoff=1.0)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    # Exactly one caller probes after the backoff expires
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.backoff == 0.1
+    assert breaker.stats()["trips"] == 1
+
+
+# A successful probe closes the circuit and resets the backoff
+def test_breaker_recovers_after_successful_probe():
+    breaker = CircuitBreaker(threshold=3, min_backoff=0.01, max_backoff=1.0)
+    breaker.record_failure(immediate=True)
+    assert breaker.state == "open"
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    assert breaker.stats() == {"state": "closed", "failures": 0, "trips": 1, "backoff_seconds": 0.01}
+
+
+# Health endpoint reports pool usage and breaker state for both clients
+def test_redis_health_endpoint(client: TestClient):
+    r = client.get("/healthz/redis")
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert data["enabled"] is False
+    assert data["sync"]["breaker"]["state"] == "closed"
+    assert set(data["asyncio"]["pool"]) == {"created", "in_use", "available", "max"}
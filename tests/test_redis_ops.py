@@ -0,0 +1,202 @@
+# Redis command layer tests: EVALSHA with NOSCRIPT recovery and pipelined batches, against an in-memory fake client.
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pytest
+
+from app import expiry
+from app.redis_ops import AsyncRedisBatch, RedisBatch, _SCRIPTS, async_evalsha, evalsha, register_script
+
+ECHO_SHA = register_script("test_echo", "return ARGV[1]")
+
+
+class NoScriptError(Exception):
+    """Same class name as redis.exceptions.NoScriptError, which _is_noscript() recognizes."""
+
+
+class FakeRedis:
+    """
+    Just enough of a redis-py client for redis_ops: scripts are "executed" by `scripts[name]`,
+    other commands by `commands[name]`, and every call is logged in `calls`.
+
+    `flushed` lists SHAs the server has lost (e.g. after a restart) until script_load() is called.
+    """
+    def __init__(self, flushed: Optional[Set[str]] = None) -> None:
+        self.flushed: Set[str] = set(flushed or ())
+        self.scripts: Dict[str, Any] = {"test_echo": lambda keys, args: args[0]}
+        self.commands: Dict[str, Any] = {}
+        self.calls: List[Tuple[str, Any]] = []
+        self.pipelines = 0
+
+    def _evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> Any:
+        self.calls.append(("evalsha", sha))
+        if sha in self.flushed:
+            raise NoScriptError("NOSCRIPT No matching script. Please use EVAL.")
+        name = next(n for n, (s, _) in _SCRIPTS.items() if s == sha)
+        return self.scripts[name](list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+
+    def _script_load(self, lua: str) -> str:
+        sha = next(s for s, src in _SCRIPTS.values() if src == lua)
+        self.calls.append(("script_load", sha))
+        self.flushed.discard(sha)
+        return sha
+
+    def _command(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        self.calls.append((name, args))
+        return self.commands[name](*args, **kwargs)
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        return self._evalsha(sha, numkeys, *keys_and_args)
+
+    def script_load(self, lua):
+        return self._script_load(lua)
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        self.pipelines += 1
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, r: FakeRedis) -> None:
+        self._r = r
+        self._queued: List[Any] = []
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        self._queued.append(lambda: self._r._evalsha(sha, numkeys, *keys_and_args))
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: self._queued.append(lambda: self._r._command(name, *args, **kwargs))
+
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        results: List[Any] = []
+        for call in self._queued:
+            try:
+                results.append(call())
+            except Exception as exc:
+                if raise_on_error:
+                    raise
+                results.append(exc)
+        return results
+
+
+class AsyncFakeRedis(FakeRedis):
+    """redis.asyncio flavor: direct calls and pipeline execution are awaited."""
+
+    async def evalsha(self, sha, numkeys, *keys_and_args):
+        return self._evalsha(sha, numkeys, *keys_and_args)
+
+    async def script_load(self, lua):
+        return self._script_load(lua)
+
+    def pipeline(self, transaction: bool = True) -> "AsyncFakePipeline":
+        self.pipelines += 1
+        return AsyncFakePipeline(self)
+
+
+class AsyncFakePipeline(FakePipeline):
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:  # type: ignore[override]
+        return FakePipeline.execute(self, raise_on_error)
+
+
+# A script the server does not know is loaded once and re-run; other errors propagate untouched
+def test_evalsha_loads_script_on_noscript():
+    r = FakeRedis(flushed={ECHO_SHA})
+    assert evalsha(r, "test_echo", ["k"], ["hello"]) == "hello"
+    assert r.calls == [("evalsha", ECHO_SHA), ("script_load", ECHO_SHA), ("evalsha", ECHO_SHA)]
+
+    r.calls.clear()
+    assert evalsha(r, "test_echo", ["k"], ["again"]) == "again"
+    assert r.calls == [("evalsha", ECHO_SHA)]
+
+    def wrongtype(keys, args):
+        raise RuntimeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+    r.scripts["test_echo"] = wrongtype
+    with pytest.raises(RuntimeError, match="WRONGTYPE"):
+        evalsha(r, "test_echo", ["k"], ["x"])
+    assert ("script_load", ECHO_SHA) not in r.calls
+
+
+# asyncio variant follows the same load-and-retry contract
+def test_async_evalsha_loads_script_on_noscript():
+    r = AsyncFakeRedis(flushed={ECHO_SHA})
+    assert asyncio.run(async_evalsha(r, "test_echo", ["k"], ["hi"])) == "hi"
+    assert [c[0] for c in r.calls] == ["evalsha", "script_load", "evalsha"]
+
+
+# After NOSCRIPT, only the script calls are re-sent; plain commands run once and keep their reply slots
+def test_batch_resends_only_script_calls_on_noscript():
+    r = FakeRedis(flushed={ECHO_SHA})
+    counter = {"n": 0}
+
+    def incr(key):
+        counter["n"] += 1
+        return counter["n"]
+
+    r.commands["incr"] = incr
+    batch = RedisBatch(r)
+    i_first = batch.script("test_echo", ["k"], ["a"])
+    i_incr = batch.command("incr", "hits")
+    i_second = batch.script("test_echo", ["k"], ["b"])
+    assert len(batch) == 3
+
+    results = batch.execute()
+    assert (results[i_first], results[i_incr], results[i_second]) == ("a", 1, "b")
+    assert counter["n"] == 1
+    # Loaded once even though two queued calls needed it; one retry pipeline for both
+    assert [c for c in r.calls if c[0] == "script_load"] == [("script_load", ECHO_SHA)]
+    assert r.pipelines == 2
+
+
+# A non-NOSCRIPT error is raised after the whole batch ran, so earlier and later commands still executed
+def test_batch_raises_first_error_after_execution():
+    r = FakeRedis()
+    seen = []
+    r.commands["publish"] = lambda channel, data: seen.append(channel) or 1
+
+    def boom(*args):
+        raise ValueError("ERR value is not an integer")
+
+    r.commands["incr"] = boom
+    batch = RedisBatch(r)
+    batch.publish("a", b"1")
+    batch.command("incr", "k")
+    batch.publish("b", b"2")
+    with pytest.raises(ValueError, match="not an integer"):
+        batch.execute()
+    assert seen == ["a", "b"]
+    assert RedisBatch(r).execute() == []
+
+
+# asyncio batch: same NOSCRIPT recovery with awaited pipelines
+def test_async_batch_resends_only_script_calls_on_noscript():
+    r = AsyncFakeRedis(flushed={ECHO_SHA})
+    r.commands["get"] = lambda key: "v"
+
+    async def run():
+        batch = AsyncRedisBatch(r)
+        batch.command("get", "k")
+        batch.script("test_echo", ["k"], ["x"])
+        return await batch.execute()
+
+    assert asyncio.run(run()) == ["v", "x"]
+    assert [c[0] for c in r.calls].count("get") == 1
+
+
+# Hold expiry claims due ids and reads the next deadline in one batch, recovering from NOSCRIPT
+def test_hold_expiry_claim_batches_script_and_peek(monkeypatch):
+    r = AsyncFakeRedis(flushed={_SCRIPTS["expiry_claim_due"][0]})
+    r.scripts["expiry_claim_due"] = lambda keys, args: ["7", "9"]
+    r.commands["zrange"] = lambda key, start, end, withscores=False: [(b"11", 5000.0)]
+
+    async def fake_client():
+        return r
+
+    monkeypatch.setattr(expiry, "get_async_redis", fake_client)
+    scheduler = expiry.HoldExpiryScheduler(key="expiry:test")
+    due, next_ms = asyncio.run(scheduler._claim_due(now_ms=1000))
+    assert (due, next_ms) == ([7, 9], 5000)
+    assert r.pipelines == 2  # the batch, plus one retry after NOSCRIPT
+    assert [c[0] for c in r.calls].count("zrange") == 1
@@ -0,0 +1,191 @@
+# Booking concurrency engines: the per-night reservation table must behave like the lock path,
+# including under concurrent confirmations.
+from __future__ import annotations
+
+import threading
+from datetime import timedelta
+from typing import Dict, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models, payments
+from app.db import SessionLocal
+from app.payment_gateway import FakePaymentGateway, set_gateway
+
+
+# Helper: create a user and return (access_token, user JSON)
+def signup(client: TestClient, email: str, password: str, role: str | None = None) -> Tuple[str, dict]:
+    payload = {"email": email, "password": password}
+    if role:
+        payload["role"] = role
+    r = client.post("/auth/signup", json=payload)
+    assert r.status_code == 201, r.text
+    data = r.json()
+    return data["access_token"], data["user"]
+
+
+def auth_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def setup_listing(client: TestClient) -> Tuple[str, int]:
+    landlord_token, _ = signup(client, "host@example.com", "changeme123", "landlord")
+    r = client.post(
+        "/api/v1/properties",
+        headers=auth_headers(landlord_token),
+        json={"title": "Contended Place", "price_cents": 10000, "requires_approval": False},
+    )
+    assert r.status_code == 201, r.text
+    tenant_token, _ = signup(client, "guest@example.com", "changeme123", "tenant")
+    return tenant_token, r.json()["id"]
+
+
+def book(client: TestClient, token: str, property_id: int, start_date: str, end_date: str):
+    return client.post(
+        "/api/v1/bookings",
+        headers=auth_headers(token),
+        json={"property_id": property_id, "start_date": start_date, "end_date": end_date},
+    )
+
+
+def confirm(booking_id: int) -> str:
+    db = SessionLocal()
+    try:
+        return payments._confirm_pending(db, db.get(models.Booking, booking_id))
+    finally:
+        db.close()
+
+
+def claimed_nights() -> Dict[int, int]:
+    db = SessionLocal()
+    try:
+        counts: Dict[int, int] = {}
+        for row in db.query(models.BookingNight).all():
+            counts[row.booking_id] = counts.get(row.booking_id, 0) + 1
+        return counts
+    finally:
+        db.close()
+
+
+# Same request sequence, same outcomes: holds may overlap, confirmed nights block, cancellation frees them
+@pytest.mark.parametrize("engine", ["lock", "nights"])
+def test_engines_agree_on_booking_outcomes(client: TestClient, monkeypatch, engine: str):
+    monkeypatch.setenv("BOOKING_CONCURRENCY_ENGINE", engine)
+    token, property_id = setup_listing(client)
+
+    r1 = book(client, token, property_id, "2031-05-10", "2031-05-13")
+    r2 = book(client, token, property_id, "2031-05-12", "2031-05-14")
+    assert r1.status_code == 201 and r2.status_code == 201, (r1.text, r2.text)
+    b1, b2 = r1.json()["booking"]["id"], r2.json()["booking"]["id"]
+
+    assert confirm(b1) == "confirmed"
+    assert claimed_nights() == {b1: 3}
+    assert book(client, token, property_id, "2031-05-12", "2031-05-13").status_code == 409
+    # The overlapping hold can no longer be confirmed
+    assert confirm(b2) == "overlap"
+
+    r = client.delete(f"/api/v1/bookings/{b1}", headers=auth_headers(token))
+    assert r.status_code == 200, r.text
+    assert claimed_nights() == {}
+    assert confirm(b2) == "confirmed"
+    assert claimed_nights() == {b2: 2}
+
+
+# Stress on the confirmation step alone (the nights claim arbitrates for both engines): many overlapping
+# holds confirmed at once; exactly one wins and owns every claimed night
+def test_concurrent_confirmations_admit_one_winner(client: TestClient):
+    token, property_id = setup_listing(client)
+
+    ids = []
+    for i in range(8):
+        r = book(client, token, property_id, "2031-06-10", f"2031-06-{12 + i}")
+        assert r.status_code == 201, r.text
+        ids.append(r.json()["booking"]["id"])
+    # One hold elsewhere on the calendar must confirm regardless
+    r = book(client, token, property_id, "2031-07-01", "2031-07-03")
+    assert r.status_code == 201, r.text
+    independent = r.json()["booking"]["id"]
+    ids.append(independent)
+
+    barrier = threading.Barrier(len(ids))
+    outcomes: Dict[int, str] = {}
+
+    def worker(booking_id: int) -> None:
+        barrier.wait()
+        outcomes[booking_id] = confirm(booking_id)
+
+    threads = [threading.Thread(target=worker, args=(bid,)) for bid in ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outcomes[independent] == "confirmed"
+    contended = [outcomes[bid] for bid in ids if bid != independent]
+    assert contended.count("confirmed") == 1
+    assert set(contended) == {"confirmed", "overlap"}
+
+    winner = next(bid for bid in ids if bid != independent and outcomes[bid] == "confirmed")
+    nights = claimed_nights()
+    assert set(nights) == {winner, independent}
+    db = SessionLocal()
+    try:
+        confirmed = db.query(models.Booking).filter(models.Booking.status == "confirmed").all()
+        assert {b.id for b in confirmed} == {winner, independent}
+        won = db.get(models.Booking, winner)
+        assert nights[winner] == (won.end_date - won.start_date).days
+    finally:
+        db.close()
+
+
+# Stress over HTTP: concurrent POST /api/v1/bookings, each followed by finalize_payment, under each engine.
+# Exactly one of the overlapping requests ends confirmed, and booking_nights matches the confirmed set.
+@pytest.mark.parametrize("engine", ["lock", "nights"])
+def test_concurrent_booking_requests_keep_nights_consistent(client: TestClient, monkeypatch, engine: str):
+    monkeypatch.setenv("BOOKING_CONCURRENCY_ENGINE", engine)
+    token, property_id = setup_listing(client)
+    # Offline gateway whose intents have all succeeded, so finalize_payment confirms
+    fake = FakePaymentGateway()
+    set_gateway(fake)
+    monkeypatch.setattr(payments, "stripe_enabled", lambda: True)
+
+    ranges = [("2031-08-10", f"2031-08-{12 + i}") for i in range(8)] + [("2031-09-01", "2031-09-04")]
+    barrier = threading.Barrier(len(ranges))
+    outcomes: Dict[int, Tuple[int, int]] = {}
+
+    def worker(i: int, start_date: str, end_date: str) -> None:
+        barrier.wait()
+        r = book(client, token, property_id, start_date, end_date)
+        if r.status_code != 201:
+            outcomes[i] = (r.status_code, 0)
+            return
+        booking_id = r.json()["booking"]["id"]
+        fake.statuses[f"pi_test_{booking_id}"] = "succeeded"
+        r = client.post(f"/api/v1/bookings/{booking_id}/finalize_payment", headers=auth_headers(token))
+        outcomes[i] = (r.status_code, booking_id)
+
+    threads = [threading.Thread(target=worker, args=(i, *rng)) for i, rng in enumerate(ranges)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Losers see 409 at creation (a winner already confirmed) or at finalize (overlap)
+    assert {code for code, _ in outcomes.values()} <= {200, 409}
+    contended = [outcomes[i] for i in range(8)]
+    assert [code for code, _ in contended].count(200) == 1
+    assert outcomes[8][0] == 200
+    winner = next(bid for code, bid in contended if code == 200)
+
+    db = SessionLocal()
+    try:
+        confirmed = db.query(models.Booking).filter(models.Booking.status == "confirmed").all()
+        assert {b.id for b in confirmed} == {winner, outcomes[8][1]}
+        expected = {
+            (b.id, b.start_date + timedelta(days=n)) for b in confirmed for n in range((b.end_date - b.start_date).days)
+        }
+        claimed = {(row.booking_id, row.night) for row in db.query(models.BookingNight).all()}
+        assert claimed == expected
+    finally:
+        db.close()